@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions to aggregate the hourly (stations x hours) arrays of
+Extract_EPA_Parameters to coarser time resolutions:
+    Aggregate_EPA_Periods, Rolling_EPA_Mean & Aggregate_EPA_Data
+    Wind_EPA_Components, Wind_EPA_Resultant & Aggregate_EPA_Wind
+
+Aggregate_EPA_Periods computes the statistic ('mean', 'max', 'min', 'sum' or
+'count') of every station in every period: 'day', 'month', 'year' (GMT, as
+the hourly grid) or a custom window of N hours from the start of the grid. The
+periods are contiguous blocks of the grid, so each statistic is one reduction
+of all stations at once (np.add.reduceat / np.maximum.reduceat over the
+period starts). The minimum coverage rule sets the period to the missing data
+code if it has less than min_coverage (e.g. 0.75 = 18 of 24 hours) of the
+hours with data.
+
+Rolling_EPA_Mean computes the N-hour rolling mean (labeled by the first hour
+of the window, as the EPA 8-hour averages) from the cumulative sums, valid if
+at least min_count hours have data (6 of 8). The statistic 'max8h' is the
+daily (or other period) maximum of the 8-hour rolling means (e.g. MDA8 of
+ozone), with the coverage rule applied to the 8-hour means.
+
+The wind direction is an angle, its mean is computed from the vector (u, v)
+components (Wind_EPA_Components): Aggregate_EPA_Wind gives the mean u and v
+and the resultant speed and direction of the mean vector of every period
+(Wind_EPA_Resultant), for all stations with whole-array operations.
+
+The stations are processed in blocks (block rows at a time), so the temporary
+arrays are small also for e.g. 500 stations x 20 years.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import numpy as np
+from   Sort_EPA_Functions import EPA_MISSING
+
+
+#--statistics of Aggregate_EPA_Periods (and Aggregate_EPA_Data)
+EPA_STATS = ('mean', 'max', 'min', 'sum', 'count', 'max8h')
+
+
+def EPA_Valid(data, fill_value=EPA_MISSING):
+    #--True for the hours with data (not fill_value and not nan); fill_value
+    #  is compared in the dtype of data (float32(-999.9) != -999.9 in float64),
+    #  so data must not be converted before
+    valid = ~np.isnan(data)
+    if not np.isnan(fill_value):
+        valid &= data != np.asarray(fill_value, dtype=data.dtype)
+    return valid
+
+
+def EPA_Period_Starts(dates, period='day'):
+    #--first positions of the periods in the numeric dates (hourly grid) and
+    #  their number of hours; period is 'day', 'month', 'year' or N (hours)
+    dates = np.ravel(dates)
+    hours = np.round((dates - 1)*24).astype(np.int64)       # hours from 0000-01-01
+    if period == 'day':
+        key = hours // 24
+    elif period in ('month', 'year'):
+        key = (np.datetime64('0000-01-01T00', 'h') + hours.astype('timedelta64[h]')).astype(
+               'datetime64[M]' if period == 'month' else 'datetime64[Y]').astype(np.int64)
+    elif isinstance(period, (int, np.integer)) and period > 0:
+        key = (hours - hours[0]) // period
+    else:
+        raise ValueError(f"Unknown period '{period}', use 'day', 'month', 'year' or hours (int)")
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.empty(0, dtype=int)
+    return starts, np.diff(np.r_[starts, len(key)])
+
+
+def Rolling_EPA_Mean(data, window=8, min_count=6, fill_value=EPA_MISSING, block=16):
+    #--rolling mean of 'window' hours of every station, labeled by the first
+    #  hour of the window; fill_value if less than min_count hours have data
+    #  (the windows at the end of the grid have fewer hours)
+    out = np.full(data.shape, fill_value, dtype=data.dtype)
+    L   = data.shape[1]
+    for b in range(0, data.shape[0], block):
+        x     = np.asarray(data[b:b + block])
+        valid = EPA_Valid(x, fill_value)
+        x     = x.astype(np.float64)
+        #--cumulative sums with the last value repeated after the end of the
+        #  grid, the window of hour t is [t, t + window)
+        csum  = np.zeros((len(x), L + window))
+        ccnt  = np.zeros((len(x), L + window), dtype=np.int32)
+        np.cumsum(np.where(valid, x, 0), axis=1, out=csum[:, 1:L + 1])
+        np.cumsum(valid, axis=1, out=ccnt[:, 1:L + 1])
+        csum[:, L + 1:] = csum[:, L:L + 1]
+        ccnt[:, L + 1:] = ccnt[:, L:L + 1]
+        count = ccnt[:, window:window + L] - ccnt[:, :L]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (csum[:, window:window + L] - csum[:, :L])/count
+        out[b:b + block] = np.where(count >= min_count, mean, fill_value)
+    return out
+
+
+def Aggregate_EPA_Periods(data, dates, period='day', stat='mean', min_coverage=0.75,
+                          fill_value=EPA_MISSING, block=16):
+    #--statistic of every station (rows of data, hourly grid 'dates') in every
+    #  period; the periods with less than min_coverage of the hours with data
+    #  get fill_value. Returns (dates of the period starts, stations x periods)
+    if stat == 'max8h':
+        data = Rolling_EPA_Mean(data, 8, 6, fill_value, block)
+        stat = 'max'
+    if stat not in EPA_STATS:
+        raise ValueError(f"Unknown statistic '{stat}', use one of {EPA_STATS}")
+
+    starts, lengths = EPA_Period_Starts(dates, period)
+    need = np.ceil(min_coverage*lengths - 1e-9)
+    out  = (np.zeros((data.shape[0], len(starts)), dtype=np.int64) if stat == 'count' else
+            np.full((data.shape[0], len(starts)), fill_value, dtype=data.dtype))
+    if len(starts) == 0:
+        return np.ravel(dates)[starts], out
+
+    for b in range(0, data.shape[0], block):
+        x     = np.asarray(data[b:b + block])
+        valid = EPA_Valid(x, fill_value)
+        x     = x.astype(np.float64)
+        count = np.add.reduceat(valid, starts, axis=1, dtype=np.int64)
+        if stat in ('mean', 'sum'):
+            res = np.add.reduceat(np.where(valid, x, 0), starts, axis=1)
+            if stat == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    res = res/count
+        elif stat == 'max':
+            res = np.maximum.reduceat(np.where(valid, x, -np.inf), starts, axis=1)
+        elif stat == 'min':
+            res = np.minimum.reduceat(np.where(valid, x, np.inf), starts, axis=1)
+        else:
+            out[b:b + block] = count
+            continue
+        out[b:b + block] = np.where(count >= need, res, fill_value)
+    return np.ravel(dates)[starts], out
+
+
+def Aggregate_EPA_Data(data_dict, names, period='day', stats=('mean',), min_coverage=0.75,
+                       fill_value=EPA_MISSING):
+    #--aggregate the arrays 'names' of data_dict (output of Extract_EPA_Parameters)
+    #  with every statistic; returns {'dates': period starts, '<name>_<stat>': array}
+    agg = {}
+    for name in names:
+        for stat in stats:
+            agg['dates'], agg[f'{name}_{stat}'] = Aggregate_EPA_Periods(
+                data_dict[name], data_dict['dates'], period, stat, min_coverage, fill_value)
+    return agg
+
+
+def Wind_EPA_Components(WS, WD, fill_value=EPA_MISSING):
+    #--u (to the east) and v (to the north) components of the wind of all 
+    #  stations and hours; WD is the direction the wind comes from (degrees 
+    #  compass). The hours with missing WS or WD are fill_value in both
+    #  (sin and cos in the dtype of WS, float32 only for the float32 output)
+    valid = EPA_Valid(WS, fill_value) & EPA_Valid(WD, fill_value)
+    rad   = np.radians(WD, dtype=WS.dtype)
+    U     = np.where(valid, -WS*np.sin(rad), fill_value).astype(WS.dtype, copy=False)
+    V     = np.where(valid, -WS*np.cos(rad), fill_value).astype(WS.dtype, copy=False)
+    return U, V
+
+
+def Wind_EPA_Resultant(U, V, fill_value=EPA_MISSING):
+    #--resultant speed and direction (degrees compass, where the wind comes 
+    #  from) of the u, v components; fill_value where U or V is missing
+    valid = EPA_Valid(U, fill_value) & EPA_Valid(V, fill_value)
+    WS    = np.where(valid, np.hypot(U, V), fill_value).astype(U.dtype, copy=False)
+    WD    = np.where(valid, np.degrees(np.arctan2(-U, -V)) % 360, fill_value).astype(U.dtype, copy=False)
+    return WS, WD
+
+
+def Aggregate_EPA_Wind(WS, WD, dates, period='day', min_coverage=0.75, fill_value=EPA_MISSING,
+                       block=16):
+    #--vector averages of the wind in every period: mean u and v components
+    #  and the resultant speed and direction of the mean vector (the periods
+    #  with less than min_coverage of the hours with both WS and WD are 
+    #  fill_value). Returns {'dates', 'U_mean', 'V_mean', 'WS_resultant', 
+    #  'WD_resultant'}; the components are made for 'block' stations at a time
+    starts, _ = EPA_Period_Starts(dates, period)
+    agg = {'dates' : np.ravel(dates)[starts],
+           'U_mean': np.full((WS.shape[0], len(starts)), fill_value, dtype=WS.dtype),
+           'V_mean': np.full((WS.shape[0], len(starts)), fill_value, dtype=WS.dtype)}
+    for b in range(0, WS.shape[0], block):
+        U, V = Wind_EPA_Components(np.asarray(WS[b:b + block]), np.asarray(WD[b:b + block]), fill_value)
+        agg['U_mean'][b:b + block] = Aggregate_EPA_Periods(U, dates, period, 'mean', min_coverage,
+                                                           fill_value, block)[1]
+        agg['V_mean'][b:b + block] = Aggregate_EPA_Periods(V, dates, period, 'mean', min_coverage,
+                                                           fill_value, block)[1]
+    agg['WS_resultant'], agg['WD_resultant'] = Wind_EPA_Resultant(agg['U_mean'], agg['V_mean'], fill_value)
+    return agg
@@ -10,7 +10,10 @@ User defines the: 1) date range
                   2) desired variables using 'Parameter Code'
     
 Program finds and makes list of all stations and instruments 
-(identified with POC number) and stores the list in otuput .csv file
+(identified with POC number) and stores the list in otuput .csv file. The 
+stations can be selected by region (radius around a point, box or nearest 
+stations of target points) and written also in the Meta_File.csv format for
+Sort_EPA_Files.py
     
 Usage:
 Download file and edit SET OPTIONS:
@@ -30,15 +33,40 @@ file_path  = os.path.join(file_dir,fname )
 #--in meta-date file, find the numeric 'Parameter Code' and make array 
 #  including all desired parameters
 #--add the Parameters Code to array 'params' bellow:
-params         = np.array([61103,61104,62101,81102])
+params         = [61103,61104,62101,81102]
 
 #--add user defined names for instrument identifier (POC) in forme
 #  Variable_Name for each parameter 
-POCprefix      = np.array(['POC WS','POC WD','POC TEMP','POC PM10'])
+POCprefix      = ['POC WS','POC WD','POC TEMP','POC PM10']
 
 # Specify the file path
 outFile_path = 'Muttual_EPA_file.csv'   
+
+#--folder of the catalog (binary copy of aqs_monitors.csv, rebuilt when the 
+#  file changes); None to read the .csv file in every run
+catalog_dir  = 'CATALOG/'
+
+#--geographic filter of the stations (None for all): point (lat, lon) and
+#  radius (km), box (lat_min, lat_max, lon_min, lon_max) and/or the near_k 
+#  nearest stations of each target point in near_points (list of lat, lon)
+geo_point    = None
+geo_radius   = 50
+geo_box      = None
+near_points  = None
+near_k       = 3
+
+#--the stations also in the Meta_File.csv format for Sort_EPA_Files.py (None to skip)
+metaOut_path = None
 ******************************************************************************* 
+The program can also be run from the command line (the options above are
+the defaults, replaced by a JSON config file and by the flags) or called from
+Python without side effects of the import:
+    python Analyze_EPA_Files.py --params 61103 88101 --POCprefix "POC WS" "POC PM25"
+    python Analyze_EPA_Files.py --geo_point [40.7,-74.0] --geo_radius 100
+    python Analyze_EPA_Files.py --config analyze.json
+    from Analyze_EPA_Files import run_EPA_analyze
+    rowsOut, names = run_EPA_analyze({'geo_point': [40.7, -74.0]})
+*******************************************************************************
 NOTICE: the number of instruments for certain parameter at the certain station 
         may be more than one. In this case, the additional rows in the 
         output.csv file are added. They contain the additional POC number, but 
@@ -52,10 +80,8 @@ Created on Fri Jan  5 10:13:00 2024
 """
 
 import os
-import pandas as pd
-import numpy as np
-from   datetime import datetime
 import sys
+from   Options_EPA_Functions import Merge_EPA_Options, Parse_EPA_Options
 
 
 #--this clears the console if IDE is used...MORA I IZBRISATI SVE VARIJABLE!!
@@ -66,7 +92,6 @@ def clear_console():
     # Check if the operating system is Unix/Linux/Mac
     elif os.name == 'posix':
         _ = os.system('clear')
-clear_console()
 
 #******************************************************************************
 #                               SET OPTIONS: 
@@ -83,155 +108,119 @@ file_path  = os.path.join(file_dir,fname )
 #--in meta-date file, find the numeric 'Parameter Code' and make array 
 #  including all desired parameters
 #--add the Parameters Code to array 'params' bellow:
-params         = np.array([61103,61104,62101,81102])
+params         = [61103,61104,62101,81102]
 
 #--add user defined names for instrument identifier (POC) in forme
 #  Variable_Name for each parameter 
-POCprefix      = np.array(['POC WS','POC WD','POC TEMP','POC PM10'])
+POCprefix      = ['POC WS','POC WD','POC TEMP','POC PM10']
 
 # Specify the file path
 outFile_path = 'Muttual_EPA_Vars_File.csv'
 
+#--folder of the catalog (binary copy of aqs_monitors.csv, rebuilt when the 
+#  file changes); None to read the .csv file in every run
+catalog_dir  = 'CATALOG/'
+
+#--geographic filter of the stations (None for all): point (lat, lon) and
+#  radius (km), box (lat_min, lat_max, lon_min, lon_max) and/or the near_k 
+#  nearest stations of each target point in near_points (list of lat, lon)
+geo_point    = None
+geo_radius   = 50
+geo_box      = None
+near_points  = None
+near_k       = 3
+
+#--the stations also in the Meta_File.csv format for Sort_EPA_Files.py (None to skip)
+metaOut_path = None
+
+#--the options above are the defaults of run_EPA_analyze and of the command
+#  line (names of the config file and of the flags)
+EPA_ANALYZE_OPTIONS = {'Year_s': Year_s, 'Year_e': Year_e, 'file_path': file_path,
+                       'params': params, 'POCprefix': POCprefix, 'outFile_path': outFile_path,
+                       'catalog_dir': catalog_dir, 'geo_point': geo_point, 'geo_radius': geo_radius,
+                       'geo_box': geo_box, 'near_points': near_points, 'near_k': near_k,
+                       'metaOut_path': metaOut_path}
+
 #******************************************************************************
 #                               PROGRAM
 #******************************************************************************
-#--read the aqs_monitors.csv file and get important parameters
-METAin     = pd.read_csv(file_path,low_memory=False)
-MdateSp    = METAin["First Year of Data"]
-MdateEp    = METAin["Last Sample Date"]
-ParCode    = METAin["Parameter Code"]
-MID_1      = METAin["State Code"].to_numpy()
-MID_2      = METAin["County Code"].to_numpy()
-MID_3      = METAin["Site Number"].to_numpy()
-MPOC       = METAin["POC"].to_numpy()
-
-MParName   = METAin["Parameter Name"]
-Mlat       = METAin["Latitude"].to_numpy()
-Mlon       = METAin["Longitude"].to_numpy()
-MStateName = METAin["State Name"].to_numpy()
-MCounName  = METAin["County Name"].to_numpy()
-MCityName  = METAin["City Name"].to_numpy()
-
-#--convert 'MdateSp' to datetime
-MdateSdt = pd.to_datetime(MdateSp, format='%Y', errors='coerce')
-MdateEdt = pd.to_datetime(MdateEp , errors='coerce')
-
-#--convert 'MdateSp' to numeric timestamp 
-MdateSn = MdateSdt.astype(int) / 10**9 - 3600
-MdateEn = MdateEdt.astype(int) / 10**9  -3600
-
-#--convert custom start and end year to check the matching data
-dateS  = datetime(Year_s, 1, 1, 0, 0, 0)
-dateE  = datetime(Year_e, 1, 1, 0, 0, 0)
-#dateE  = datetime(Year_e, 12, 31, 23, 0, 0)
-
-#--convert start_date to numeric timestamp
-dateSn = dateS.timestamp()
-dateEn = dateE.timestamp()
-
-#--find all rows (stations) that contain desired individual parameters in range Year_s-Year_e
-#  first initialize the IDs, sitename and position (lat and lon) lists 
-IDs    = []
-MSname = []
-MCoName = []
-MCiName = []
-MPos   = []
-
-for i in range(len(params)):
-    IndParams   = np.where((ParCode==params[i])  & (MdateSn<=dateSn) & (MdateEn>=dateEn))[0] 
-    MIDs_123tmp = np.hstack((MID_1[IndParams,None], MID_2[IndParams,None], MID_3[IndParams,None], 
-                              MPOC[IndParams,None]))
-    MSnameTmp   = MStateName[IndParams]
-    MCoNameTmp  = MCounName[IndParams]
-    MCiNameTmp  = MCityName[IndParams]
-    MPosTmp     = np.hstack((Mlat[IndParams,None],Mlon[IndParams,None]))
-    
-    IDs.append(MIDs_123tmp)
-    MSname.append(MSnameTmp)
-    MCoName.append(MCoNameTmp)
-    MCiName.append(MCiNameTmp)
-    MPos.append(MPosTmp)
-    
-
-#--find the stations that mutually contain the desired parameters in Year_s-Year_e
-#  first initialize the output rows, muttual (boolean), rowsOut for numeric 
-muttual   = [False] * (len(IDs) - 1)
-rowsOut   = []
-SnameOut  = []
-CoNameOut = []
-CiNameOut = []
-
-cnt=0
-for i in range(len(IDs[0])):
-    MutIndL = 0
-    MutIndtmp=[np.array([]) for _ in range(len(IDs)-1)]
-    for j in range(len(IDs)-1):
-        muttual[j]    = np.any(np.all(IDs[j+1][:,0:3] == IDs[0][i,0:3], axis=1))
-        MutIndtmp[j]  = np.where(np.all(IDs[j+1][:,0:3] == IDs[0][i,0:3], axis=1))[0]
-  
-    all_true = all(muttual)
-    if all_true:
-        
-          rowL = [len(row) for row in MutIndtmp]
-         
-          rowsOutTmp = np.full((max(rowL), 5+len(params)), np.nan)
-          SnameTmp   = np.full((max(rowL),1),'',dtype='<U50')
-          CoNameTmp  = np.full((max(rowL),1),'',dtype='<U50')
-          CiNameTmp  = np.full((max(rowL),1),'',dtype='<U50')
-        
-          for k in range(1,len(params)):
-              for k2 in range(rowL[k-1]):
-                  indtmp              = MutIndtmp[k-1][k2]
-                  rowsOutTmp[k2,k+3]  = IDs[k][indtmp,-1]
-                  rowsOutTmp[k2,0:3]  = IDs[0][i,0:3]
-                  SnameTmp   [k2,:]   = MSname [k][indtmp]
-                  CoNameTmp  [k2,:]   = MCoName[k][indtmp]
-                  CiNameTmp  [k2,:]   = MCiName[k][indtmp]
-                 
-                  if k2==0:
-                      rowsOutTmp[k2,  3] = IDs[0][i,  3]
-                 
-            
-          #--add the Postion and Station name info to the rows
-          rowsOutTmp[:,-2:]   = MPos[0][i,:]
-        
-          if len(rowsOut)==0:
-              rowsOut   = rowsOutTmp    
-              SnameOut  = SnameTmp
-              CoNameOut = CoNameTmp
-              CiNameOut = CiNameTmp
-          else:
-              rowsOut   = np.vstack((rowsOut,rowsOutTmp))
-              SnameOut  = np.vstack((SnameOut,SnameTmp))
-              CoNameOut = np.vstack((CoNameOut,CoNameTmp))
-              CiNameOut = np.vstack((CiNameOut,CiNameTmp))
+def run_EPA_analyze(options=None):
+    #--find the stations with the options (dictionary, the missing options are
+    #  the defaults of SET OPTIONS) and write the output files; returns
+    #  (rowsOut, names) of the stations, None if there are no stations
+    import numpy as np
+    import pandas as pd
+    from Analyze_EPA_Functions import Select_EPA_Monitors, Mutual_EPA_Monitors
+    from Analyze_EPA_Functions import Read_EPA_Catalog, Query_EPA_Monitors
+    from Analyze_EPA_Functions import Select_EPA_Region, Write_EPA_Meta_File
+    
+    opt       = Merge_EPA_Options(EPA_ANALYZE_OPTIONS, options)
+    params    = np.asarray(opt['params'])
+    POCprefix = np.asarray(opt['POCprefix'])
+    Year_s, Year_e = opt['Year_s'], opt['Year_e']
+    
+    #--find all rows (monitors) that contain desired individual parameters in range
+    #  Year_s-Year_e, one table for each parameter (from the catalog or the .csv file)
+    if opt['catalog_dir'] is not None:
+        catalog  = Read_EPA_Catalog(opt['file_path'], opt['catalog_dir'])
+        monitors = Query_EPA_Monitors(catalog, params, Year_s, Year_e)
+    else:
+        METAin   = pd.read_csv(opt['file_path'],low_memory=False)
+        monitors = Select_EPA_Monitors(METAin, params, Year_s, Year_e)
+    
+    #--find the stations that mutually contain the desired parameters in Year_s-Year_e
+    #  (hash join of the monitor tables on the station), rowsOut for numeric 
+    rowsOut, names, cnt = Mutual_EPA_Monitors(monitors)
+    
+    #--keep only the stations in the region (spatial index of the stations)
+    if opt['geo_point'] is not None or opt['geo_box'] is not None or opt['near_points'] is not None:
+        inRegion = Select_EPA_Region(rowsOut, opt['geo_point'], opt['geo_radius'], opt['geo_box'],
+                                     opt['near_points'], opt['near_k'])
+        rowsOut  = rowsOut[inRegion]
+        names    = names[inRegion]
+        cnt      = np.count_nonzero(~np.isnan(rowsOut[:, 3]))
+    SnameOut  = names[:, 0:1]
+    CoNameOut = names[:, 1:2]
+    CiNameOut = names[:, 2:3]
+    
+    if cnt>0:       
+        print('Number of stations containing the mutual data is:',cnt,'\n')       
+    else:
+        print('There is no stations in this period contaning mutual data...\
+               Define different period! \n')
+        return None
         
-          cnt = cnt+1
-if cnt>0:       
-    print('Number of stations containing the mutual data is:',cnt,'\n')       
-else:
-    print('There is no stations in this period contaning mutual data...\
-           Define different period! \n')
-    sys.exit()
+    #--write data to csv
+    strings1   = np.array(['State Code', 'County Code', 'Site Number'])
+    strings2   = np.array(['Latitude','Longitude','State Name','County Name','City Name'])
+    stringsRow = np.concatenate((strings1, POCprefix, strings2))
     
-#--write data to csv
-strings1   = np.array(['State Code', 'County Code', 'Site Number'])
-strings2   = np.array(['Latitude','Longitude','State Name','County Name','City Name'])
-stringsRow = np.concatenate((strings1, POCprefix, strings2))
-
-matrix           = np.column_stack((rowsOut,SnameOut,CoNameOut,CiNameOut))
-combined_matrix  = np.row_stack((stringsRow,matrix))
-
-#--convert the combined matrix to a Pandas DataFrame
-df = pd.DataFrame(combined_matrix)
-
-#--writing data to the CSV file
-df.to_csv(outFile_path, index=False, na_rep='')
-
-print(f'Data has been written to {outFile_path}')
+    matrix           = np.column_stack((rowsOut,SnameOut,CoNameOut,CiNameOut))
+    combined_matrix  = np.vstack((stringsRow,matrix))
+    
+    #--convert the combined matrix to a Pandas DataFrame
+    df = pd.DataFrame(combined_matrix)
+    
+    #--writing data to the CSV file
+    df.to_csv(opt['outFile_path'], index=False, na_rep='')
+    
+    print(f"Data has been written to {opt['outFile_path']}")
+    
+    #--write the stations for Sort_EPA_Files.py (units are set by the user)
+    if opt['metaOut_path'] is not None:
+        Write_EPA_Meta_File(opt['metaOut_path'], rowsOut, names, POCprefix)
+        print(f"Meta data has been written to {opt['metaOut_path']}")
+    return rowsOut, names
 
 
+def main(argv=None):
+    #--command line: python Analyze_EPA_Files.py [--config analyze.json] [--<option> value ...]
+    options = Parse_EPA_Options(EPA_ANALYZE_OPTIONS, argv, __doc__)
+    if sys.stdout.isatty():
+        clear_console()
+    run_EPA_analyze(options)
+    return 0
 
 
-    
-    
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
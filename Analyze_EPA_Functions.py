@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions to analyze the US-EPA meta data file aqs_monitors.csv:
+    Select_EPA_Monitors & Mutual_EPA_Monitors
+    Read_EPA_Catalog, Query_EPA_Monitors & Query_EPA_Sites
+
+Select_EPA_Monitors finds the monitors (rows) of each desired parameter with
+data over the whole Year_s - Year_e range.
+
+The catalog is the binary copy of aqs_monitors.csv (Build_EPA_Catalog): typed
+columns (.npy) sorted by Parameter Code and site, with the numeric first and
+last dates of the monitors, and the row range of each Parameter Code in the 
+manifest. It is built once and rebuilt when the source file changes (size and 
+modification time, or sha256 with check='hash'). Query_EPA_Monitors gives the 
+same monitors as Select_EPA_Monitors from the catalog (optionally only in some
+states or at some sites), Query_EPA_Sites gives the sites that have all
+parameters in Year_s - Year_e, without reading the .csv file.
+
+The stations can be selected by region (Select_EPA_Region): within a radius 
+(km) of a point, in a lat/lon box or the k nearest stations of many target 
+points (one batch query). The queries use the KD-tree of the station positions
+as unit vectors (Build_EPA_Spatial_Index): the chord in 3D grows with the 
+great-circle distance, so the radius is one ball query and the box is the ball
+around the box checked exactly. Write_EPA_Meta_File writes the selected 
+stations in the Meta_File.csv format for Sort_EPA_Files.py.
+
+Mutual_EPA_Monitors finds the stations (State Code, County Code, Site Number)
+that have the monitors of all parameters. The sites are joined with hash joins
+(pandas merge/groupby) over all parameter monitor sets, instead of comparing
+every monitor of the first parameter with all monitors of other parameters.
+The output rows are the same as before: for every monitor of the first
+parameter at the mutual site there are as many rows as the max number of
+monitors (POCs) of other parameters at this site; the k-th row contains the
+k-th POC of each parameter (or nan), the POC of the first parameter is only in
+the first row.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from   datetime import datetime
+from   Read_EPA_Functions import EPA_Station_Code, EPA_File_Signature, EPA_Cache_Path
+
+
+#--columns of the station (site) and of the output names
+EPA_SITE_COLUMNS = ["State Code", "County Code", "Site Number"]
+EPA_NAME_COLUMNS = ["State Name", "County Name", "City Name"]
+EPA_MONITOR_COLUMNS = EPA_SITE_COLUMNS + ["POC", "Latitude", "Longitude"] + EPA_NAME_COLUMNS
+
+
+def EPA_Monitor_Dates(METAin):
+    #--first and last date of the monitors as numeric timestamp (seconds); NaT
+    #  is the min. integer: the unknown first year is in range, the unknown last
+    #  date is not
+    MdateSdt = pd.to_datetime(METAin["First Year of Data"], format='%Y', errors='coerce')
+    MdateEdt = pd.to_datetime(METAin["Last Sample Date"], errors='coerce')
+    MdateSn  = MdateSdt.to_numpy().astype('datetime64[s]').astype(np.int64).astype(float) - 3600
+    MdateEn  = MdateEdt.to_numpy().astype('datetime64[s]').astype(np.int64).astype(float) - 3600
+    return MdateSn, MdateEn
+
+
+def EPA_Year_Range(Year_s, Year_e):
+    #--custom start and end year as numeric timestamp to check the matching data
+    return datetime(Year_s, 1, 1, 0, 0, 0).timestamp(), datetime(Year_e, 1, 1, 0, 0, 0).timestamp()
+
+
+def Select_EPA_Monitors(METAin, params, Year_s, Year_e):
+    #--monitors (rows of aqs_monitors.csv in the file order) of each parameter
+    #  in 'params' with data in range Year_s-Year_e; one DataFrame per parameter
+    #  with the site columns, POC, Latitude, Longitude and names
+    MdateSn, MdateEn = EPA_Monitor_Dates(METAin)
+    dateSn,  dateEn  = EPA_Year_Range(Year_s, Year_e)
+
+    ParCode  = METAin["Parameter Code"].to_numpy()
+    inRange  = (MdateSn <= dateSn) & (MdateEn >= dateEn)
+    return [METAin.loc[(ParCode == p) & inRange, EPA_MONITOR_COLUMNS].reset_index(drop=True)
+            for p in params]
+
+
+#--version of the catalog format, the catalog is rebuilt if it changes
+EPA_CATALOG_VERSION = 1
+
+#--numeric columns of the catalog (the codes are int64, the rest float64)
+EPA_CATALOG_CODES   = EPA_SITE_COLUMNS + ["Parameter Code", "POC"]
+
+
+def Build_EPA_Catalog(file_path, catalog_dir, check='mtime'):
+    #--convert aqs_monitors.csv to the catalog: typed columns (.npy) sorted by 
+    #  Parameter Code and site (rows of one site stay in the file order), the
+    #  numeric first/last dates ('Date Start', 'Date End') and the names as 
+    #  category codes; the row range of every Parameter Code is in the manifest.
+    #  The rows with non-numeric codes (e.g. State Code 'CC') are skipped
+    METAin = pd.read_csv(file_path, low_memory=False)
+    codes  = {c: pd.to_numeric(METAin[c], errors='coerce').to_numpy(dtype=float)
+              for c in EPA_CATALOG_CODES}
+    valid  = np.all(np.isfinite(np.column_stack(list(codes.values()))), axis=1)
+    MdateSn, MdateEn = EPA_Monitor_Dates(METAin)
+    
+    data = {c: v[valid].astype(np.int64) for c, v in codes.items()}
+    data["Row"]        = np.flatnonzero(valid)
+    data["Latitude"]   = METAin["Latitude"].to_numpy(dtype=float)[valid]
+    data["Longitude"]  = METAin["Longitude"].to_numpy(dtype=float)[valid]
+    data["Date Start"] = MdateSn[valid]
+    data["Date End"]   = MdateEn[valid]
+    
+    categories = {}
+    for c in EPA_NAME_COLUMNS:
+        col = pd.Categorical(METAin[c].to_numpy()[valid])
+        categories[c] = col.categories.astype(str).tolist()
+        data[c]       = col.codes.astype(np.int32)
+    
+    #--sort by Parameter Code, site and file row
+    site  = EPA_Station_Code(data["State Code"], data["County Code"], data["Site Number"], 0)
+    order = np.lexsort((data["Row"], site, data["Parameter Code"]))
+    data  = {c: v[order] for c, v in data.items()}
+    data["Site Code"] = site[order]
+    
+    pcode, starts = np.unique(data["Parameter Code"], return_index=True)
+    ends          = np.r_[starts[1:], len(order)]
+    
+    #--write to the temporary folder and replace the old catalog at the end
+    cat_path = EPA_Cache_Path(file_path, catalog_dir)
+    tmp_path = cat_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for c, v in data.items():
+        np.save(os.path.join(tmp_path, c + '.npy'), v)
+    manifest = {'version'   : EPA_CATALOG_VERSION,
+                'source'    : EPA_File_Signature(file_path, check),
+                'columns'   : list(data),
+                'categories': categories,
+                'parameters': {str(p): [int(r0), int(r1)] for p, r0, r1 in zip(pcode, starts, ends)}}
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    
+    shutil.rmtree(cat_path, ignore_errors=True)
+    os.replace(tmp_path, cat_path)
+    return manifest
+
+
+def Read_EPA_Catalog(file_path, catalog_dir='CATALOG', check='mtime'):
+    #--open the catalog of aqs_monitors.csv (columns memory-mapped), it is built
+    #  (or rebuilt) if it does not match the source file
+    cat_path = EPA_Cache_Path(file_path, catalog_dir)
+    try:
+        with open(os.path.join(cat_path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None or manifest.get('version') != EPA_CATALOG_VERSION or \
+       manifest['source'] != EPA_File_Signature(file_path, check):
+        manifest = Build_EPA_Catalog(file_path, catalog_dir, check)
+    
+    catalog = dict(manifest)
+    catalog['data'] = {c: np.load(os.path.join(cat_path, c + '.npy'), mmap_mode='r')
+                       for c in manifest['columns']}
+    return catalog
+
+
+def _catalog_rows(catalog, p, Year_s, Year_e, states=None, sites=None):
+    #--rows of the catalog of the Parameter Code p with data in range 
+    #  Year_s-Year_e (optionally only in 'states' or at 'sites'), sorted by site
+    r0, r1 = catalog['parameters'].get(str(int(p)), (0, 0))
+    data   = catalog['data']
+    site   = data["Site Code"][r0:r1]
+    if states is not None:
+        #--the sites of a state are one range of the sorted site codes
+        bounds = EPA_Station_Code(np.asarray(states)[:, None], 0, 0, 0) + [0, 10**9]
+        rows   = np.concatenate([np.arange(*np.searchsorted(site, b)) for b in bounds] +
+                                [np.empty(0, dtype=np.int64)])
+    else:
+        rows   = np.arange(r1 - r0)
+    if sites is not None:
+        codes  = EPA_Station_Code(*np.asarray(sites, dtype=np.int64).reshape(-1, 3).T, 0)
+        rows   = rows[np.isin(site[rows], codes)]
+    
+    dateSn, dateEn = EPA_Year_Range(Year_s, Year_e)
+    rows   = rows + r0
+    inRange = (data["Date Start"][rows] <= dateSn) & (data["Date End"][rows] >= dateEn)
+    return rows[inRange]
+
+
+def Query_EPA_Sites(catalog, params, Year_s, Year_e, states=None):
+    #--sites (State Code, County Code, Site Number) that have the monitors of
+    #  all parameters with data in range Year_s-Year_e, sorted by the codes
+    site = None
+    for p in params:
+        psite = np.unique(catalog['data']["Site Code"][_catalog_rows(catalog, p, Year_s, Year_e, states)])
+        site  = psite if site is None else np.intersect1d(site, psite, assume_unique=True)
+    site = np.empty(0, dtype=np.int64) if site is None else site // 100
+    return np.column_stack((site // 10**7, site // 10**4 % 1000, site % 10**4))
+
+
+def Query_EPA_Monitors(catalog, params, Year_s, Year_e, states=None, sites=None):
+    #--same output as Select_EPA_Monitors (monitors of each parameter in the 
+    #  file order), read from the catalog; optionally only in 'states' (list of
+    #  State Code) or at 'sites' (list of State Code, County Code, Site Number)
+    data     = catalog['data']
+    monitors = []
+    for p in params:
+        rows = _catalog_rows(catalog, p, Year_s, Year_e, states, sites)
+        rows = rows[np.argsort(data["Row"][rows], kind='stable')]
+        out  = {c: data[c][rows] for c in EPA_SITE_COLUMNS + ["POC", "Latitude", "Longitude"]}
+        for c in EPA_NAME_COLUMNS:
+            out[c] = pd.Categorical.from_codes(data[c][rows], catalog['categories'][c])
+        monitors.append(pd.DataFrame(out, columns=EPA_MONITOR_COLUMNS))
+    return monitors
+
+
+def Mutual_EPA_Monitors(monitors):
+    #--join the monitors of all parameters (output of Select_EPA_Monitors) on
+    #  the site; returns the numeric rows (State Code, County Code, Site Number,
+    #  POC of each parameter, Latitude, Longitude) and the names of the rows
+    #  (State Name, County Name, City Name), the number of mutual stations
+    NoPar = len(monitors)
+    base  = monitors[0].assign(block=np.arange(len(monitors[0])))
+
+    #--number of rows of each monitor of the first parameter: max number of the
+    #  monitors of other parameters at the site (only sites with all parameters)
+    if NoPar > 1:
+        counts = pd.concat([m.groupby(EPA_SITE_COLUMNS).size() for m in monitors[1:]],
+                           axis=1, join='inner')
+        base   = base.merge(counts.max(axis=1).rename('rows'), left_on=EPA_SITE_COLUMNS,
+                            right_index=True, how='inner')
+    else:
+        base   = base.assign(rows=1)
+
+    #--k2-th row of each block
+    rep = base.loc[base.index.repeat(base['rows'])].reset_index(drop=True)
+    k2  = rep.groupby('block').cumcount().to_numpy()
+
+    rowsOut = np.full((len(rep), 5 + NoPar), np.nan)
+    rowsOut[:, 0:3]   = rep[EPA_SITE_COLUMNS].to_numpy(dtype=float)
+    rowsOut[k2 == 0, 3] = rep.loc[k2 == 0, "POC"].to_numpy(dtype=float)
+    rowsOut[:, -2:]   = rep[["Latitude", "Longitude"]].to_numpy(dtype=float)
+    names = np.full((len(rep), 3), '', dtype='<U50')
+    if NoPar == 1:
+        names[:] = rep[EPA_NAME_COLUMNS].to_numpy(dtype=str)
+
+    #--k2-th monitor of each other parameter at the site, the names are from
+    #  the last parameter that has the k2-th monitor
+    left = rep[EPA_SITE_COLUMNS].assign(k2=k2)
+    for k in range(1, NoPar):
+        m     = monitors[k].assign(k2=monitors[k].groupby(EPA_SITE_COLUMNS).cumcount())
+        match = left.merge(m, on=EPA_SITE_COLUMNS + ['k2'], how='left')
+        found = match["POC"].notna().to_numpy()
+        rowsOut[:, k + 3]   = match["POC"].to_numpy(dtype=float)
+        names[found]        = match.loc[found, EPA_NAME_COLUMNS].to_numpy(dtype=str)
+
+    return rowsOut, names, len(base)
+
+
+#--mean Earth radius (km) for the great-circle distances
+EPA_EARTH_RADIUS = 6371.0088
+
+
+def EPA_Unit_Vectors(lat, lon):
+    #--points on the unit sphere (x, y, z) of lat/lon (degrees); the chord
+    #  between two points grows with the great-circle distance
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return np.stack((np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def _chord(dist_km):
+    #--chord on the unit sphere of the great-circle distance (km)
+    return 2*np.sin(np.minimum(np.asarray(dist_km, dtype=float)/(2*EPA_EARTH_RADIUS), np.pi/2))
+
+
+def _great_circle(chord):
+    #--great-circle distance (km) of the chord on the unit sphere
+    return 2*EPA_EARTH_RADIUS*np.arcsin(np.minimum(chord/2, 1))
+
+
+def Build_EPA_Spatial_Index(lat, lon):
+    #--KD-tree of the station coordinates (unit vectors); the queries return 
+    #  the positions in lat/lon (scipy is imported only here)
+    from scipy.spatial import cKDTree
+    return cKDTree(EPA_Unit_Vectors(lat, lon))
+
+
+def Radius_EPA_Stations(tree, lat, lon, radius_km):
+    #--stations (sorted positions) within radius_km (great-circle) of the point
+    return np.array(sorted(tree.query_ball_point(EPA_Unit_Vectors(lat, lon), _chord(radius_km))),
+                    dtype=np.int64)
+
+
+def Box_EPA_Stations(tree, box):
+    #--stations (sorted positions) in the box (lat_min, lat_max, lon_min, 
+    #  lon_max), lon_min > lon_max for the box over the 180th meridian; the 
+    #  stations in the circle around the box are checked exactly
+    lat0, lat1, lon0, lon1 = box
+    width = (lon1 - lon0) % 360 if lon1 != lon0 + 360 else 360
+    
+    #--circle around the box: center and the max distance to the box edges
+    edge  = np.linspace(0, 1, 33)
+    blat  = np.r_[lat0 + (lat1 - lat0)*edge, lat0 + (lat1 - lat0)*edge, np.full(66, lat0), np.full(66, lat1)]
+    blon  = np.r_[np.full(33, lon0), np.full(33, lon0 + width), np.tile(lon0 + width*edge, 4)]
+    center = EPA_Unit_Vectors((lat0 + lat1)/2, lon0 + width/2)
+    radius = np.max(np.linalg.norm(EPA_Unit_Vectors(blat, blon) - center, axis=1))*1.01 + 1e-9
+    near   = np.array(sorted(tree.query_ball_point(center, radius)), dtype=np.int64)
+    
+    xyz    = tree.data[near]
+    slat   = np.degrees(np.arcsin(np.clip(xyz[:, 2], -1, 1)))
+    slon   = np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0]))
+    inBox  = (slat >= lat0) & (slat <= lat1) & ((slon - lon0) % 360 <= width)
+    return near[inBox]
+
+
+def Nearest_EPA_Stations(tree, lat, lon, k=1):
+    #--k nearest stations of each target point (arrays lat, lon), one batch 
+    #  query; returns the great-circle distances (km) and the positions, both 
+    #  (number of points, k), sorted by the distance (missing: inf and n)
+    chord, ind = tree.query(EPA_Unit_Vectors(np.atleast_1d(lat), np.atleast_1d(lon)), k=k)
+    return _great_circle(chord).reshape(len(chord), -1), ind.reshape(len(ind), -1)
+
+
+def Select_EPA_Region(rowsOut, point=None, radius_km=None, box=None, near_points=None, near_k=1):
+    #--rows of Mutual_EPA_Monitors output at the stations in the region: within
+    #  radius_km of point (lat, lon), in the box (lat_min, lat_max, lon_min, 
+    #  lon_max) and/or the near_k nearest stations of each of near_points 
+    #  (array of lat, lon); the stations of all filters are selected
+    code = EPA_Station_Code(*rowsOut[:, 0:3].astype(np.int64).T, 0)
+    site, first = np.unique(code, return_index=True)
+    tree = Build_EPA_Spatial_Index(rowsOut[first, -2], rowsOut[first, -1])
+    sel  = [np.empty(0, dtype=np.int64)]
+    if point is not None:
+        sel.append(Radius_EPA_Stations(tree, point[0], point[1], radius_km))
+    if box is not None:
+        sel.append(Box_EPA_Stations(tree, box))
+    if near_points is not None:
+        near_points = np.asarray(near_points, dtype=float).reshape(-1, 2)
+        ind = Nearest_EPA_Stations(tree, near_points[:, 0], near_points[:, 1], near_k)[1]
+        sel.append(ind[ind < len(site)])
+    sel  = np.unique(np.concatenate(sel))
+    return np.isin(code, site[sel])
+
+
+def Write_EPA_Meta_File(out_path, rowsOut, names, POCprefix):
+    #--write the rows of Mutual_EPA_Monitors output in the Meta_File.csv format
+    #  for Sort_EPA_Files.py: codes, POCs, units (empty, set by the user),
+    #  Latitude, Longitude and CBSA Name (here 'City Name, State Name')
+    META = pd.DataFrame(rowsOut[:, 0:3].astype(np.int64), columns=EPA_SITE_COLUMNS)
+    for k, poc in enumerate(POCprefix):
+        META[poc] = pd.array(rowsOut[:, 3 + k]).astype('Int64')
+    for poc in POCprefix:
+        META[poc.replace('POC', 'Unit', 1)] = ''
+    META["Latitude"]  = rowsOut[:, -2]
+    META["Longitude"] = rowsOut[:, -1]
+    META["CBSA Name"] = [f'{city}, {state}' for state, city in names[:, [0, 2]]]
+    META.to_csv(out_path, index=False)
+    return META
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions for the long-format (tidy) export of the output of Sort_EPA_Files.py
+as Arrow table, Arrow IPC file or partitioned Parquet dataset:
+    EPA_Arrow_Batches, EPA_Arrow_Table, Write_EPA_Arrow, Write_EPA_Parquet &
+    Read_EPA_Dataset
+
+One row per station, variable and hour with data (the missing hours are not
+written), with the columns:
+    Site Code      int64 key of the station (State, County, Site Number as in
+                   EPA_Station_Code with POC 0, as in the catalog)
+    State Code, County Code, Site Number, POC
+    Parameter      output name (WS, WD, TEMP, ...)      dictionary
+    Year           year of the hour (GMT)
+    Time           hour (timestamp in ms, UTC; the unit Parquet keeps)
+    Value          value (dtype of the output arrays)
+    Unit, Site Name, Latitude, Longitude               dictionary
+The metadata columns are dictionary-encoded: the dictionaries have the
+unique values of the stations, so they are not repeated per row (Parquet
+keeps the dictionary of the text columns, Latitude and Longitude are read
+back as double, dictionary-encoded only in the files). The rows are made
+per (variable, year) batch from the (stations x hours) arrays with
+whole-array operations, sorted by station and time; the writers consume the
+batches one at a time, so the memory is the size of one batch, not of the
+whole table.
+
+EPA_Arrow_Table returns the table in the same process (e.g. for
+table.to_pandas() or polars.from_arrow(table) without any serialization).
+Write_EPA_Arrow writes an Arrow IPC file (memory-mapped when read, zero-copy)
+and Write_EPA_Parquet a dataset partitioned by Parameter and Year (folders
+Parameter=<name>/Year=<year>). Read_EPA_Dataset reads both with the filter of
+stations (Site Code), variables and time pushed down to the files: only the
+partitions and row groups (sorted by station and time, with min/max
+statistics) that can match are read.
+
+pyarrow is an optional dependency, it is imported only by these functions.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import shutil
+import numpy as np
+from   Read_EPA_Functions import EPA_Station_Code
+from   Aggregate_EPA_Functions import EPA_Valid, EPA_Period_Starts
+
+
+#--rows per row group of the Parquet files (about 15 station-years), the
+#  station filter skips the row groups by their min/max Site Code
+EPA_ROW_GROUP = 1 << 17
+
+
+def EPA_Arrow_Schema(value_dtype=np.float64):
+    #--schema of the long-format table
+    import pyarrow as pa
+    return pa.schema([('Site Code', pa.int64()), ('State Code', pa.int16()),
+                      ('County Code', pa.int16()), ('Site Number', pa.int16()),
+                      ('POC', pa.int16()), ('Parameter', pa.dictionary(pa.int32(), pa.string())),
+                      ('Year', pa.int16()), ('Time', pa.timestamp('ms', tz='UTC')),
+                      ('Value', pa.from_numpy_dtype(np.dtype(value_dtype))),
+                      ('Unit', pa.dictionary(pa.int32(), pa.string())),
+                      ('Site Name', pa.dictionary(pa.int32(), pa.string())),
+                      ('Latitude', pa.dictionary(pa.int32(), pa.float64())),
+                      ('Longitude', pa.dictionary(pa.int32(), pa.float64()))])
+
+
+def _dictionary(values):
+    #--unique values (Arrow array) and the int32 index of every value in them
+    import pyarrow as pa
+    uniq, ind = np.unique(np.asarray(values), return_inverse=True)
+    return pa.array(uniq), ind.astype(np.int32)
+
+
+def EPA_Arrow_Batches(data_dict, names, stations, lat, lon, site_names, units=None,
+                      fill_value=np.nan):
+    #--generator of the record batches of the table, one per (variable, year):
+    #  data_dict and names as in Write_EPA_Store (output of Extract_EPA_Parameters),
+    #  stations are the rows of EPA_Station_POCs (codes and the POC of every
+    #  name, in the order of names), units is {name: unit}
+    import pyarrow as pa
+    units    = units or {}
+    stations = np.atleast_2d(np.asarray(stations, dtype=float))
+    codes    = stations[:, 0:3].astype(np.int64)
+    site     = EPA_Station_Code(codes[:, 0], codes[:, 1], codes[:, 2], 0)
+    dates    = np.ravel(data_dict['dates'])
+    #--integer hours from 1970-01-01 of the grid start (numeric dates are from
+    #  0000-01-01) and the first hour and length of every year
+    hour0    = np.datetime64('0000-01-01T00', 'h').astype(np.int64)
+    hour0   += int(np.round((dates[0] - 1)*24)) if len(dates) else 0
+    starts, lengths = EPA_Period_Starts(dates, 'year')
+    years    = (hour0 + starts).astype('datetime64[h]').astype('datetime64[Y]').astype(int) + 1970
+
+    #--dictionaries of the metadata columns (unique values) and the index of
+    #  every station (or variable) in them
+    names_all = pa.array(list(names), pa.string())
+    unit_dict, unit_ind = _dictionary([str(units.get(name, '')) for name in names])
+    site_dict, site_ind = _dictionary([str(s) for s in site_names])
+    lat_dict, lat_ind   = _dictionary(np.asarray(lat, dtype=float))
+    lon_dict, lon_ind   = _dictionary(np.asarray(lon, dtype=float))
+    schema    = None
+
+    for k, name in enumerate(names):
+        arr = data_dict[name]
+        if schema is None:
+            schema = EPA_Arrow_Schema(arr.dtype)
+        for year, h0, n in zip(years, starts, lengths):
+            block = np.asarray(arr[:, h0:h0 + n])
+            #--positions of the hours with data, sorted by station and hour
+            stat, hour = np.nonzero(EPA_Valid(block, fill_value))
+            const = np.full(len(stat), k, dtype=np.int32)
+            yield pa.RecordBatch.from_arrays([
+                pa.array(site[stat]),
+                pa.array(codes[stat, 0].astype(np.int16)),
+                pa.array(codes[stat, 1].astype(np.int16)),
+                pa.array(codes[stat, 2].astype(np.int16)),
+                pa.array(stations[stat, 3 + k].astype(np.int16)),
+                pa.DictionaryArray.from_arrays(const, names_all),
+                pa.array(np.full(len(stat), year, dtype=np.int16)),
+                pa.array((hour0 + h0 + hour.astype(np.int64))*3600000, pa.timestamp('ms', tz='UTC')),
+                pa.array(block[stat, hour]),
+                pa.DictionaryArray.from_arrays(np.full(len(stat), unit_ind[k], dtype=np.int32), unit_dict),
+                pa.DictionaryArray.from_arrays(site_ind[stat], site_dict),
+                pa.DictionaryArray.from_arrays(lat_ind[stat], lat_dict),
+                pa.DictionaryArray.from_arrays(lon_ind[stat], lon_dict)], schema=schema)
+
+
+def EPA_Arrow_Table(data_dict, names, stations, lat, lon, site_names, units=None,
+                    fill_value=np.nan):
+    #--the long-format table in memory (one chunk per variable and year)
+    import pyarrow as pa
+    dtype = data_dict[names[0]].dtype if len(names) else np.float64
+    return pa.Table.from_batches(list(EPA_Arrow_Batches(data_dict, names, stations, lat, lon,
+                                                        site_names, units, fill_value)),
+                                 schema=EPA_Arrow_Schema(dtype))
+
+
+def Write_EPA_Arrow(out_path, data_dict, names, stations, lat, lon, site_names, units=None,
+                    fill_value=np.nan):
+    #--write the table as an Arrow IPC file (batch by batch); returns the rows
+    import pyarrow as pa
+    dtype = data_dict[names[0]].dtype if len(names) else np.float64
+    rows  = 0
+    with pa.OSFile(out_path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, EPA_Arrow_Schema(dtype)) as writer:
+            for batch in EPA_Arrow_Batches(data_dict, names, stations, lat, lon, site_names, units,
+                                           fill_value):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    os.replace(out_path + '.tmp', out_path)
+    return rows
+
+
+def Write_EPA_Parquet(out_dir, data_dict, names, stations, lat, lon, site_names, units=None,
+                      fill_value=np.nan, row_group=EPA_ROW_GROUP):
+    #--write the table as a Parquet dataset partitioned by Parameter and Year
+    #  (the old dataset is replaced at the end); returns the rows
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    dtype   = data_dict[names[0]].dtype if len(names) else np.float64
+    schema  = EPA_Arrow_Schema(dtype)
+    tmp_dir = os.path.normpath(out_dir) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    rows    = [0]
+
+    def batches():
+        for batch in EPA_Arrow_Batches(data_dict, names, stations, lat, lon, site_names, units,
+                                       fill_value):
+            rows[0] += batch.num_rows
+            yield batch
+
+    ds.write_dataset(pa.RecordBatchReader.from_batches(schema, batches()), tmp_dir, format='parquet',
+                     partitioning=ds.partitioning(pa.schema([schema.field('Parameter'),
+                                                             schema.field('Year')]), flavor='hive'),
+                     max_rows_per_group=row_group, min_rows_per_group=row_group,
+                     max_partitions=100000, existing_data_behavior='overwrite_or_ignore')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return rows[0]
+
+
+def Read_EPA_Dataset(path, stations=None, names=None, start=None, end=None, columns=None):
+    #--read the Parquet dataset (folder) or the Arrow IPC file (memory-mapped)
+    #  as a table: only the stations (Site Code or (State, County, Site Number)
+    #  rows), the variables in names and the hours from start to end (datetime
+    #  or 'YYYY-MM-DD...', end included, GMT); the filter is pushed down to the
+    #  partitions and row groups. columns: the columns to read (None: all)
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from   pyarrow.fs import LocalFileSystem
+    schema = EPA_Arrow_Schema()
+    if os.path.isdir(path):
+        parts   = ds.partitioning(pa.schema([schema.field('Parameter'), schema.field('Year')]),
+                                  flavor='hive', dictionaries='infer')
+        dataset = ds.dataset(path, format='parquet', partitioning=parts)
+    else:
+        dataset = ds.dataset(path, format='ipc', filesystem=LocalFileSystem(use_mmap=True))
+
+    expr = None
+    def add(e):
+        return e if expr is None else expr & e
+    if stations is not None:
+        codes = np.asarray(stations, dtype=np.int64)
+        if codes.ndim == 2:
+            codes = EPA_Station_Code(codes[:, 0], codes[:, 1], codes[:, 2], 0)
+        expr = add(ds.field('Site Code').isin(pa.array(np.ravel(codes))))
+    if names is not None:
+        expr = add(ds.field('Parameter').isin(pa.array(list(names), pa.string())))
+    for bound, op in ((start, '__ge__'), (end, '__le__')):
+        if bound is not None:
+            t    = np.datetime64(bound, 'ms')
+            year = int(t.astype('datetime64[Y]').astype(int) + 1970)
+            expr = add(getattr(ds.field('Year'), op)(year))
+            expr = add(getattr(ds.field('Time'), op)(pa.scalar(int(t.astype(np.int64)),
+                                                             pa.timestamp('ms', tz='UTC'))))
+    return dataset.to_table(columns=columns, filter=expr)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+This program measures how the extraction (Sort_EPA_Files.py) and the analysis
+of aqs_monitors.csv (Analyze_EPA_Files.py) scale, without the real EPA data.
+For every scale (number of stations) it generates the synthetic EPA files
+(Generate_EPA_Files in Bench_EPA_Functions.py, made only once per scale and
+options), runs the stages of the program and prints the wall time, rows per
+second and peak memory of each stage.
+
+The results are compared with the stored baseline (baseline_path): the stages
+slower than (1 + time_tol) or with more memory than (1 + mem_tol) times the
+baseline are listed and the program exits with code 1. The baseline is written
+in the first run or if update_baseline is True (it is valid only for the same
+computer and options).
+
+To run the benchmark edit the SET OPTIONS section:
+    bench_dir        folder of the generated files (one subfolder per scale)
+    scales           {scale name: number of stations}
+    pocs             max. number of instruments (POC) per station and parameter
+    years            years of the generated files
+    gap_ratio        ratio of missing hours
+    dup_ratio        ratio of repeated rows (same hour twice)
+    repeat           number of timed runs of each stage (the best is kept)
+    baseline_path    stored baseline (.json)
+    update_baseline  write the results as the new baseline
+    time_tol         allowed increase of time (0.25 = 25 %)
+    mem_tol          allowed increase of peak memory
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import sys
+import json
+from Bench_EPA_Functions import Generate_EPA_Files, Benchmark_EPA_Pipeline, Compare_EPA_Baseline
+from Bench_EPA_Functions import Read_EPA_Baseline, Write_EPA_Baseline
+
+
+#******************************************************************************
+#                               SET OPTIONS:
+#******************************************************************************
+bench_dir       = 'BENCH/'
+scales          = {'small': 10, 'medium': 40, 'large': 160}
+pocs            = 2
+years           = [2021, 2022]
+gap_ratio       = 0.05
+dup_ratio       = 0.001
+repeat          = 3
+baseline_path   = os.path.join(bench_dir, 'baseline.json')
+update_baseline = False
+time_tol        = 0.25
+mem_tol         = 0.25
+
+#******************************************************************************
+#                               PROGRAM
+#******************************************************************************
+if __name__ == '__main__':
+    results = {}
+    for scale, stations in scales.items():
+        #--generate the files of the scale if they are not made with these options
+        data_dir = os.path.join(bench_dir, scale)
+        options  = {'stations': stations, 'pocs': pocs, 'years': years,
+                    'gap_ratio': gap_ratio, 'dup_ratio': dup_ratio}
+        try:
+            with open(os.path.join(data_dir, 'generated.json')) as f:
+                generated = json.load(f)
+        except (OSError, ValueError):
+            generated = {}
+        if generated.get('options') != options:
+            print(f'Generating {scale} ({stations} stations)...')
+            counts = Generate_EPA_Files(data_dir, **options)
+            with open(os.path.join(data_dir, 'generated.json'), 'w') as f:
+                json.dump({'options': options, 'counts': counts}, f, indent=1)
+        else:
+            counts = generated['counts']
+
+        results[scale] = Benchmark_EPA_Pipeline(data_dir, years, counts, repeat)
+        print(f'\n{scale}: {stations} stations, {sum(counts.values())} rows')
+        print(f'{"stage":<18}{"time [s]":>10}{"rows/s":>14}{"peak [MB]":>12}')
+        for stage, res in results[scale].items():
+            print(f'{stage:<18}{res["time"]:>10.3f}{res["rows_per_s"]:>14.0f}{res["peak_mb"]:>12.1f}')
+
+    #--compare with the baseline (or store the first one)
+    baseline = Read_EPA_Baseline(baseline_path)
+    if not baseline or update_baseline:
+        Write_EPA_Baseline(baseline_path, results)
+        print(f'\nBaseline has been written to {baseline_path}')
+    else:
+        regressions = Compare_EPA_Baseline(results, baseline, time_tol, mem_tol)
+        for scale, stage, measure, ratio in regressions:
+            print(f'REGRESSION {scale}/{stage}: {measure} x{ratio:.2f} of the baseline')
+        if regressions:
+            sys.exit(1)
+        print('\nNo regressions against the baseline')
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions to benchmark the program with synthetic EPA data:
+    Generate_EPA_Files, Benchmark_EPA_Pipeline & Compare_EPA_Baseline
+
+Generate_EPA_Files writes the yearly files in the format made by get_EPA_files
+(WIND_YYYY.csv with Wind Speed and Wind Direction, and one file per variable,
+e.g. TEMP_YYYY.csv, PM10_YYYY.csv), the Meta_File.csv of the stations for
+Sort_EPA_Files.py and aqs_monitors.csv for Analyze_EPA_Files.py. The number of
+stations, instruments (POC) per station and parameter, years, the ratio of
+missing hours (gaps of random length) and the ratio of repeated rows are set
+by the user; the values are random but realistic (seasonal and daily cycle of
+temperature, lognormal PM10, ...) and the same for the same seed.
+
+Benchmark_EPA_Pipeline runs the stages of the program on the generated data
+(reading of the files, extraction of the wind and variables from the .csv
+files, in chunks and from the cache, analysis of aqs_monitors.csv) and records
+the wall time (best of 'repeat' runs), the rows per second and the peak memory
+(tracemalloc, one extra run, so the timing is not slowed down) of each stage.
+Compare_EPA_Baseline compares the results with the stored baseline and lists
+the stages slower or bigger than the thresholds.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import time
+import shutil
+import tracemalloc
+import numpy as np
+import pandas as pd
+from   Read_EPA_Functions import Read_EPA_File
+from   Sort_EPA_Functions import Extract_EPA_Wind, Extract_EPA_Variable, Extract_EPA_Parameters
+from   Analyze_EPA_Functions import Select_EPA_Monitors, Mutual_EPA_Monitors
+from   Analyze_EPA_Functions import Read_EPA_Catalog, Query_EPA_Monitors
+
+
+#--parameters of the generated files: (output prefix, Parameter Code,
+#  Parameter Name, unit); WS and WD are both in the WIND files
+EPA_BENCH_PARAMETERS = [('WS',   61103, 'Wind Speed - Resultant',     'Knots'),
+                        ('WD',   61104, 'Wind Direction - Resultant', 'Degrees Compass'),
+                        ('TEMP', 62101, 'Outdoor Temperature',        'Degrees Fahrenheit'),
+                        ('PM10', 81102, 'PM10 Total 0-10um STP',      'Micrograms/cubic meter (25 C)')]
+EPA_BENCH_PARAMS = [p[1] for p in EPA_BENCH_PARAMETERS]
+
+
+def _EPA_Values(name, hours, rng):
+    #--realistic values of the parameter at the hours (from 1970-01-01)
+    day  = 2*np.pi*(hours % 24)/24
+    year = 2*np.pi*(hours % 8766)/8766
+    if name == 'WS':
+        return np.round(rng.gamma(2.0, 2.5, len(hours)), 1)
+    if name == 'WD':
+        return np.round(rng.uniform(0, 360, len(hours)))
+    if name == 'TEMP':
+        return np.round(55 - 20*np.cos(year) - 8*np.cos(day) + rng.normal(0, 3, len(hours)), 1)
+    return np.round(rng.lognormal(3, 0.6, len(hours)), 1)
+
+
+def _EPA_Hours(year, gap_ratio, dup_ratio, rng):
+    #--hours (from 1970-01-01) of one instrument in one year: gaps of 1-48
+    #  hours remove about gap_ratio of the hours, dup_ratio of rows are repeated
+    start = int(np.datetime64(f'{year}-01-01T00', 'h').astype(np.int64))
+    n     = int(np.datetime64(f'{year + 1}-01-01T00', 'h').astype(np.int64)) - start
+    keep  = np.ones(n, dtype=bool)
+    nGaps = int(gap_ratio*n/24.5)
+    for s, l in zip(rng.integers(0, n, nGaps), rng.integers(1, 49, nGaps)):
+        keep[s:s + l] = False
+    hours = np.flatnonzero(keep) + start
+    dup   = rng.random(len(hours)) < dup_ratio
+    return np.sort(np.r_[hours, hours[dup]], kind='stable')
+
+
+def Generate_EPA_Files(out_dir, stations=10, pocs=2, years=(2021, 2022), gap_ratio=0.05,
+                       dup_ratio=0.001, monitor_sites=100, seed=0):
+    #--write the synthetic yearly files (WIND_YYYY.csv, TEMP_YYYY.csv,
+    #  PM10_YYYY.csv), Meta_File.csv and aqs_monitors.csv to out_dir; every
+    #  station has 1-pocs instruments per parameter, aqs_monitors.csv has
+    #  monitor_sites times more sites (not all with all parameters). Returns
+    #  {file name: number of rows}
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    #--sites: codes, position and the POCs of every parameter
+    nSites = stations*monitor_sites
+    code   = rng.choice(56*200*9999, nSites, replace=False)
+    sites  = pd.DataFrame({"State Code" : code // (200*9999) + 1,
+                           "County Code": code // 9999 % 200 + 1,
+                           "Site Number": code % 9999 + 1,
+                           "Latitude"   : np.round(rng.uniform(25, 49, nSites), 6),
+                           "Longitude"  : np.round(rng.uniform(-124, -67, nSites), 6)})
+    POCs = {name: [np.sort(rng.choice(np.arange(1, 10), rng.integers(1, pocs + 1), replace=False))
+                   for _ in range(nSites)] for name, *_ in EPA_BENCH_PARAMETERS}
+
+    #--aqs_monitors.csv: the first 'stations' sites have all parameters
+    monitors = []
+    for name, pcode, pname, _ in EPA_BENCH_PARAMETERS:
+        has = np.r_[np.ones(stations, dtype=bool), rng.random(nSites - stations) < 0.6]
+        for i in np.flatnonzero(has):
+            for poc in POCs[name][i]:
+                monitors.append((i, pcode, poc, pname))
+    MON = pd.DataFrame(monitors, columns=['site', "Parameter Code", "POC", "Parameter Name"])
+    MON = pd.concat([sites.iloc[MON['site']].reset_index(drop=True), MON.drop(columns='site')], axis=1)
+    MON["First Year of Data"] = rng.integers(1990, min(years), len(MON))
+    MON["Last Sample Date"]   = [f'{max(years) + 1}-{m:02d}-15' for m in rng.integers(1, 13, len(MON))]
+    MON["State Name"]  = 'State' + MON["State Code"].astype(str)
+    MON["County Name"] = 'County' + MON["County Code"].astype(str)
+    MON["City Name"]   = 'City' + MON["Site Number"].astype(str)
+    MON["CBSA Name"]   = MON["City Name"] + ', ' + MON["State Name"]
+    MON = MON.sample(frac=1, random_state=seed).reset_index(drop=True)
+    MON.to_csv(os.path.join(out_dir, 'aqs_monitors.csv'), index=False)
+    counts = {'aqs_monitors.csv': len(MON)}
+
+    #--Meta_File.csv: the first POC of every parameter at the first 'stations' sites
+    META = sites.iloc[:stations][["State Code", "County Code", "Site Number"]].copy()
+    for name, _, _, unit in EPA_BENCH_PARAMETERS:
+        META[f'POC {name}'] = [POCs[name][i][0] for i in range(stations)]
+    for name, _, _, unit in EPA_BENCH_PARAMETERS:
+        META[f'Unit {name}'] = unit
+    META["Latitude"]  = sites["Latitude"][:stations]
+    META["Longitude"] = sites["Longitude"][:stations]
+    META["CBSA Name"] = [f'City{s}, State{st}' for st, s in
+                         zip(META["State Code"], META["Site Number"])]
+    META.to_csv(os.path.join(out_dir, 'Meta_File.csv'), index=False)
+
+    #--yearly files, rows sorted by station, parameter, POC and date
+    files = {'WIND': ['WS', 'WD'], 'TEMP': ['TEMP'], 'PM10': ['PM10']}
+    pnames = {name: pname for name, _, pname, _ in EPA_BENCH_PARAMETERS}
+    for year in years:
+        for prefix, names in files.items():
+            parts = []
+            for i in range(stations):
+                for name in names:
+                    for poc in POCs[name][i]:
+                        hours = _EPA_Hours(year, gap_ratio, dup_ratio, rng)
+                        parts.append(pd.DataFrame({
+                            "State Code": sites["State Code"][i], "County Code": sites["County Code"][i],
+                            "Site Num": sites["Site Number"][i], "POC": poc,
+                            "Parameter Name": pnames[name], "Hour": hours,
+                            "Sample Measurement": _EPA_Values(name, hours, rng)}))
+            VAR   = pd.concat(parts, ignore_index=True)
+            hours = VAR.pop("Hour").to_numpy().astype('datetime64[h]')
+            VAR.insert(5, "Date GMT", np.datetime_as_string(hours, unit='D'))
+            VAR.insert(6, "Time GMT", np.char.add(np.char.zfill((hours.astype(np.int64) % 24).astype(str), 2), ':00'))
+            if prefix != 'WIND':
+                VAR = VAR.drop(columns="Parameter Name")
+            fname = f'{prefix}_{year}.csv'
+            VAR.to_csv(os.path.join(out_dir, fname), index=False)
+            counts[fname] = len(VAR)
+    return counts
+
+
+def Run_EPA_Stage(func, repeat=1, memory=True):
+    #--wall time of the stage (best of 'repeat' runs) and its peak memory in MB
+    #  (allocations traced in one extra run)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    result = {'time': min(times)}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1]/2**20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def Benchmark_EPA_Pipeline(data_dir, years, counts, repeat=3, chunksize=200000, memory=True):
+    #--run the stages on the files of Generate_EPA_Files in data_dir (counts
+    #  are its output) and return {stage: {'time', 'rows', 'rows_per_s', 'peak_mb'}}
+    years    = np.asarray(years)
+    META     = pd.read_csv(os.path.join(data_dir, 'Meta_File.csv'))
+    ID_stat  = META[["State Code", "County Code", "Site Number"]].to_numpy()
+    cache    = os.path.join(data_dir, 'CACHE')
+    catalog  = os.path.join(data_dir, 'CATALOG')
+    mon_path = os.path.join(data_dir, 'aqs_monitors.csv')
+    Y0, Y1   = int(years[0]), int(years[-1])
+    specs    = [('WS', 'WIND', 'Wind Speed - Resultant', META["POC WS"]),
+                ('WD', 'WIND', 'Wind Direction - Resultant', META["POC WD"]),
+                ('TEMP', 'TEMP', None, META["POC TEMP"]), ('PM10', 'PM10', None, META["POC PM10"])]
+    rows     = {p: sum(counts[f'{p}_{y}.csv'] for y in years) for p in ('WIND', 'TEMP', 'PM10')}
+
+    def rebuild(path, func):
+        #--the stage that builds the cache or catalog starts without it
+        def stage():
+            shutil.rmtree(path, ignore_errors=True)
+            func()
+        return stage
+
+    stages = {
+        'read'        : (lambda: [Read_EPA_File(os.path.join(data_dir, f'{p}_{y}.csv'), p == 'WIND')
+                                  for p in rows for y in years], sum(rows.values())),
+        'extract_wind': (lambda: Extract_EPA_Wind(years, ID_stat, data_dir, 'WIND', META["POC WS"],
+                                                  META["POC WD"]), rows['WIND']),
+        'extract_var' : (lambda: [Extract_EPA_Variable(years, ID_stat, data_dir, p, META[f'POC {p}'])
+                                  for p in ('TEMP', 'PM10')], rows['TEMP'] + rows['PM10']),
+        'extract_all' : (lambda: Extract_EPA_Parameters(years, ID_stat, data_dir, specs),
+                         sum(rows.values())),
+        'extract_chunks': (lambda: Extract_EPA_Parameters(years, ID_stat, data_dir, specs,
+                                                          chunksize=chunksize), sum(rows.values())),
+        'cache_build' : (rebuild(cache, lambda: Extract_EPA_Parameters(years, ID_stat, data_dir, specs,
+                                                                       cache_dir=cache)), sum(rows.values())),
+        'extract_cached': (lambda: Extract_EPA_Parameters(years, ID_stat, data_dir, specs,
+                                                          cache_dir=cache), sum(rows.values())),
+        'analyze'     : (lambda: Mutual_EPA_Monitors(Select_EPA_Monitors(
+                                     pd.read_csv(mon_path, low_memory=False), EPA_BENCH_PARAMS, Y0, Y1)),
+                         counts['aqs_monitors.csv']),
+        'catalog_build': (rebuild(catalog, lambda: Read_EPA_Catalog(mon_path, catalog)),
+                          counts['aqs_monitors.csv']),
+        'analyze_catalog': (lambda: Mutual_EPA_Monitors(Query_EPA_Monitors(
+                                     Read_EPA_Catalog(mon_path, catalog), EPA_BENCH_PARAMS, Y0, Y1)),
+                            counts['aqs_monitors.csv']),
+    }
+
+    results = {}
+    for name, (func, n) in stages.items():
+        results[name] = Run_EPA_Stage(func, repeat, memory)
+        results[name].update({'rows': n, 'rows_per_s': n/max(results[name]['time'], 1e-9)})
+    return results
+
+
+def Compare_EPA_Baseline(results, baseline, time_tol=0.25, mem_tol=0.25):
+    #--stages (of all scales) slower than (1 + time_tol) or with more peak
+    #  memory than (1 + mem_tol) times the baseline; results and baseline are
+    #  {scale: {stage: result}}. Returns a list of (scale, stage, measure, ratio)
+    regressions = []
+    for scale, stages in results.items():
+        for stage, res in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if base is None:
+                continue
+            for measure, tol in (('time', time_tol), ('peak_mb', mem_tol)):
+                if measure in res and measure in base and base[measure] > 0:
+                    ratio = res[measure]/base[measure]
+                    if ratio > 1 + tol:
+                        regressions.append((scale, stage, measure, ratio))
+    return regressions
+
+
+def Read_EPA_Baseline(path):
+    #--stored baseline {scale: {stage: result}}, empty if there is none
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def Write_EPA_Baseline(path, results):
+    #--store the results as the new baseline
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+This program downloads the meteorological or air quality data files from
+US-EPA site (https://aqs.epa.gov/aqsweb/airdata/download_files.html) and makes
+the yearly files with selected columns for Sort_EPA_Files.py. It is the Python
+version of the get_EPA_files script: the files of all years and prefixes are
+downloaded concurrently, the interrupted downloads are continued and the
+unchanged archives are not downloaded again (see Get_EPA_Functions.py).
+
+To download files edit the SET YEARS, LINKS & OUTPUT COLUMNS section:
+    year_s, year_e  first and last year
+    base_url        link of the EPA files (or local HTTP server)
+    save_dir        folder of the downloaded and output files
+    files           list of (prefix of the archive, prefix of the output file,
+                    columns of the output file)
+    workers         number of concurrent downloads
+    keep_zip        keep the .zip archives after the conversion
+    stations_file   None (all stations) or Meta_File.csv / Muttual_EPA_Vars_File.csv
+                    to write only the rows of the listed stations
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import numpy as np
+from Get_EPA_Functions import Download_EPA_Files, Read_EPA_Stations
+
+
+#******************************************************************************
+#                     SET YEARS, LINKS & OUTPUT COLUMNS:
+#******************************************************************************
+#--set the start and end years
+year_s   = 2021
+year_e   = 2022
+
+#--set the base URL and the directory path where to save the downloaded files
+base_url = 'https://aqs.epa.gov/aqsweb/airdata/'
+save_dir = 'EPA_FILES'
+
+#--prefixes of the download and output files and the columns for the output file
+files    = [('hourly_WIND_', 'WIND_',
+             ["State Code", "County Code", "Site Num", "POC", "Parameter Name",
+              "Date GMT", "Time GMT", "Sample Measurement"]),
+            ('hourly_81102_', 'PM10_',
+             ["State Code", "County Code", "Site Num", "POC", "Latitude", "Longitude",
+              "Parameter Name", "Date GMT", "Time GMT", "Sample Measurement"]),
+            ('hourly_TEMP_', 'TEMP_',
+             ["State Code", "County Code", "Site Num", "POC",
+              "Date GMT", "Time GMT", "Sample Measurement"])]
+#--daily files (daily_PM10 in Sort_EPA_Files.py), e.g.
+#           ('daily_81102_', 'daily_PM10_',
+#            ["State Code", "County Code", "Site Num", "POC", "Sample Duration",
+#             "Date Local", "Arithmetic Mean"])
+
+workers       = 4
+keep_zip      = True
+stations_file = None
+
+#******************************************************************************
+#                               PROGRAM
+#******************************************************************************
+if __name__ == '__main__':
+    stations = None if stations_file is None else Read_EPA_Stations(stations_file)
+    status   = Download_EPA_Files(base_url, files, np.arange(year_s, year_e + 1), save_dir,
+                                  workers, keep_zip, stations=stations)
+    for name, state in status.items():
+        print(f'{name}: {state}')
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions to download the US-EPA yearly files (Python version of get_EPA_files):
+    Download_EPA_Files (Download_EPA_File & Convert_EPA_Zip)
+
+The yearly .zip archives (e.g. hourly_WIND_2021.zip) of all prefixes and years
+are downloaded concurrently ('workers' threads) from the EPA site (or any other
+base URL, e.g. a local HTTP server for tests):
+    - the download is written to the .part file first, an interrupted download
+    is continued from its end with the HTTP Range request (If-Range makes sure
+    the archive did not change in the meantime)
+    - the archives that are already downloaded and converted are checked with
+    the conditional request (ETag / Last-Modified), unchanged archives are not
+    downloaded again (HTTP 304)
+    - the state of every archive is written in the manifest (manifest.json in
+    the save folder), so the interrupted run continues where it stopped
+After the download, the archive is converted to the output file with the
+selected columns (e.g. WIND_2021.csv) that Sort_EPA_Files.py reads. The .csv
+file in the archive is read as a stream (it is not unzipped to the disk) and 
+only the selected columns, and optionally only the rows of the stations listed
+in Meta_File.csv or Muttual_EPA_Vars_File.csv, are written (Convert_EPA_Zip).
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import shutil
+import zipfile
+import hashlib
+import threading
+import urllib.request
+import urllib.error
+import numpy as np
+import pandas as pd
+from   concurrent.futures import ThreadPoolExecutor
+from   Read_EPA_Functions import EPA_Station_Code
+
+
+#--name of the manifest file in the save folder
+EPA_MANIFEST = 'manifest.json'
+
+#--size of the blocks read from the network and from the archives
+EPA_BLOCK = 1 << 20
+
+
+def Read_EPA_Manifest(save_dir):
+    #--state of the archives in the save folder, {archive name: entry}
+    try:
+        with open(os.path.join(save_dir, EPA_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def Write_EPA_Manifest(save_dir, manifest):
+    #--write the manifest to the temporary file and replace the old one
+    path = os.path.join(save_dir, EPA_MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def Download_EPA_File(url, file_path, entry, timeout=60):
+    #--download url to file_path; entry is the manifest entry of the earlier
+    #  run ('etag', 'last_modified', 'complete'), it is updated in place (also 
+    #  if the download fails, to continue it later) and returned with 
+    #  'status': 'downloaded' or 'unchanged' (the complete file did not change)
+    part    = file_path + '.part'
+    headers = {}
+
+    if entry.get('complete'):
+        #--conditional request, the server answers 304 if the archive did not change
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    elif os.path.exists(part) and (entry.get('etag') or entry.get('last_modified')):
+        #--continue the interrupted download if the archive is still the same
+        headers['Range']    = f'bytes={os.path.getsize(part)}-'
+        headers['If-Range'] = entry.get('etag') or entry['last_modified']
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+                                          timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            entry['status'] = 'unchanged'
+            return entry
+        if e.code == 416:
+            #--the range is not valid (e.g. the archive is shorter), start again
+            os.remove(part)
+            entry.pop('etag', None)
+            entry.pop('last_modified', None)
+            return Download_EPA_File(url, file_path, entry, timeout)
+        raise
+
+    with response:
+        #--206: the rest of the file is appended, 200: the whole file is written
+        mode = 'ab' if response.status == 206 else 'wb'
+        entry.update({'url': url, 'complete': False,
+                      'etag': response.headers.get('ETag'),
+                      'last_modified': response.headers.get('Last-Modified')})
+        length = response.headers.get('Content-Length')
+        with open(part, mode) as f:
+            start = f.tell()
+            shutil.copyfileobj(response, f, EPA_BLOCK)
+            size  = f.tell() - start
+        if length is not None and size != int(length):
+            raise IOError(f'Download of {url} interrupted ({size} of {length} bytes)')
+
+    os.replace(part, file_path)
+    entry.update({'complete': True, 'size': os.path.getsize(file_path), 'status': 'downloaded'})
+    return entry
+
+
+def Read_EPA_Stations(file_path):
+    #--(State Code, County Code, Site Number) of the stations in Meta_File.csv 
+    #  or Muttual_EPA_Vars_File.csv (its first row are the column numbers)
+    stations = pd.read_csv(file_path)
+    if "State Code" not in stations.columns:
+        stations = pd.read_csv(file_path, header=1)
+    stations = stations[["State Code", "County Code", "Site Number"]].dropna()
+    return sorted(set(map(tuple, stations.to_numpy(dtype=np.int64).tolist())))
+
+
+def Convert_EPA_Zip(zip_path, out_path, columns, stations=None, chunksize=1000000):
+    #--read the yearly .csv file directly from the archive (decompressed as a
+    #  stream, in chunks of rows) and write only the 'columns' (names as in the
+    #  EPA header) to out_path; if 'stations' (list of State Code, County Code,
+    #  Site Number) is given, only their rows are written. Nothing else is 
+    #  written to the disk, the values are copied as they are (text)
+    if stations is not None:
+        codes = EPA_Station_Code(*np.array(stations, dtype=np.int64).reshape(-1, 3).T, 0)
+    with zipfile.ZipFile(zip_path) as archive:
+        member = [m for m in archive.namelist() if m.endswith('.csv')][0]
+        with archive.open(member) as fin, open(out_path + '.tmp', 'w', newline='') as fout:
+            header = True
+            for chunk in pd.read_csv(fin, usecols=columns, dtype=str, keep_default_na=False,
+                                     chunksize=chunksize):
+                if stations is not None:
+                    ID = [pd.to_numeric(chunk[c], errors='coerce').fillna(-1).to_numpy(np.int64)
+                          for c in ("State Code", "County Code", "Site Num")]
+                    chunk = chunk[np.isin(EPA_Station_Code(*ID, 0), codes)]
+                chunk[columns].to_csv(fout, index=False, header=header, lineterminator='\n')
+                header = False
+    os.replace(out_path + '.tmp', out_path)
+
+
+def Download_EPA_Files(base_url, files, years, save_dir='EPA_FILES', workers=4, keep_zip=True,
+                       timeout=60, stations=None):
+    #--download and convert the archives of all 'files' and 'years'; files is a
+    #  list of (prefix in, prefix out, columns), e.g.
+    #  ('hourly_WIND_', 'WIND_', ["State Code", ...]) for hourly_WIND_2021.zip
+    #  -> WIND_2021.csv. If 'stations' (see Read_EPA_Stations) is given, only 
+    #  their rows are written. The (file, year) tasks run in 'workers' threads.
+    #  Returns {archive name: status ('downloaded', 'unchanged', 'converted' 
+    #  (only the output was made again) or the error)}
+    os.makedirs(save_dir, exist_ok=True)
+    manifest = Read_EPA_Manifest(save_dir)
+    lock     = threading.Lock()
+    
+    #--the output is converted again if the station filter changes
+    selection = None if stations is None else \
+                hashlib.sha1(json.dumps(sorted(map(list, stations))).encode()).hexdigest()
+
+    def task(prefix_in, prefix_out, columns, year):
+        name     = f'{prefix_in}{year}.zip'
+        zip_path = os.path.join(save_dir, name)
+        out_path = os.path.join(save_dir, f'{prefix_out}{year}.csv')
+        with lock:
+            entry = dict(manifest.get(name, {}))
+        #--the conditional request only if the output or the archive exists
+        outputOK = os.path.exists(out_path) and entry.get('output') == out_path and \
+                   entry.get('columns') == list(columns) and entry.get('stations') == selection
+        if not outputOK and not os.path.exists(zip_path):
+            entry['complete'] = False
+
+        try:
+            Download_EPA_File(base_url + name, zip_path, entry, timeout)
+            if entry['status'] == 'downloaded' or not outputOK:
+                Convert_EPA_Zip(zip_path, out_path, columns, stations)
+                entry.update({'output': out_path, 'columns': list(columns), 'stations': selection})
+                if entry['status'] == 'unchanged':
+                    entry['status'] = 'converted'      # archive unchanged, new output
+                if not keep_zip:
+                    os.remove(zip_path)
+        finally:
+            #--the manifest is written also for the failed task (to continue it)
+            with lock:
+                manifest[name] = entry
+                Write_EPA_Manifest(save_dir, manifest)
+        return entry['status']
+
+    status = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {f'{prefix_in}{year}.zip': executor.submit(task, prefix_in, prefix_out, columns, year)
+                   for prefix_in, prefix_out, columns in files for year in years}
+        for name, future in futures.items():
+            try:
+                status[name] = future.result()
+            except Exception as e:
+                status[name] = f'error: {e}'
+    return status
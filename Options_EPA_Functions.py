@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions for the options of the programs (Sort_EPA_Files.py and
+Analyze_EPA_Files.py) run from the command line or called from Python:
+    Merge_EPA_Options, EPA_Option_Parser & Parse_EPA_Options
+
+The options of SET OPTIONS in the program are the defaults (dictionary of
+option name: value). They are replaced by the options of a JSON config file
+(--config, an object with the same names) and then by the command line flags,
+one flag per option with the same name (--year_s 2021, --POCs "POC TEMP"
+"POC PM10", --update / --no-update). The values of the flags are read as JSON
+(numbers, true/false, null, ...) or as text, None or nan are also accepted.
+The options with the default None take one or more values (--aggregate_names
+WS PM10): one value is the value, more values are a list.
+
+The module imports only argparse and json, so --help of the programs is
+printed without the import of numpy, pandas or scipy.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import json
+import argparse
+
+
+def Merge_EPA_Options(defaults, options=None):
+    #--copy of the defaults with the values of options (dictionary); the names
+    #  must be the names of the defaults
+    unknown = sorted(set(options or {}) - set(defaults))
+    if unknown:
+        raise ValueError(f'Unknown options {unknown}, use {sorted(defaults)}')
+    return {**defaults, **(options or {})}
+
+
+def _option_value(text):
+    #--value of a command line flag: JSON, None, nan or the text
+    if text in ('None', 'none'):
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+class _EPA_Values(argparse.Action):
+    #--one or more values of a flag: the value or the list of the values
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, values[0] if len(values) == 1 else values)
+
+
+def EPA_Option_Parser(defaults, description=None):
+    #--command line parser with --config and one flag per option of defaults
+    #  (a list for the list options, --name/--no-name for the True/False ones,
+    #  one or more values for the None ones);
+    #  only the given flags are in the parsed namespace
+    parser = argparse.ArgumentParser(description=description, argument_default=argparse.SUPPRESS,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', metavar='PATH',
+                        help='JSON file with the options (object of option name: value)')
+    for name, value in defaults.items():
+        helps = f'default: {value!r}'
+        if isinstance(value, bool):
+            parser.add_argument(f'--{name}', action=argparse.BooleanOptionalAction, help=helps)
+        elif isinstance(value, (list, tuple)):
+            parser.add_argument(f'--{name}', nargs='*', type=_option_value, metavar='VALUE', help=helps)
+        elif value is None:
+            parser.add_argument(f'--{name}', nargs='+', type=_option_value, metavar='VALUE',
+                                action=_EPA_Values, help=helps)
+        else:
+            parser.add_argument(f'--{name}', type=_option_value, metavar='VALUE', help=helps)
+    return parser
+
+
+def Parse_EPA_Options(defaults, argv=None, description=None):
+    #--options of the command line (argv, sys.argv if None): the defaults
+    #  replaced by the config file and then by the flags
+    parser  = EPA_Option_Parser(defaults, description)
+    flags   = vars(parser.parse_args(argv))
+    options = {}
+    if 'config' in flags:
+        with open(flags.pop('config')) as f:
+            options = json.load(f)
+        if not isinstance(options, dict):
+            parser.error('the config file must contain a JSON object')
+    options.update(flags)
+    try:
+        return Merge_EPA_Options(defaults, options)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+This program runs the whole processing as one build (Get_EPA_Files.py,
+Analyze_EPA_Files.py and Sort_EPA_Files.py) and makes again only the outputs
+whose inputs changed:
+    get      download of the yearly files (optional; the unchanged archives
+             are not downloaded again, see Get_EPA_Functions.py)
+    analyze  stations of aqs_monitors.csv (optional), key: content of
+             aqs_monitors.csv and the options of the analysis
+    sort     extraction of the data, key: content of Meta_File.csv and of all
+             yearly files of the years and the options of the output
+The key (sha256) of every stage is stored in artifact_dir/build.json: the
+stage is skipped if its key is the same as in the last build and its outputs
+exist. The options that change only the speed (workers, prefetch, cache,
+report, ...) are not in the key.
+
+The extraction stores the output of every (file, year) task in artifact_dir
+under the key of its inputs (yearly file, stations and POCs; see
+Pipeline_EPA_Functions.py). After a change of the options of the output (e.g.
+aggregation, completeness, added variable, years) the sort stage runs again,
+but only the tasks of the new files or of the changed stations are read and
+partitioned, the rest is loaded from the artifacts.
+
+Usage: edit SET OPTIONS (the options of the programs are dictionaries with
+the option names of their SET OPTIONS, the missing ones are their defaults):
+#******************************************************************************
+#                               SET OPTIONS:
+#******************************************************************************
+artifact_dir = 'ARTIFACTS/'             # artifacts and state of the build
+get          = False                    # download the yearly files first (files of
+                                        # Get_EPA_Files.py, years of sort)
+analyze      = None                     # options of Analyze_EPA_Files.py (e.g. {}
+                                        # for its defaults), None: no analysis
+sort         = {}                       # options of Sort_EPA_Files.py
+force        = []                       # stages run also if unchanged, e.g. ['sort']
+*******************************************************************************
+or use the command line (the options of the programs as JSON) or Python:
+    python Pipeline_EPA_Files.py --config pipeline.json
+    python Pipeline_EPA_Files.py --sort '{"aggregate_period": "day"}'
+    from Pipeline_EPA_Files import run_EPA_pipeline
+    status = run_EPA_pipeline({'analyze': {'metaOut_path': 'Meta_File.csv'}})
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import sys
+from   Options_EPA_Functions import Merge_EPA_Options, Parse_EPA_Options
+
+
+#******************************************************************************
+#                               SET OPTIONS:
+#******************************************************************************
+artifact_dir = 'ARTIFACTS/'
+get          = False
+analyze      = None
+sort         = {}
+force        = []
+
+#--the options above are the defaults of run_EPA_pipeline and of the command
+#  line (names of the config file and of the flags)
+EPA_PIPELINE_OPTIONS = {'artifact_dir': artifact_dir, 'get': get, 'analyze': analyze,
+                        'sort': sort, 'force': force}
+
+#--options of the programs that do not change the outputs (not in the keys)
+EPA_VOLATILE_OPTIONS = ('catalog_dir', 'cache_dir', 'chunksize', 'workers', 'prefetch',
+                        'artifact_dir', 'update', 'report_path', 'profiler', 'profile_path',
+                        'arrow_table')
+
+#******************************************************************************
+#                               PROGRAM
+#******************************************************************************
+def EPA_Stage_Options(options):
+    #--options of a program in the key of its stage
+    return {name: value for name, value in options.items() if name not in EPA_VOLATILE_OPTIONS}
+
+
+def run_EPA_pipeline(options=None):
+    #--run the stages of the build with the options (dictionary, the missing
+    #  options are the defaults of SET OPTIONS); returns {stage: 'built',
+    #  'unchanged' or the status of the downloads}
+    import numpy as np
+    from Pipeline_EPA_Functions import EPA_Key, EPA_Content_Hash, Read_EPA_Build
+    from Pipeline_EPA_Functions import Write_EPA_Build, Build_EPA_Stage
+    from Sort_EPA_Functions import EPA_File_Path
+    from Sort_EPA_Files import EPA_SORT_OPTIONS, sort_EPA
+    from Analyze_EPA_Files import EPA_ANALYZE_OPTIONS, run_EPA_analyze
+
+    opt     = Merge_EPA_Options(EPA_PIPELINE_OPTIONS, options)
+    art     = opt['artifact_dir']
+    sortOpt = Merge_EPA_Options(EPA_SORT_OPTIONS, {'artifact_dir': art, **opt['sort']})
+    years   = np.arange(sortOpt['year_s'], sortOpt['year_e'] + 1)
+    build   = Read_EPA_Build(art)
+    status  = {}
+
+    #--download (or update) the yearly files, the downloads check the changes
+    if opt['get']:
+        import Get_EPA_Files as get_opt
+        from Get_EPA_Functions import Download_EPA_Files, Read_EPA_Stations
+        stations = (None if get_opt.stations_file is None else
+                    Read_EPA_Stations(get_opt.stations_file))
+        status['get'] = Download_EPA_Files(get_opt.base_url, get_opt.files, years,
+                                           get_opt.save_dir, get_opt.workers, get_opt.keep_zip,
+                                           stations=stations)
+
+    #--stations of aqs_monitors.csv
+    if opt['analyze'] is not None:
+        anOpt = Merge_EPA_Options(EPA_ANALYZE_OPTIONS, opt['analyze'])
+        key   = EPA_Key('analyze', EPA_Content_Hash(anOpt['file_path'], art), EPA_Stage_Options(anOpt))
+        status['analyze'] = Build_EPA_Stage(build, 'analyze', key,
+                                            [anOpt['outFile_path'], anOpt['metaOut_path']],
+                                            lambda: run_EPA_analyze(anOpt), 'analyze' in opt['force'])
+        Write_EPA_Build(art, build)
+
+    #--extraction: Meta_File.csv (maybe made by analyze) and all yearly files
+    prefixes = [sortOpt['fname_prefixW'], *sortOpt['fname_prefixVars'], *sortOpt['daily_prefixes']]
+    sources  = {os.path.basename(path): EPA_Content_Hash(path, art) for path in
+                (EPA_File_Path(sortOpt['files_dir'], prefix, year)
+                 for prefix in prefixes for year in years)}
+    metaFile = os.path.join(sortOpt['metaFile_dir'], sortOpt['metaFname'])
+    key      = EPA_Key('sort', EPA_Content_Hash(metaFile, art), sources, EPA_Stage_Options(sortOpt))
+    status['sort'] = Build_EPA_Stage(build, 'sort', key,
+                                     [sortOpt[name] for name in ('outputFile_path', 'store_dir',
+                                      'arrow_path', 'parquet_dir', 'completeness_path')],
+                                     lambda: sort_EPA(sortOpt), 'sort' in opt['force'])
+    Write_EPA_Build(art, build)
+    return status
+
+
+def main(argv=None):
+    #--command line: python Pipeline_EPA_Files.py [--config pipeline.json] [--<option> value ...]
+    options = Parse_EPA_Options(EPA_PIPELINE_OPTIONS, argv, __doc__)
+    try:
+        status = run_EPA_pipeline(options)
+    except Exception as e:
+        print("An error occurred in the pipeline:", e)
+        return 1
+    for stage, state in status.items():
+        print(f'{stage}: {state}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
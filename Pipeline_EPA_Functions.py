@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions of the build graph (Pipeline_EPA_Files.py) and of the content-
+addressed artifacts of the extraction:
+    EPA_Content_Hash, EPA_Key, Read_EPA_Artifact, Write_EPA_Artifact,
+    Read_EPA_Build, Write_EPA_Build & Build_EPA_Stage
+
+Every artifact is stored under the key (sha256) of its inputs: the content
+hash of the input files and the options that change the result. The same
+inputs give the same key, so the artifact is reused by every later run
+(also after the options were changed and changed back); changed inputs give
+a new key and only the artifacts that depend on them are made again.
+
+The content hash of a file is computed once and remembered in hashes.json of
+the artifact folder with the size and modification time of the file; it is
+computed again only if they change (the large yearly files are not read in
+every run).
+
+The artifacts of the extraction are the outputs of the (file prefix, year)
+tasks of Sort_EPA_Functions.py (key: yearly file, station/POC keys, value
+type): the hours (from 1970-01-01, independent of the range of years) and
+values of every station in one .npz file. A task with an artifact is not
+read or partitioned again (Run_EPA_Tasks with artifact_dir).
+
+The stages of the build (download, analysis of aqs_monitors.csv, extraction)
+record their key and outputs in build.json; Build_EPA_Stage runs the stage
+only if its key changed or an output is missing.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from   datetime import datetime
+
+
+#--version of the artifacts (part of every key, a new version makes all again)
+EPA_ARTIFACT_VERSION = 1
+
+
+def _json_default(x):
+    #--numpy values in the keys
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    return str(x)
+
+
+def EPA_Key(*parts):
+    #--key (sha256 hex) of the parts (JSON values: options, hashes, ...)
+    text = json.dumps([EPA_ARTIFACT_VERSION, *parts], sort_keys=True, default=_json_default)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def EPA_Content_Hash(file_path, artifact_dir):
+    #--sha256 of the file content, remembered in artifact_dir/hashes.json until
+    #  the size or modification time of the file changes
+    stat  = os.stat(file_path)
+    path  = os.path.join(artifact_dir, 'hashes.json')
+    try:
+        with open(path) as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        hashes = {}
+    name  = os.path.abspath(file_path)
+    entry = hashes.get(name, {})
+    if entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        entry = hashes[name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                'sha256': sha.hexdigest()}
+        os.makedirs(artifact_dir, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(hashes, f, indent=1)
+        os.replace(path + '.tmp', path)
+    return entry['sha256']
+
+
+def _artifact_path(artifact_dir, key):
+    #--artifact_dir/tasks/ab/abcdef....npz
+    return os.path.join(artifact_dir, 'tasks', key[:2], key + '.npz')
+
+
+def Read_EPA_Artifact(artifact_dir, key, start_hour):
+    #--task output (list of (hours from start_hour, values) per station key)
+    #  of the artifact, None if there is no artifact with the key
+    try:
+        with np.load(_artifact_path(artifact_dir, key)) as data:
+            hours, values, offsets = data['hours'] - start_hour, data['values'], data['offsets']
+    except (OSError, ValueError, KeyError):
+        return None
+    return [(hours[i0:i1], values[i0:i1]) for i0, i1 in zip(offsets[:-1], offsets[1:])]
+
+
+def Write_EPA_Artifact(artifact_dir, key, out, start_hour):
+    #--store the task output with the hours from 1970-01-01
+    path    = _artifact_path(artifact_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    offsets = np.r_[0, np.cumsum([len(hours) for hours, _ in out])].astype(np.int64)
+    hours   = np.concatenate([hours for hours, _ in out]) if out else np.empty(0, dtype=np.int64)
+    values  = np.concatenate([values for _, values in out]) if out else np.empty(0)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, hours=hours.astype(np.int64) + start_hour, values=values, offsets=offsets)
+    os.replace(path + '.tmp', path)
+
+
+def Read_EPA_Build(artifact_dir):
+    #--state of the build: {stage: {'key', 'outputs', 'time', 'built'}}
+    try:
+        with open(os.path.join(artifact_dir, 'build.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def Write_EPA_Build(artifact_dir, build):
+    os.makedirs(artifact_dir, exist_ok=True)
+    path = os.path.join(artifact_dir, 'build.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(build, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def Build_EPA_Stage(build, name, key, outputs, func, force=False):
+    #--run func() if the key of the stage changed or one of its outputs (paths)
+    #  is missing, and record the key in build (dict of Read_EPA_Build);
+    #  returns 'built' or 'unchanged'
+    entry   = build.get(name, {})
+    outputs = [path for path in outputs if path is not None]
+    if not force and entry.get('key') == key and all(os.path.exists(p) for p in outputs):
+        return 'unchanged'
+    t0 = time.perf_counter()
+    func()
+    build[name] = {'key': key, 'outputs': outputs, 'time': time.perf_counter() - t0,
+                   'built': datetime.now().isoformat(timespec='seconds')}
+    return 'built'
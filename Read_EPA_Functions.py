@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions to read the yearly EPA files (made by get_EPA_files):
+    Read_EPA_File, Read_EPA_Stream & Read_EPA_Cached (Read_EPA_Rows selects one)
+    Read_EPA_Daily (daily_* files)
+    
+Read_EPA_File reads only the columns needed for the extraction with compact 
+types (small integers for codes, category for Parameter Name, float64 or 
+float32 for Sample Measurement). The fixed width 'Date GMT' and 'Time GMT' 
+fields are decoded directly to integer hours (from 1970-01-01) with vectorized
+arithmetic (Decode_EPA_Date/Time) and stored in the 'Hour GMT' column.
+
+Read_EPA_Stream is for very large files (e.g. hourly_WIND_YYYY): the file is 
+read in chunks of fixed number of rows and only the rows of requested stations
+and instruments are kept, so the peak memory is set by the chunk size.
+
+Read_EPA_Cached keeps a persistent binary copy of each yearly file in the 
+cache folder (one subfolder per file with one .npy file per column and the 
+manifest.json). The rows are sorted by station and instrument 
+(State Code, County Code, Site Num, POC) and the manifest stores the row range
+of each of them, so only the rows of requested stations are read (memory 
+mapped) on later runs. The cache of a file is rebuilt when the size or the 
+modification time (or the sha256 hash, check='hash') of the source file changes.
+The build reads the whole file, so with chunksize (bounded memory) a valid 
+cache is read but a missing or old one is not built: the file is read with 
+Read_EPA_Stream.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import pandas as pd
+import numpy as np
+
+
+#--columns of the yearly files needed for the extraction and their compact 
+#  types (State Code is read as category since it is not always numeric, 
+#  e.g. 'CC' for Canada; 'Date GMT' and 'Time GMT' are decoded per category) 
+EPA_COLUMNS = {
+    "State Code"        : 'category',
+    "County Code"       : np.int16,
+    "Site Num"          : np.int16,
+    "POC"               : np.int8,
+    "Parameter Name"    : 'category',
+    "Date GMT"          : 'category',
+    "Time GMT"          : 'category',
+    "Sample Measurement": np.float64,
+}
+EPA_KEY_COLUMNS = ["State Code", "County Code", "Site Num", "POC"]
+
+#--code of the dates that could not be decoded, it is far outside any grid
+EPA_MISSING_DAY = -10**9
+
+
+def Decode_EPA_Date(dates):
+    #--fixed width 'YYYY-MM-DD' strings to integer days from 1970-01-01 
+    #  (proleptic Gregorian calendar, days-from-civil algorithm)
+    d   = np.asarray(dates).astype('S10').view(np.uint8).reshape(-1, 10).astype(np.int64) - 48
+    y   = d[:, 0]*1000 + d[:, 1]*100 + d[:, 2]*10 + d[:, 3]
+    m   = d[:, 5]*10 + d[:, 6]
+    day = d[:, 8]*10 + d[:, 9]
+    
+    y   = y - (m <= 2)
+    era = y // 400
+    yoe = y - era*400
+    doy = (153*np.where(m > 2, m - 3, m + 9) + 2)//5 + day - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468
+
+
+def Decode_EPA_Time(times):
+    #--fixed width 'HH:MM' strings to integer hours
+    t = np.asarray(times).astype('S5').view(np.uint8).reshape(-1, 5).astype(np.int64) - 48
+    return t[:, 0]*10 + t[:, 1]
+
+
+def _decode_categories(col, decoder, missing):
+    #--decode only the unique values (categories) and spread them to the rows, 
+    #  the missing values (code -1) take the last appended element
+    values = np.append(decoder(col.cat.categories.to_numpy()), missing)
+    return values[col.cat.codes.to_numpy()]
+
+
+def _read_csv_options(wind, value_dtype):
+    #--columns and their types for pd.read_csv
+    cols  = [c for c in EPA_COLUMNS if wind or c != "Parameter Name"]
+    dtype = {c: EPA_COLUMNS[c] for c in cols}
+    dtype["Sample Measurement"] = value_dtype
+    return {'usecols': cols, 'dtype': dtype}
+
+
+def _decode_EPA_states(VARin):
+    #--numeric State Code, the codes that are not numeric get -1
+    states = pd.to_numeric(VARin["State Code"].cat.categories, errors='coerce')
+    states = np.append(np.nan_to_num(np.asarray(states, dtype=float), nan=-1), -1)
+    VARin["State Code"] = states.astype(np.int16)[VARin["State Code"].cat.codes.to_numpy()]
+    return VARin
+
+
+def _decode_EPA_frame(VARin, timing=None):
+    #--numeric State Code and integer hours; the time of the decoding and the
+    #  number of rows are added to 'timing' (if given)
+    t0     = time.perf_counter()
+    _decode_EPA_states(VARin)
+    
+    #--decode the dates and times to the integer hours
+    days  = _decode_categories(VARin["Date GMT"], Decode_EPA_Date, EPA_MISSING_DAY)
+    hours = _decode_categories(VARin["Time GMT"], Decode_EPA_Time, 0)
+    VARin["Hour GMT"] = days*24 + hours
+    if timing is not None:
+        timing['decode'] = timing.get('decode', 0) + time.perf_counter() - t0
+        timing['rows']   = timing.get('rows', 0) + len(VARin)
+    return VARin.drop(columns=["Date GMT", "Time GMT"])
+
+
+def Read_EPA_File(file_path, wind=False, value_dtype=np.float64, timing=None):
+    #--read the yearly file: station/instrument codes, Parameter Name (only for
+    #  wind), Sample Measurement and 'Hour GMT' (integer hours from 1970-01-01)
+    return _decode_EPA_frame(pd.read_csv(file_path, **_read_csv_options(wind, value_dtype)), timing)
+
+
+def Read_EPA_Daily(file_path, value_column='Arithmetic Mean', value_dtype=np.float64):
+    #--read the EPA daily file (daily_* files, or made from them by 
+    #  get_EPA_files): station/instrument codes, 'Day Local' (integer days from
+    #  1970-01-01 of 'Date Local'), the value_column (e.g. 'Arithmetic Mean' or
+    #  '1st Max Value') as Sample Measurement and 'Sample Duration' if the file
+    #  has it (e.g. '24 HOUR', '1 HOUR' rows of the same day)
+    header = pd.read_csv(file_path, nrows=0).columns
+    dtype  = {c: EPA_COLUMNS[c] for c in EPA_KEY_COLUMNS}
+    dtype.update({"Date Local": 'category', value_column: value_dtype})
+    if "Sample Duration" in header:
+        dtype["Sample Duration"] = 'category'
+    VARin  = _decode_EPA_states(pd.read_csv(file_path, usecols=list(dtype), dtype=dtype))
+    VARin["Day Local"] = _decode_categories(VARin["Date Local"], Decode_EPA_Date, EPA_MISSING_DAY)
+    return VARin.drop(columns="Date Local").rename(columns={value_column: "Sample Measurement"})
+
+
+def EPA_Station_Code(state, county, site, poc):
+    #--one int64 code per station/POC key (State Code < 100, County Code < 1000,
+    #  Site Num < 10000, POC < 100), used to filter the rows with np.isin
+    return ((np.asarray(state, dtype=np.int64)*1000 + np.asarray(county, dtype=np.int64))*10000 +
+            np.asarray(site, dtype=np.int64))*100 + np.asarray(poc, dtype=np.int64)
+
+
+def Read_EPA_Stream(file_path, keys, wind=False, chunksize=1000000, value_dtype=np.float64,
+                    timing=None):
+    #--read the yearly file in chunks of 'chunksize' rows and keep only the rows
+    #  of the station/POC keys (State Code, County Code, Site Num, POC); the 
+    #  memory is set by chunksize and the kept rows, not by the file size. The 
+    #  output is the same as Read_EPA_File restricted to the keys (file order)
+    wanted = [k for k in map(_cache_key, keys) if k is not None]
+    codes  = EPA_Station_Code(*np.array(wanted, dtype=np.int64).reshape(-1, 4).T)
+    
+    kept = []
+    with pd.read_csv(file_path, chunksize=chunksize, **_read_csv_options(wind, value_dtype)) as reader:
+        for chunk in reader:
+            chunk = _decode_EPA_frame(chunk, timing)
+            IndK  = np.isin(EPA_Station_Code(*(chunk[c].to_numpy() for c in EPA_KEY_COLUMNS)), codes)
+            kept.append(chunk[IndK])
+    
+    VARin = pd.concat(kept, ignore_index=True)
+    if wind:
+        #--the chunks have different categories, merge them to one
+        VARin["Parameter Name"] = VARin["Parameter Name"].astype('category')
+    return VARin
+
+
+def Read_EPA_Rows(file_path, keys, wind=False, cache_dir=None, chunksize=None,
+                  value_dtype=np.float64, timing=None):
+    #--read the rows of the station/POC keys from the yearly file: from the 
+    #  cache if cache_dir is set, in chunks if chunksize is set, otherwise all 
+    #  rows of the file with Read_EPA_File; with both set the cache is read if
+    #  it is valid, but it is not built (the build reads the whole file), the 
+    #  file is read in chunks instead. 'timing' (dict, optional) gets the
+    #  time of the date decoding and the number of rows read
+    if cache_dir is not None:
+        return Read_EPA_Cached(file_path, keys, wind=wind, cache_dir=cache_dir,
+                               value_dtype=value_dtype, timing=timing, chunksize=chunksize)
+    if chunksize is not None:
+        return Read_EPA_Stream(file_path, keys, wind=wind, chunksize=chunksize,
+                               value_dtype=value_dtype, timing=timing)
+    return Read_EPA_File(file_path, wind=wind, value_dtype=value_dtype, timing=timing)
+
+
+#--version of the cache layout, the caches with other version are rebuilt
+EPA_CACHE_VERSION = 1
+
+
+def EPA_File_Signature(file_path, check='mtime'):
+    #--signature of the source file used to invalidate the cache
+    stat = os.stat(file_path)
+    sign = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if check == 'hash':
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        sign = {'size': stat.st_size, 'sha256': sha.hexdigest()}
+    elif check != 'mtime':
+        raise ValueError(f"Unknown cache check '{check}', use 'mtime' or 'hash'")
+    return sign
+
+
+def EPA_Cache_Path(file_path, cache_dir):
+    #--cache subfolder of the yearly file, e.g. cache_dir/WIND_2021
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(file_path))[0])
+
+
+def _read_manifest(cache_path):
+    try:
+        with open(os.path.join(cache_path, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def Build_EPA_Cache(file_path, cache_dir, check='mtime'):
+    #--convert the yearly file to the cache: columns sorted by station/POC 
+    #  (stable, rows of one station stay in the file order) and the row range 
+    #  of every station/POC in the manifest
+    VARin  = Read_EPA_File(file_path, wind="Parameter Name" in
+                           pd.read_csv(file_path, nrows=0).columns)
+    order  = np.lexsort([VARin[c].to_numpy() for c in EPA_KEY_COLUMNS[::-1]])
+    keys   = np.column_stack([VARin[c].to_numpy()[order] for c in EPA_KEY_COLUMNS])
+    
+    #--first row of each station/POC in the sorted columns
+    starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)]) if len(keys) \
+             else np.empty(0, dtype=np.int64)
+    ends   = np.r_[starts[1:], len(keys)]
+    
+    #--write to the temporary folder and replace the old cache at the end
+    cache_path = EPA_Cache_Path(file_path, cache_dir)
+    tmp_path   = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    
+    manifest = {'version': EPA_CACHE_VERSION,
+                'source' : EPA_File_Signature(file_path, check),
+                'columns': [],
+                'keys'   : keys[starts].tolist(),
+                'rows'   : np.column_stack((starts, ends)).tolist()}
+    for c in VARin.columns:
+        col = VARin[c]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            manifest.setdefault('categories', {})[c] = col.cat.categories.tolist()
+            col = col.cat.codes
+        np.save(os.path.join(tmp_path, c + '.npy'), col.to_numpy()[order])
+        manifest['columns'].append(c)
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+    return manifest
+
+
+def _cache_key(key):
+    #--station/POC key as tuple of int, None if it has missing values (e.g. no POC)
+    try:
+        return tuple(int(k) for k in key)
+    except (TypeError, ValueError):
+        return None
+
+
+def Read_EPA_Cached(file_path, keys, wind=False, cache_dir='EPA_FILES/CACHE', check='mtime',
+                    value_dtype=np.float64, timing=None, chunksize=None):
+    #--read only the rows of the station/POC keys (State Code, County Code, 
+    #  Site Num, POC) from the cache of the yearly file, the cache is built
+    #  (or rebuilt) if it does not match the source file; the output has the 
+    #  same columns as Read_EPA_File. With chunksize the cache is not built
+    #  (Build_EPA_Cache holds the whole file in memory): the file without a 
+    #  valid cache is read with Read_EPA_Stream
+    cache_path = EPA_Cache_Path(file_path, cache_dir)
+    manifest   = _read_manifest(cache_path)
+    if manifest is None or manifest.get('version') != EPA_CACHE_VERSION or \
+       manifest['source'] != EPA_File_Signature(file_path, check) or \
+       (wind and "Parameter Name" not in manifest['columns']):
+        if chunksize is not None:
+            return Read_EPA_Stream(file_path, keys, wind=wind, chunksize=chunksize,
+                                   value_dtype=value_dtype, timing=timing)
+        manifest = Build_EPA_Cache(file_path, cache_dir, check)
+    
+    #--row ranges of the requested keys (each key once, in the requested order)
+    ranges = dict(zip(map(tuple, manifest['keys']), map(tuple, manifest['rows'])))
+    wanted = dict.fromkeys(k for k in map(_cache_key, keys) if k in ranges)
+    slices = [ranges[k] for k in wanted]
+    
+    cols = [c for c in manifest['columns'] if wind or c != "Parameter Name"]
+    data = {}
+    for c in cols:
+        arr = np.load(os.path.join(cache_path, c + '.npy'), mmap_mode='r')
+        data[c] = np.concatenate([arr[r0:r1] for r0, r1 in slices] or [arr[0:0]])
+        if c in manifest.get('categories', {}):
+            data[c] = pd.Categorical.from_codes(data[c], manifest['categories'][c])
+    data["Sample Measurement"] = data["Sample Measurement"].astype(value_dtype, copy=False)
+    if timing is not None:
+        #--the dates are decoded in the cache, only the rows of the keys are read
+        timing['rows'] = timing.get('rows', 0) + len(data["Sample Measurement"])
+    return pd.DataFrame(data, columns=cols)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions for the run report of Sort_EPA_Files.py:
+    EPA_Stage, EPA_Coverage, Summarize_EPA_Report, Write_EPA_Report,
+    Write_EPA_Completeness, Peak_EPA_RSS & Profile_EPA_Run
+
+The report is a dictionary written as JSON at the end of the run (also if the
+run fails, with the error). The extraction functions (Extract_EPA_Parameters,
+Update_EPA_Parameters with stats={}) add the time of every (file, year) task:
+file read, timestamp decoding and station partitioning, the rows read and the
+rows kept (of the requested stations) and the peak RSS of the process that
+ran the task, the time of the grid alignment of every output variable and the
+time spent waiting for the prefetched files ('prefetch_wait', workers=1: near
+0 if the reads are hidden behind the processing, the read time if the run is
+limited by the disk).
+EPA_Stage measures the main stages of the program (e.g. extraction and .mat
+write), EPA_Coverage gives the ratio of the hours with data of every station
+and Summarize_EPA_Report sums the task times per file and per year, to find
+the slow variable or year.
+
+Write_EPA_Completeness writes the completeness table of the extraction (ratio
+of the hours with data of every station, variable and year, counted before
+the alignment) as .csv, one row per station and variable (with its POC) and
+one column per year and for the whole range, to choose the stations of the
+next runs.
+
+Profile_EPA_Run runs the program with cProfile (.prof file, e.g. for snakeviz
+or pstats) or pyinstrument (.html, if it is installed).
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import sys
+import json
+import time
+import cProfile
+import numpy as np
+import pandas as pd
+from   contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:             # not on Windows
+    resource = None
+
+
+def Peak_EPA_RSS(children=False):
+    #--peak resident memory (MB) of this process (or of its finished child
+    #  processes, e.g. the workers), None if it is not known
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    #--kilobytes on Linux, bytes on macOS
+    return rss/2**20 if sys.platform == 'darwin' else rss/2**10
+
+
+@contextmanager
+def EPA_Stage(report, name):
+    #--add the wall time of the block to report['stages'][name] (seconds)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages       = report.setdefault('stages', {})
+        stages[name] = stages.get(name, 0) + time.perf_counter() - t0
+
+
+def EPA_Coverage(data_dict, names, fill_value):
+    #--ratio of the hours with data (not fill_value) of every station,
+    #  {output name: [ratio of station 0, ...]}
+    coverage = {}
+    for name in names:
+        data  = data_dict[name]
+        valid = ~np.isnan(data) if np.isnan(fill_value) else (data != fill_value) & ~np.isnan(data)
+        coverage[name] = np.round(valid.mean(axis=1), 4).tolist() if data.shape[1] else []
+    return coverage
+
+
+def Summarize_EPA_Report(report):
+    #--sums of the task times and rows per file and per year, the slowest task first
+    tasks = sorted(report.get('tasks', []), key=lambda t: -t['time'])
+    report['tasks'] = tasks
+    for field, key in (('by_file', 'file'), ('by_year', 'year')):
+        sums = {}
+        for task in tasks:
+            s = sums.setdefault(str(task[key]), {'time': 0, 'rows_read': 0, 'rows_kept': 0})
+            for k in s:
+                s[k] += task[k]
+        report[field] = sums
+    report['peak_rss_mb'] = Peak_EPA_RSS()
+    report['peak_rss_children_mb'] = Peak_EPA_RSS(children=True)
+    return report
+
+
+def Write_EPA_Report(path, report):
+    #--write the report as JSON (numpy numbers are converted)
+    def convert(x):
+        return x.item() if isinstance(x, np.generic) else str(x)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1, default=convert)
+
+
+def Write_EPA_Completeness(path, completeness, ID_stat, specs, years):
+    #--write the completeness ({name: stations x years}, Extract_EPA_Parameters)
+    #  of the stations (rows of ID_stat) and specs as .csv; returns the table
+    hours  = np.array([(np.datetime64(f'{y + 1}', 'h') - np.datetime64(f'{y}', 'h')).astype(int)
+                       for y in years])
+    tables = []
+    for name, fname_prefix, parameter, POC in specs:
+        ratio = np.atleast_2d(completeness[name])
+        table = pd.DataFrame(np.asarray(ID_stat)[:, 0:3], columns=['State Code', 'County Code',
+                                                                  'Site Number'])
+        table['Variable'] = name
+        table['POC']      = pd.array(np.asarray(POC, dtype=float)).astype('Int64')
+        for k, year in enumerate(years):
+            table[str(year)] = np.round(ratio[:, k], 4)
+        table['All'] = np.round(ratio @ hours/hours.sum(), 4)
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+    table.to_csv(path, index=False)
+    return table
+
+
+def Profile_EPA_Run(func, profiler=None, out_path='EPA_profile'):
+    #--run func() and return its output; with profiler='cprofile' the stats
+    #  are written to out_path.prof, with 'pyinstrument' to out_path.html
+    if profiler is None:
+        return func()
+    if profiler == 'cprofile':
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(func)
+        finally:
+            prof.dump_stats(out_path + '.prof')
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        prof = Profiler()
+        prof.start()
+        try:
+            return func()
+        finally:
+            prof.stop()
+            with open(out_path + '.html', 'w') as f:
+                f.write(prof.output_html())
+    raise ValueError(f"Unknown profiler '{profiler}', use None, 'cprofile' or 'pyinstrument'")
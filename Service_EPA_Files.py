@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+This program runs the local query service of the station series: it answers
+the requests of the hourly values of one station, POC and variable in a time
+window from the local yearly files (made by Get_EPA_Files.py), with an LRU
+cache of the aligned series in memory (see Service_EPA_Functions.py). It does
+not need the network (only the local requests) or a run of Sort_EPA_Files.py.
+
+Usage: edit SET OPTIONS and run the program, then e.g.
+    curl "http://127.0.0.1:8765/series?name=WS&state=6&county=37&site=1103&poc=1&start=2021-03-01T00&end=2021-03-07T23"
+    curl "http://127.0.0.1:8765/stats"
+#******************************************************************************
+#                               SET OPTIONS:
+#******************************************************************************
+files_dir   = 'EPA_FILES/'              # set path of EPA files folder
+cache_dir   = 'EPA_FILES/CACHE/'        # binary copy of EPA files sorted by station
+                                        # (only the stations of a request are read)
+parameters  = {'WS'  : ['WIND', 'Wind Speed - Resultant'],     # name: file prefix,
+               'WD'  : ['WIND', 'Wind Direction - Resultant'], # Parameter Name filter
+               'TEMP': ['TEMP', None],
+               'PM10': ['PM10', None]}
+duplicates  = 'first'                   # value kept if an hour repeats at a station
+out_dtype   = 'float64'                 # type of the cached arrays (or 'float32')
+max_mb      = 256                       # size of the cache of the series (MB)
+batch_wait  = 0.02                      # seconds the first request of a file waits
+                                        # for the requests of the same file
+host        = '127.0.0.1'               # address and port of the service
+port        = 8765
+verbose     = False                     # print every request
+*******************************************************************************
+or use the command line (python Service_EPA_Files.py --port 9000 --max_mb 1024)
+or Python:
+    from Service_EPA_Functions import EPA_Series_Service, Query_EPA_Series
+    service = EPA_Series_Service('EPA_FILES/', {'WS': ('WIND', 'Wind Speed - Resultant')})
+    h0, values = Query_EPA_Series(service, 'WS', (6, 37, 1103), 1, '2021-03-01T00',
+                                  '2021-03-07T23')
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import sys
+from   Options_EPA_Functions import Merge_EPA_Options, Parse_EPA_Options
+
+
+#******************************************************************************
+#                               SET OPTIONS:
+#******************************************************************************
+files_dir   = 'EPA_FILES/'
+cache_dir   = 'EPA_FILES/CACHE/'
+parameters  = {'WS'  : ['WIND', 'Wind Speed - Resultant'],
+               'WD'  : ['WIND', 'Wind Direction - Resultant'],
+               'TEMP': ['TEMP', None],
+               'PM10': ['PM10', None]}
+duplicates  = 'first'
+out_dtype   = 'float64'
+max_mb      = 256
+batch_wait  = 0.02
+host        = '127.0.0.1'
+port        = 8765
+verbose     = False
+
+#--the options above are the defaults of serve_EPA and of the command line
+#  (names of the config file and of the flags)
+EPA_SERVICE_OPTIONS = {'files_dir': files_dir, 'cache_dir': cache_dir, 'parameters': parameters,
+                       'duplicates': duplicates, 'out_dtype': out_dtype, 'max_mb': max_mb,
+                       'batch_wait': batch_wait, 'host': host, 'port': port, 'verbose': verbose}
+
+#******************************************************************************
+#                               PROGRAM
+#******************************************************************************
+def serve_EPA(options=None):
+    #--run the service with the options (dictionary, the missing options are
+    #  the defaults of SET OPTIONS) until the process is stopped
+    from Service_EPA_Functions import EPA_Series_Service, Serve_EPA_Series
+
+    opt     = Merge_EPA_Options(EPA_SERVICE_OPTIONS, options)
+    service = EPA_Series_Service(opt['files_dir'], opt['parameters'], opt['cache_dir'],
+                                 opt['max_mb'], opt['batch_wait'], opt['duplicates'],
+                                 opt['out_dtype'])
+    print(f"Serving the EPA series on http://{opt['host']}:{opt['port']}/series")
+    Serve_EPA_Series(service, opt['host'], int(opt['port']), opt['verbose'])
+
+
+def main(argv=None):
+    #--command line: python Service_EPA_Files.py [--config service.json] [--<option> value ...]
+    options = Parse_EPA_Options(EPA_SERVICE_OPTIONS, argv, __doc__)
+    try:
+        serve_EPA(options)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print("An error occurred in the service:", e)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
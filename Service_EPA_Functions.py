@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions of the local query service of the station series (Service_EPA_Files.py):
+    EPA_Series_Cache, Get_EPA_Cached, Put_EPA_Cached,
+    EPA_Series_Service, Load_EPA_Pieces, Query_EPA_Series & Serve_EPA_Series
+
+The service answers the requests "series of the variable <name> of the
+station (State Code, County Code, Site Number) and POC from hour A to hour B"
+from the local yearly files (files_dir, and the cache of the files sorted by
+station if cache_dir is set), without a run of Sort_EPA_Files.py and without
+any network access.
+
+The series of one station and POC in one yearly file is read with the
+extraction functions (Read_EPA_Year, Split_EPA_Year) and aligned to its own
+hourly array (Align_EPA_Hourly with the 'duplicates' policy): the piece. The
+pieces are kept in a size-bounded LRU cache (EPA_Series_Cache, max_mb of
+arrays, the least recently used pieces are dropped). A request takes the
+pieces of the yearly files that can have its hours (the files are by local
+date, the year before and after are also used) and copies the hours of the
+window, so a request of cached pieces takes a few milliseconds.
+
+The pieces missing in the cache are read from the disk in batches: the first
+request of a yearly file waits batch_wait seconds, the concurrent requests of
+the same file add their stations to its batch and the file is read once for
+all of them (Load_EPA_Pieces). The requests that come during the read wait
+for it and make the next batch together.
+
+Serve_EPA_Series answers the requests over HTTP (threads, one per request):
+    GET /series?name=WS&state=6&county=37&site=1103&poc=1
+               &start=2021-03-01T00&end=2021-03-07T23
+        {"name", "station", "poc", "start", "end", "values"}: one value per
+        hour from start to end (GMT, end included), null for the missing hours
+    GET /stats
+        hits and misses of the cache, cached pieces and MB, files read, batches
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from   collections  import OrderedDict
+from   urllib.parse import urlparse, parse_qs
+from   http.server  import BaseHTTPRequestHandler, ThreadingHTTPServer
+from   Sort_EPA_Functions import Read_EPA_Year, Split_EPA_Year, Align_EPA_Hourly, EPA_File_Path
+
+
+def EPA_Series_Cache(max_mb=256):
+    #--empty LRU cache of the pieces (at most max_mb MB of arrays)
+    return {'items': OrderedDict(), 'bytes': 0, 'max_bytes': int(max_mb*2**20),
+            'lock': threading.Lock(), 'hits': 0, 'misses': 0}
+
+
+def Get_EPA_Cached(cache, key):
+    #--piece of the key (the most recently used from now on), None if not cached
+    with cache['lock']:
+        piece = cache['items'].get(key)
+        if piece is None:
+            cache['misses'] += 1
+            return None
+        cache['items'].move_to_end(key)
+        cache['hits'] += 1
+        return piece
+
+
+def Put_EPA_Cached(cache, key, piece):
+    #--add the piece (first hour, array) and drop the least recently used
+    #  pieces over the size limit
+    with cache['lock']:
+        old = cache['items'].pop(key, None)
+        if old is not None:
+            cache['bytes'] -= old[1].nbytes
+        cache['items'][key] = piece
+        cache['bytes'] += piece[1].nbytes
+        while cache['bytes'] > cache['max_bytes'] and len(cache['items']) > 1:
+            _, (_, arr) = cache['items'].popitem(last=False)
+            cache['bytes'] -= arr.nbytes
+
+
+def EPA_Series_Service(files_dir, parameters, cache_dir=None, max_mb=256, batch_wait=0.02,
+                       duplicates='first', value_dtype=np.float64):
+    #--state of the service: parameters is {name: (file prefix, Parameter
+    #  Name filter or None)}, e.g. {'WS': ('WIND', 'Wind Speed - Resultant')}
+    parameters = {name: (prefix, parameter) for name, (prefix, parameter) in parameters.items()}
+    wind       = {}
+    for prefix, parameter in parameters.values():
+        wind[prefix] = wind.get(prefix, False) or parameter is not None
+    return {'files_dir': files_dir, 'cache_dir': cache_dir, 'parameters': parameters,
+            'wind': wind, 'cache': EPA_Series_Cache(max_mb), 'batch_wait': batch_wait,
+            'duplicates': duplicates, 'value_dtype': np.dtype(value_dtype),
+            'batches': {}, 'lock': threading.Lock(), 'reads': 0, 'batched': 0}
+
+
+def _EPA_Piece(hours, values, duplicates, value_dtype):
+    #--series of one key aligned to its hourly array: (first hour from
+    #  1970-01-01, array with nan for the missing hours)
+    if len(hours) == 0:
+        return 0, np.empty(0, dtype=value_dtype)
+    h0  = int(hours.min())
+    arr = np.full(int(hours.max()) - h0 + 1, np.nan, dtype=value_dtype)
+    return h0, Align_EPA_Hourly(hours - h0, values, arr, duplicates)
+
+
+def Load_EPA_Pieces(service, fname_prefix, year, keys):
+    #--pieces of the keys in the yearly file, read in one batch with the keys
+    #  of the concurrent requests of the same file (all pieces of the batch are
+    #  cached); {key: piece}, the file that does not exist has no data (empty
+    #  pieces, cached as the others). The batch is open for batch_wait 
+    #  seconds, the requests that come during its read wait for it, take their
+    #  pieces from the cache if it had them and make the next batch with the 
+    #  rest; so one file is read by one thread at a time (also the cache of 
+    #  the file is built once)
+    name   = (fname_prefix, year)
+    pieces = {}
+    keys   = list(keys)
+    while keys:
+        with service['lock']:
+            batch  = service['batches'].get(name)
+            leader = batch is None
+            if leader:
+                batch = service['batches'][name] = {'keys': set(), 'done': threading.Event(),
+                                                    'out': {}, 'error': None, 'reading': False}
+            if not batch['reading']:
+                if not leader:
+                    service['batched'] += 1
+                batch['keys'].update(keys)
+        
+        if batch['reading']:
+            #--wait for the read, then the missing keys go to the next batch
+            batch['done'].wait()
+            for key in keys:
+                piece = Get_EPA_Cached(service['cache'], (fname_prefix, year, key))
+                if piece is None:
+                    piece = batch['out'].get(key)
+                if piece is not None:
+                    pieces[key] = piece
+            keys = [key for key in keys if key not in pieces]
+            continue
+        
+        if leader:
+            #--wait for the concurrent requests, then close the batch and read
+            time.sleep(service['batch_wait'])
+            with service['lock']:
+                batch['reading'] = True
+                batchKeys = sorted(batch['keys'], key=str)
+            try:
+                #--the file that does not exist gives empty pieces (cached too,
+                #  the years at the edges of the archive are not looked up again)
+                file_path = EPA_File_Path(service['files_dir'], fname_prefix, year)
+                parts     = [(np.empty(0), np.empty(0))]*len(batchKeys)
+                if os.path.exists(file_path):
+                    VARin, _ = Read_EPA_Year(file_path, batchKeys, service['wind'][fname_prefix],
+                                             service['cache_dir'],
+                                             value_dtype=service['value_dtype'])
+                    parts    = Split_EPA_Year(VARin, 0, batchKeys, service['wind'][fname_prefix])
+                    with service['lock']:
+                        service['reads'] += 1
+                for key, (hours, values) in zip(batchKeys, parts):
+                    batch['out'][key] = _EPA_Piece(hours, values, service['duplicates'],
+                                                   service['value_dtype'])
+                    Put_EPA_Cached(service['cache'], (fname_prefix, year, key), batch['out'][key])
+            except Exception as e:
+                batch['error'] = e
+            finally:
+                with service['lock']:
+                    del service['batches'][name]
+                batch['done'].set()
+        else:
+            batch['done'].wait()
+        
+        if batch['error'] is not None:
+            raise batch['error']
+        empty = _EPA_Piece(np.empty(0), np.empty(0), service['duplicates'], service['value_dtype'])
+        pieces.update({key: batch['out'].get(key, empty) for key in keys})
+        keys = []
+    return pieces
+
+
+def EPA_Hour(date):
+    #--hours from 1970-01-01 of a datetime or 'YYYY-MM-DDTHH' (GMT)
+    return int(np.datetime64(date, 'h').astype(np.int64))
+
+
+def Query_EPA_Series(service, name, station, POC, start, end):
+    #--hourly values of the variable 'name' of the station (State Code, County
+    #  Code, Site Number) and POC from start to end (datetime or 'YYYY-MM-DDTHH',
+    #  GMT, end included), nan for the missing hours; returns (first hour, values)
+    if name not in service['parameters']:
+        raise ValueError(f"Unknown name '{name}', use one of {sorted(service['parameters'])}")
+    fname_prefix, parameter = service['parameters'][name]
+    key    = tuple(int(c) for c in station[0:3]) + (int(POC),) + ((parameter,) if parameter else ())
+    h0, h1 = EPA_Hour(start), EPA_Hour(end) + 1
+    if h1 <= h0:
+        raise ValueError(f'The end {end} is before the start {start}')
+    out    = np.full(h1 - h0, np.nan, dtype=service['value_dtype'])
+
+    #--the yearly files (local dates) with the hours of the window, in order;
+    #  the hour from the first file is kept (as duplicates='first' of the merge)
+    year0  = (np.datetime64(h0 - 24, 'h').astype('datetime64[Y]').astype(int) + 1970)
+    year1  = (np.datetime64(h1 + 24, 'h').astype('datetime64[Y]').astype(int) + 1970)
+    for year in range(year0, year1 + 1):
+        piece = Get_EPA_Cached(service['cache'], (fname_prefix, year, key))
+        if piece is None:
+            piece = Load_EPA_Pieces(service, fname_prefix, year, [key])[key]
+        p0, arr = piece
+        i0, i1  = max(h0, p0), min(h1, p0 + len(arr))
+        if i1 > i0:
+            seg  = out[i0 - h0:i1 - h0]
+            new  = arr[i0 - p0:i1 - p0]
+            fill = np.isnan(seg)
+            seg[fill] = new[fill]
+    return h0, out
+
+
+def EPA_Service_Stats(service):
+    #--counters of the service (for GET /stats)
+    cache = service['cache']
+    with cache['lock']:
+        return {'hits': cache['hits'], 'misses': cache['misses'], 'pieces': len(cache['items']),
+                'cached_mb': cache['bytes']/2**20, 'max_mb': cache['max_bytes']/2**20,
+                'reads': service['reads'], 'batched': service['batched']}
+
+
+class _EPA_Handler(BaseHTTPRequestHandler):
+    #--HTTP requests of Serve_EPA_Series (the service is server.service)
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url   = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == '/stats':
+                return self.reply(200, EPA_Service_Stats(self.server.service))
+            if url.path != '/series':
+                return self.reply(404, {'error': f'Unknown path {url.path}, use /series or /stats'})
+            station = [query['state'], query['county'], query['site']]
+            h0, out = Query_EPA_Series(self.server.service, query['name'], station, query['poc'],
+                                       query['start'], query['end'])
+        except KeyError as e:
+            return self.reply(400, {'error': f'Missing parameter {e}'})
+        except ValueError as e:
+            return self.reply(400, {'error': str(e)})
+        except Exception as e:
+            return self.reply(500, {'error': f'{type(e).__name__}: {e}'})
+        self.reply(200, {'name': query['name'], 'station': [int(c) for c in station],
+                         'poc': int(query['poc']), 'start': str(np.datetime64(h0, 'h')),
+                         'end': str(np.datetime64(h0 + len(out) - 1, 'h')),
+                         'values': [None if v != v else v for v in out.tolist()]})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def Serve_EPA_Series(service, host='127.0.0.1', port=8765, verbose=False):
+    #--answer the HTTP requests of the series until the process is stopped
+    server = ThreadingHTTPServer((host, port), _EPA_Handler)
+    server.daemon_threads = True
+    server.service        = service
+    server.verbose        = verbose
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -26,10 +26,72 @@ INPUT columns in Meta_File.csv are:
        metaFname         = 'Meta_File.csv'
        files_dir         = 'EPA_FILES/'         # set path of EPA files folder
        fname_prefixW     = 'WIND'               # set prefixes for WIND and Vars files
-       fname_prefixVars  = np.array(['PM10'])   # it is also used for names of output 
+       fname_prefixVars  = ['PM10']             # it is also used for names of output 
                                                 # variables in the output .mat file
        POCs              = ["POC PM10"]         # use names same as you define in
                                                 # Meta_File.csv
+       duplicates        = 'first'              # value kept if an hour repeats at a
+                                                # station: 'first','last','mean','error'
+       cache_dir         = 'EPA_FILES/CACHE/'   # binary copy of EPA files sorted by
+                                                # station (None to read .csv files only)
+       chunksize         = None                 # read .csv files in chunks of rows to
+                                                # limit memory (e.g. 1000000); a valid
+                                                # cache is still read, but a missing or
+                                                # old one is not built (the build reads
+                                                # the whole file)
+       workers           = 1                    # number of processes, the (file, year)
+                                                # tasks run in parallel if > 1
+       prefetch          = 1                    # files read ahead in a background thread,
+                                                # only if workers = 1 (0: no prefetch)
+       artifact_dir      = None                 # outputs of the (file, year) tasks stored
+                                                # by the content of their inputs and reused
+                                                # in the later runs (e.g. 'ARTIFACTS/')
+       out_dtype         = 'float64'            # type of output arrays (or 'float32')
+       fill_value        = -999.9               # missing data code (or float('nan'))
+       update            = False                # if True and the output file exists,
+                                                # only new/changed years and new stations
+                                                # are extracted, the rest is copied
+       report_path       = 'EPA_report.json'    # JSON run report: time of every stage and
+                                                # (file, year) task, rows read/kept, coverage
+                                                # of every station, peak RSS (None: no report)
+       profiler          = None                 # 'cprofile' or 'pyinstrument' to profile
+       profile_path      = 'EPA_profile'        # the run (.prof or .html file)
+       store_dir         = None                 # also write the memory-mapped store (.npy
+                                                # files, e.g. 'EPA_STORE/') to read one
+                                                # station/time window (Read_EPA_Series)
+       arrow_path        = None                 # also write the long-format table (station,
+                                                # POC, variable, hour, value, metadata) as
+                                                # Arrow IPC file (e.g. 'EPA.arrow') and/or
+       parquet_dir       = None                 # Parquet dataset by variable/year ('EPA_PQ/')
+       arrow_table       = False                # return the table in DATA_out['ARROW']
+                                                # (in-process use, pyarrow is needed)
+       aggregate_period  = None                 # 'day', 'month', 'year' or N (hours): also
+                                                # write the aggregated data (EPA_DATA.AGG)
+       aggregate_stats   = ['mean', 'max8h']    # 'mean','max','min','sum','count','max8h'
+                                                # (max of 8-hour rolling means)
+       aggregate_names   = None                 # variables to aggregate (None: all but WD,
+                                                # an angle; e.g. ['WS','PM10'])
+       aggregate_wind    = True                 # vector averages of the wind in EPA_DATA.AGG
+                                                # (U_mean, V_mean, WS_resultant, WD_resultant)
+       wind_components   = False                # also write the hourly u, v (EPA_DATA.WIND)
+       min_coverage      = 0.75                 # min. ratio of hours with data per period
+       write_hourly      = True                 # False: only the aggregated data (smaller
+                                                # .mat file, no update of it is possible)
+       daily_prefixes    = []                   # EPA daily files (e.g. ['daily_PM10'] for
+       daily_POCs        = []                   # daily_PM10_YYYY.csv) and their POC columns
+       daily_duration    = None                 # Sample Duration of the daily rows (e.g.
+                                                # '24 HOUR'), written to EPA_DATA.DAILY
+       min_completeness  = None                 # min. ratio of the hours with data (e.g.
+                                                # 0.75): the other stations are dropped
+                                                # before the alignment (None: keep all)
+       completeness_by   = 'range'              # ratio in the whole range or in 'year'
+                                                # (every year)
+       completeness_names= None                 # variables checked (None: all, e.g. ['PM10'])
+       completeness_path = None                 # .csv table of the completeness (station x
+                                                # variable x year) of all stations
+       
+       outputFile_path   = 'EPA.mat'            # output .mat file (None: no .mat file,
+                                                # the data is only returned)
        
        Additional meta-data can be found in  aqs_monitors.csv file at
        https://aqs.epa.gov/aqsweb/airdata/download_files.html#Meta
@@ -46,25 +108,46 @@ INPUT columns in Meta_File.csv are:
         
 The OUTPUT DATA for a specified period is stored in a dictionarny and written in 
 a .mat file. The data is Wind Speed, Wind Direction, Variables, and dates in
-numeric format with reference 0000/01/01 00:00:00. In addition, other meta data
+numeric format with reference 0000/01/01 00:00:00 (one 'dates' array common to
+all variables: EPA_DATA.dates). The codes and POCs of the stations (Stations) 
+and the size and time of the used files (Sources), the fill value (FillValue)
+and the type of the arrays (DataType) are stored for the update of the output
+file (update = True). In addition, other meta data
 as station name, latitude, and longitude can be added in DATA_out dictionary.
 The variable array for each station is in a new row. 
 The first row is for the first station etc...
 
+The hourly data can be aggregated to daily, monthly, yearly or N-hour periods
+(mean, max, min, sum, count and the max of 8-hour rolling means, with the min.
+coverage rule) in EPA_DATA.AGG, and the EPA daily files (daily_*) can be read
+directly to EPA_DATA.DAILY (on the daily grid of local dates).
+
+The program can also be run from the command line, without editing it: the
+options of SET OPTIONS are the defaults, a JSON config file (--config) and
+the flags (one per option, e.g. --year_s 2020 --fname_prefixVars TEMP PM10
+--POCs "POC TEMP" "POC PM10" --outputFile_path out.mat) replace them:
+    python Sort_EPA_Files.py --help
+    python Sort_EPA_Files.py --config sort.json --workers 8
+Importing the file has no side effects (no console clear, no file read, no
+pandas/scipy import), so the extraction can be called many times from one
+process (e.g. a scheduler):
+    from Sort_EPA_Files import sort_EPA
+    DATA_out, report = sort_EPA({'year_s': 2020, 'outputFile_path': None})
+scipy.io is imported only to read or write the .mat file.
+
 Further development plans:
-    - make an option for the data at all time resolutions (now works for hourly data only)
     - at this moment, there is a minimum of 2 years (files) of data needed...
 -------------------------------------------------------------------------------
 Created on Wed Jan  3 09:51:35 2024
 @author: boris mifka (boris.mifka@phy.uniri.hr)
 """
-
 import os
-import pandas as pd
-import numpy as np
-from Sort_EPA_Functions import Extract_EPA_Wind
-from Sort_EPA_Functions import Extract_EPA_Variable
-import scipy
+import sys
+import json
+import time
+import traceback
+from   datetime import datetime
+from   Options_EPA_Functions import Merge_EPA_Options, Parse_EPA_Options
 
 
 #--this clears the console if IDE is used
@@ -75,7 +158,26 @@ def clear_console():
     # Check if the operating system is Unix/Linux/Mac
     elif os.name == 'posix':
         _ = os.system('clear')
-clear_console()
+
+
+#--this reads the output .mat file of the earlier run for the update
+def read_EPA_mat(mat_path, names):
+    import scipy.io
+    EPA  = scipy.io.loadmat(mat_path)['EPA_DATA'][0, 0]
+    data = {'dates'   : EPA['dates'],
+            'Stations': EPA['Stations'],
+            'Sources' : json.loads(str(EPA['Sources'][0]))}
+    #--fill value and type of the arrays (None in the outputs made before they
+    #  were stored)
+    data['FillValue'] = float(EPA['FillValue'].ravel()[0]) if 'FillValue' in EPA.dtype.names else None
+    data['DataType']  = str(EPA['DataType'][0]) if 'DataType' in EPA.dtype.names else None
+    #--arrays of the hourly structures (WIND, VAR_0, ...) by output name
+    for field in EPA.dtype.names:
+        if (field == 'WIND' or field.startswith('VAR_')) and EPA[field].dtype.names is not None:
+            for name in EPA[field][0, 0].dtype.names:
+                data[name] = EPA[field][0, 0][name]
+    return {k: v for k, v in data.items()
+            if k in names + ['dates', 'Stations', 'Sources', 'FillValue', 'DataType']}
 
 #******************************************************************************
 #                          SET OPTIONS: 
@@ -87,76 +189,283 @@ metaFile_dir      = ''
 metaFname         = 'Meta_File.csv'
 files_dir         = 'EPA_FILES/'         
 fname_prefixW     = 'WIND'               
-fname_prefixVars  = np.array(['TEMP','PM10'])
+fname_prefixVars  = ['TEMP','PM10']
 POCs              = ["POC TEMP","POC PM10"]
+duplicates        = 'first'
+cache_dir         = 'EPA_FILES/CACHE/'
+chunksize         = None
+workers           = 1
+prefetch          = 1
+artifact_dir      = None
+out_dtype         = 'float64'
+fill_value        = -999.9
+update            = False
+report_path       = 'EPA_report.json'
+profiler          = None
+profile_path      = 'EPA_profile'
+store_dir         = None
+arrow_path        = None
+parquet_dir       = None
+arrow_table       = False
+aggregate_period  = None
+aggregate_stats   = ['mean', 'max8h']
+aggregate_names   = None
+aggregate_wind    = True
+wind_components   = False
+min_coverage      = 0.75
+write_hourly      = True
+daily_prefixes    = []
+daily_POCs        = []
+daily_duration    = None
+min_completeness  = None
+completeness_by   = 'range'
+completeness_names= None
+completeness_path = None
 
 #--output
 outputFile_path   = 'EPA.mat' # set path including the name of output file
 
+#--the options above are the defaults of sort_EPA and of the command line
+#  (names of the config file and of the flags)
+EPA_SORT_OPTIONS = {'year_s': year_s, 'year_e': year_e, 'metaFile_dir': metaFile_dir,
+                    'metaFname': metaFname, 'files_dir': files_dir, 'fname_prefixW': fname_prefixW,
+                    'fname_prefixVars': fname_prefixVars, 'POCs': POCs, 'duplicates': duplicates,
+                    'cache_dir': cache_dir, 'chunksize': chunksize, 'workers': workers,
+                    'prefetch': prefetch, 'artifact_dir': artifact_dir, 'out_dtype': out_dtype,
+                    'fill_value': fill_value, 'update': update,
+                    'report_path': report_path, 'profiler': profiler, 'profile_path': profile_path,
+                    'store_dir': store_dir, 'arrow_path': arrow_path, 'parquet_dir': parquet_dir,
+                    'arrow_table': arrow_table, 'aggregate_period': aggregate_period,
+                    'aggregate_stats': aggregate_stats, 'aggregate_names': aggregate_names,
+                    'aggregate_wind': aggregate_wind, 'wind_components': wind_components,
+                    'min_coverage': min_coverage, 'write_hourly': write_hourly,
+                    'daily_prefixes': daily_prefixes, 'daily_POCs': daily_POCs,
+                    'daily_duration': daily_duration, 'min_completeness': min_completeness,
+                    'completeness_by': completeness_by, 'completeness_names': completeness_names,
+                    'completeness_path': completeness_path, 'outputFile_path': outputFile_path}
 
-#--read the Meta_File.csv file and get important parameters
-metaFile_path  = os.path.join(metaFile_dir,metaFname)
-METAin    = pd.read_csv(metaFile_path)
-
-#--arrays important for data search (leave in numpy): 
-MID_1     = METAin["State Code"].to_numpy()
-MID_2     = METAin["County Code"].to_numpy()
-MID_3     = METAin["Site Number"].to_numpy()
-MPOC_WS   = METAin["POC WS"].to_numpy()
-MPOC_WD   = METAin["POC WD"].to_numpy()
-
-#--additional arrays for Meta Data to store in otuput .mat file
-MsiteName = METAin["CBSA Name"]
-Mlat      = METAin["Latitude"].to_numpy()
-Mlon      = METAin["Longitude"].to_numpy()
-MUnitWS   = METAin["Unit WS"][0]           #only 1st row is needed
-MUnitWD   = METAin["Unit WD"][0]
-MUnitT    = METAin["Unit TEMP"][0]
-MUnitPM10 = METAin["Unit PM10"][0]
-#..............................................................................
-#......!!!USER CAN ADD MORE PARAMETERS HERE AND ADD THE CUSTOM VARIBLES IN 
-#DATA_out dictionary...........................................................
-#CUSTOM_MVAR = METAin["Var Name as in Meta_File.csv"] #example
-
-#--stack the station IDs
-ID_stat =  np.hstack((MID_1[:,None], MID_2[:,None], MID_3[:,None])) 
+#--names of the units in the output .mat file (Unit<name> for the other variables)
+EPA_UNIT_NAMES = {'WS': 'UnitWindSpeed', 'WD': 'UnitWindDirection', 'TEMP': 'UnitTemperature',
+                  'PM10': 'UnitPM10'}
 
 #******************************************************************************
 #                               PROGRAM
 #******************************************************************************
-#--set years range
-years   = np.arange(year_s, year_e + 1)
-
-try:
-    #--call the function to extract the wind data
-    WIND_out = Extract_EPA_Wind(years,ID_stat,files_dir,fname_prefixW,MPOC_WS,MPOC_WD)
-    print("Wind Data Extraction and Sort Done!")
+#--the processes (workers > 1) import this file, the program runs only in the
+#  functions (numpy, pandas and the extraction functions are imported there)
+def run_EPA_sort(options=None, report=None):
+    #--extract (or update) the data with the options (dictionary, the missing
+    #  options are the defaults of SET OPTIONS) and write the output files;
+    #  returns the output dictionary (EPA_DATA of the .mat file)
+    import numpy as np
+    import pandas as pd
+    from Sort_EPA_Functions import Extract_EPA_Parameters, Update_EPA_Parameters
+    from Sort_EPA_Functions import EPA_Source_Signatures, EPA_Station_POCs, Extract_EPA_Daily
+    from Report_EPA_Functions import EPA_Stage, EPA_Coverage, Write_EPA_Completeness
+    from Store_EPA_Functions import Write_EPA_Store
+    from Arrow_EPA_Functions import EPA_Arrow_Table, Write_EPA_Arrow, Write_EPA_Parquet
+    from Aggregate_EPA_Functions import Aggregate_EPA_Data, Aggregate_EPA_Wind, Wind_EPA_Components
     
-except Exception as e:
-    print("An error occurred while sorting Wind Data:", e)
-
-try:
-    #--combine dictionaries and variables into a single dictionary
-    DATA_out = {'WIND': WIND_out,'lat': Mlat,'lon': Mlon,'SiteName': MsiteName,
-                'UnitWindSpeed': MUnitWS, 'UnitWindDirection': MUnitWD,
-                'UnitTemperature': MUnitT,'UnitPM10': MUnitPM10}
-
-    #--call the function to extract the variable(s)
+    opt        = Merge_EPA_Options(EPA_SORT_OPTIONS, options)
+    report     = {} if report is None else report
+    out_dtype  = np.dtype(opt['out_dtype'])
+    fill_value = float(opt['fill_value'])
+    files_dir  = opt['files_dir']
+    outputFile_path = opt['outputFile_path']
+    
+    #--read the Meta_File.csv file and get important parameters
+    metaFile_path  = os.path.join(opt['metaFile_dir'], opt['metaFname'])
+    METAin    = pd.read_csv(metaFile_path)
+    
+    #--arrays important for data search (leave in numpy): 
+    MID_1     = METAin["State Code"].to_numpy()
+    MID_2     = METAin["County Code"].to_numpy()
+    MID_3     = METAin["Site Number"].to_numpy()
+    MPOC_WS   = METAin["POC WS"].to_numpy()
+    MPOC_WD   = METAin["POC WD"].to_numpy()
+    
+    #--additional arrays for Meta Data to store in otuput .mat file
+    MsiteName = METAin["CBSA Name"]
+    Mlat      = METAin["Latitude"].to_numpy()
+    Mlon      = METAin["Longitude"].to_numpy()
+    #..........................................................................
+    #......!!!USER CAN ADD MORE PARAMETERS HERE AND ADD THE CUSTOM VARIBLES IN 
+    #DATA_out dictionary.......................................................
+    #CUSTOM_MVAR = METAin["Var Name as in Meta_File.csv"] #example
+    
+    #--stack the station IDs
+    ID_stat =  np.hstack((MID_1[:,None], MID_2[:,None], MID_3[:,None])) 
+    
+    #--set years range
+    years   = np.arange(opt['year_s'], opt['year_e'] + 1)
+    
+    #--specs (output name, file prefix, Parameter Name filter, POCs): WS and WD
+    #  from the wind files and the variable(s), all on one hourly grid
+    fname_prefixVars = list(opt['fname_prefixVars'])
+    specs = [('WS', opt['fname_prefixW'], 'Wind Speed - Resultant', MPOC_WS),
+             ('WD', opt['fname_prefixW'], 'Wind Direction - Resultant', MPOC_WD)]
     for i in range(len(fname_prefixVars)):
-        MPOC_VAR  = METAin[POCs[i]]
-        VAR_out = Extract_EPA_Variable(years,ID_stat,files_dir,fname_prefixVars[i],MPOC_VAR)
-        
-        #--remove the redundant date arrays from VAR_out dictionary
-        #VAR_out.pop('dates', None)   #--comment for test
-        
-        # Add VAR_out to DATA_out
-        DATA_out['VAR_{}'.format(i)] = VAR_out
-        
-    print("Scalar Variable Data Extraction and Sort Done!")    
+        specs.append((fname_prefixVars[i], fname_prefixVars[i], None, METAin[opt['POCs'][i]]))
+    #--variables to aggregate (None: all but WD), checked before the extraction
+    names = [spec[0] for spec in specs]
+    aggregate_names = opt['aggregate_names']
+    aggregate_names = ([name for name in names if name != 'WD'] if aggregate_names is None else
+                       [aggregate_names] if isinstance(aggregate_names, str) else list(aggregate_names))
+    unknown = [name for name in aggregate_names if name not in names]
+    if opt['aggregate_period'] is not None and unknown:
+        raise ValueError(f"Unknown aggregate_names {unknown}, use some of the outputs {names}")
+    #--units from 'Unit <name>' (only 1st row is needed)
+    units = {spec[0]: METAin[f'Unit {spec[0]}'][0] for spec in specs
+             if f'Unit {spec[0]}' in METAin.columns}
+    
+    #--call the function to extract the wind data and variable(s) (all files 
+    #  and years run in parallel in 'workers' processes), or update the 
+    #  output of the earlier run; the stations without min_completeness are
+    #  dropped before the alignment
+    completeness = (opt['min_completeness'], opt['completeness_by'], opt['completeness_names'])
+    with EPA_Stage(report, 'extract'):
+        if opt['update'] and outputFile_path is not None and os.path.exists(outputFile_path):
+            report['mode'] = 'update'
+            EPA_old = read_EPA_mat(outputFile_path, [spec[0] for spec in specs])
+            EPA_out = Update_EPA_Parameters(EPA_old,years,ID_stat,files_dir,specs,opt['duplicates'],
+                                            opt['cache_dir'],opt['chunksize'],opt['workers'],
+                                            out_dtype,fill_value,report,opt['prefetch'],
+                                            *completeness,opt['artifact_dir'])
+        else:
+            report['mode'] = 'extract'
+            EPA_out = Extract_EPA_Parameters(years,ID_stat,files_dir,specs,opt['duplicates'],
+                                             opt['cache_dir'],opt['chunksize'],opt['workers'],
+                                             out_dtype,fill_value,report,opt['prefetch'],
+                                             *completeness,opt['artifact_dir'])
+    print("Wind and Scalar Variable Data Extraction and Sort Done!")
+    
+    #--completeness table of all stations, then keep only the complete stations
+    if opt['completeness_path'] is not None and 'completeness' in EPA_out:
+        Write_EPA_Completeness(opt['completeness_path'], EPA_out['completeness'], ID_stat, specs, years)
+        print(f"Completeness table has been written to {opt['completeness_path']}")
+    if 'kept' in EPA_out:
+        kept = EPA_out['kept']
+        print(f'{len(kept)} of {len(ID_stat)} stations have the min. completeness')
+        report['dropped'] = np.delete(ID_stat, kept, axis=0).tolist()
+        METAin    = METAin.iloc[kept].reset_index(drop=True)
+        ID_stat   = ID_stat[kept]
+        MsiteName = METAin["CBSA Name"]
+        Mlat      = METAin["Latitude"].to_numpy()
+        Mlon      = METAin["Longitude"].to_numpy()
+        specs     = [(name, prefix, parameter, np.asarray(POC)[kept])
+                     for name, prefix, parameter, POC in specs]
+    report['stations'] = ID_stat.tolist()
+    report['coverage'] = EPA_Coverage(EPA_out, [spec[0] for spec in specs], fill_value)
+    
+    #--combine dictionaries and variables into a single dictionary, the
+    #  dates are common for all variables
+    DATA_out = {'dates': EPA_out['dates'],
+                'WIND': {'WS': EPA_out['WS'], 'WD': EPA_out['WD']},
+                'lat': Mlat,'lon': Mlon,'SiteName': MsiteName,
+                'Stations': EPA_Station_POCs(ID_stat, specs),
+                'Sources' : json.dumps(EPA_Source_Signatures(files_dir, specs, years)),
+                'FillValue': fill_value, 'DataType': out_dtype.name}
+    for name, unit in units.items():
+        DATA_out[EPA_UNIT_NAMES.get(name, f'Unit{name}')] = unit
+    if 'completeness' in EPA_out:
+        rows = EPA_out.get('kept', slice(None))
+        DATA_out['Completeness'] = {name: ratio[rows] for name, ratio in EPA_out['completeness'].items()}
+        DATA_out['Completeness']['years'] = years
+    
+    for i in range(len(fname_prefixVars)):
+        DATA_out['VAR_{}'.format(i)] = {fname_prefixVars[i]: EPA_out[fname_prefixVars[i]]}
+    if opt['wind_components']:
+        DATA_out['WIND']['U'], DATA_out['WIND']['V'] = Wind_EPA_Components(EPA_out['WS'], EPA_out['WD'],
+                                                                           fill_value)
+    
+    #--daily, monthly, ... statistics of the hourly data (with the coverage rule)
+    aggregate_period = opt['aggregate_period']
+    if aggregate_period is not None:
+        with EPA_Stage(report, 'aggregate'):
+            DATA_out['AGG'] = Aggregate_EPA_Data(EPA_out, aggregate_names, aggregate_period,
+                                                 opt['aggregate_stats'], opt['min_coverage'], fill_value)
+            if opt['aggregate_wind']:
+                DATA_out['AGG'].update(Aggregate_EPA_Wind(EPA_out['WS'], EPA_out['WD'], EPA_out['dates'],
+                                                          aggregate_period, opt['min_coverage'], fill_value))
+            DATA_out['AGG']['period'] = str(aggregate_period)
+    if not opt['write_hourly']:
+        for key in ['dates', 'WIND'] + [f'VAR_{i}' for i in range(len(fname_prefixVars))]:
+            del DATA_out[key]
+    
+    #--the values of the EPA daily files on the daily grid
+    daily_prefixes = opt['daily_prefixes']
+    if len(daily_prefixes):
+        with EPA_Stage(report, 'extract_daily'):
+            specsDaily = [(daily_prefixes[i], daily_prefixes[i], opt['daily_duration'],
+                           METAin[opt['daily_POCs'][i]]) for i in range(len(daily_prefixes))]
+            DATA_out['DAILY'] = Extract_EPA_Daily(years,ID_stat,files_dir,specsDaily,opt['duplicates'],
+                                                  out_dtype,fill_value)
         
-    #--save the data to the .mat file
-    scipy.io.savemat(outputFile_path, {'EPA_DATA': DATA_out})
+    #--save the data to the .mat file (scipy is imported only here)
+    if outputFile_path is not None:
+        with EPA_Stage(report, 'write'):
+            import scipy.io
+            scipy.io.savemat(outputFile_path, {'EPA_DATA': DATA_out})
+    
+    #--the same data in the memory-mapped store
+    if opt['store_dir'] is not None:
+        with EPA_Stage(report, 'write_store'):
+            Write_EPA_Store(opt['store_dir'], EPA_out, [spec[0] for spec in specs], DATA_out['Stations'],
+                            Mlat, Mlon, MsiteName, units, fill_value)
+    
+    #--the same data in the long format (pyarrow is imported only here), the
+    #  table is added after the .mat file is written
+    arrowIn = (EPA_out, [spec[0] for spec in specs], DATA_out['Stations'], Mlat, Mlon, MsiteName,
+               units, fill_value)
+    if opt['arrow_path'] is not None:
+        with EPA_Stage(report, 'write_arrow'):
+            Write_EPA_Arrow(opt['arrow_path'], *arrowIn)
+    if opt['parquet_dir'] is not None:
+        with EPA_Stage(report, 'write_parquet'):
+            Write_EPA_Parquet(opt['parquet_dir'], *arrowIn)
+    if opt['arrow_table']:
+        DATA_out['ARROW'] = EPA_Arrow_Table(*arrowIn)
     print("Extraction and Sort Done!")
+    return DATA_out
+
+
+def sort_EPA(options=None):
+    #--run_EPA_sort with the run report (written to report_path also if the run
+    #  fails, the error is raised again) and the profiler of the options;
+    #  returns (DATA_out, report)
+    from Report_EPA_Functions import Summarize_EPA_Report, Write_EPA_Report, Profile_EPA_Run
+    
+    opt    = Merge_EPA_Options(EPA_SORT_OPTIONS, options)
+    report = {'started': datetime.now().isoformat(timespec='seconds'), 'status': 'ok',
+              'options': opt, 'stages': {}}
+    t0 = time.perf_counter()
+    try:
+        return Profile_EPA_Run(lambda: run_EPA_sort(opt, report), opt['profiler'],
+                               opt['profile_path']), report
+    except Exception as e:
+        report.update({'status': 'error', 'error': f'{type(e).__name__}: {e}',
+                       'traceback': traceback.format_exc()})
+        raise
+    finally:
+        #--write the run report (also for the failed run)
+        report['total'] = time.perf_counter() - t0
+        if opt['report_path'] is not None:
+            Write_EPA_Report(opt['report_path'], Summarize_EPA_Report(report))
+            print(f"Run report has been written to {opt['report_path']}")
+
+
+def main(argv=None):
+    #--command line: python Sort_EPA_Files.py [--config sort.json] [--<option> value ...]
+    options = Parse_EPA_Options(EPA_SORT_OPTIONS, argv, __doc__)
+    if sys.stdout.isatty():
+        clear_console()
+    try:
+        sort_EPA(options)
+    except Exception as e:
+        print("An error occurred while sorting Wind and scalar Variable data:", e)
+        return 1
+    return 0
+
 
-except Exception as e:
-    print("An error occurred while sorting scalar Variable data:", e)
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,245 +2,675 @@
 # -*- coding: utf-8 -*-
 """----------------------------------------------------------------------------
 Functions to sort input EPA files:
-    EXTRACT_EPA_Wind & EXTRACT_EPA_Variable
+    EXTRACT_EPA_Parameters (EXTRACT_EPA_Wind & EXTRACT_EPA_Variable)
     
 They are simmilar, except the function for wind extracts and sorts the Wind
 Speed and Wind direction data which are in the same file in same columns.
 Functions:
     - search for the rows with ID and POC of desired station and instrument within 
-    the yearly file
+    the yearly file: the file is partitioned once (one hash index keyed on 
+    State Code, County Code, Site Num, POC and for wind Parameter Name) and the
+    rows of every requested station are looked up in that index
     - extracts these rows for each station and stores the data in the one list
     per station
     - since the original data does not contain all dates and missing data code
     (e.g.) it creats all dates (hourly) within the the year_start - year_end 
     range and sets the -999.99 for the missing data  
+    - the output of each variable is one preallocated (stations x hours) array
+    of type out_dtype (float64 or float32, 8 or 4 bytes per station-hour) with
+    fill_value for the missing data (-999.9 as before, or np.nan)
+    - the samples are aligned to the hourly grid in one step: each timestamp is
+    converted to the integer hour offset from the range start and the values are
+    scattered into a preallocated array (Align_EPA_Hourly). If one hour occurs
+    more than once at a station, the 'duplicates' policy decides which value is
+    kept: 'first' (default, as before), 'last', 'mean' or 'error'
+    
+Reading of the yearly files is common for both functions and it is in
+Read_EPA_Functions.py (Read_EPA_File, Read_EPA_Cached if cache_dir is set or 
+Read_EPA_Stream if chunksize is set)
+
+Both functions are built on Extract_EPA_Parameters which extracts any list of
+specs (output name, file prefix, Parameter Name filter, POC of the stations) 
+on one common hourly grid ('dates'). The specs from the same file (e.g. WS and
+WD from WIND, or several gases) share one read of each yearly file. Each 
+(file prefix, year) file is one independent task (Extract_EPA_Year) and the 
+tasks of all years and files can run in a pool of 'workers' processes. The 
+results are merged per station (years in order) in the main process.
+
+Update_EPA_Parameters updates the output of an earlier run (e.g. with one more
+year or a new station in Meta_File.csv): only the new or changed yearly files 
+(and the files of the years next to them) are read, the new stations are 
+extracted for all years and the rest is copied from the old output.
+
+The completeness of every station (ratio of the hours with data of every
+output in every year) is counted in the partitioned rows, before the 
+alignment. With min_completeness the stations below it (per year or in the
+whole range) are dropped there, so the incomplete stations are not aligned,
+aggregated or written (see Write_EPA_Completeness for the table of all
+stations to choose them before the run).
+
+Extract_EPA_Daily extracts the values of the EPA daily files (daily_*) to one
+daily grid in the same way (see also Aggregate_EPA_Functions.py for the daily,
+monthly or 8-hour statistics of the hourly arrays).
+
+With workers=1 the files are read in a background thread (Prefetch_EPA_Reads):
+the next file is read and parsed (into a queue of 'prefetch' files, the thread
+waits while it is full) while the current one is partitioned, and the OS is
+asked to load the file after it from the disk in the meantime.
+
+With artifact_dir the output of every (file prefix, year) task is stored
+under the key of its inputs (content hash of the yearly file, station keys;
+Pipeline_EPA_Functions.py) and reused by the later runs with the same inputs,
+e.g. after a change of the aggregation or of the outputs: only the tasks of 
+the changed files or station sets are run again.
+
+With stats={} both functions record the time of every (file, year) task (read,
+timestamp decoding, station partitioning), the rows read and kept and the time
+of the grid alignment of every output (see Report_EPA_Functions.py).
 -------------------------------------------------------------------------------
 Created on Fri Jan  5 12:12:11 2024
 @author: boris mifka (boris.mifka@phy.uniri.hr)
 """
 
 import os
-import pandas as pd
+import time
+import threading
 import numpy as np
+from   queue    import Queue, Full
 from   datetime import datetime, timedelta
+from   concurrent.futures import ProcessPoolExecutor
+from   Read_EPA_Functions import Read_EPA_Rows, Read_EPA_Daily, EPA_File_Signature, EPA_KEY_COLUMNS
+from   Report_EPA_Functions import Peak_EPA_RSS
+from   Pipeline_EPA_Functions import EPA_Key, EPA_Content_Hash, Read_EPA_Artifact, Write_EPA_Artifact
 
 
-def Extract_EPA_Wind(years,ID_stat,files_dir,fname_prefix,POC_WS,POC_WD):
-    
-    #----initialize the outer loop numeric dates, WS and WD lists 
-    WSdate_outer = []
-    WDdate_outer = []
-    WS_outer     = []
-    WD_outer     = []
-    
-    #--get the number of years and stations
-    NoYears = len(years)
-    NoStats = ID_stat.shape[0]
-    
-    
-    #--begin loop over years
-    for k in range(NoYears):
-        #--combine path and prefix to create the complete file path
-        file_path = os.path.join(files_dir, f'{fname_prefix}_{years[k]}.csv')
-        #--read important columns
-        VARin     = pd.read_csv(file_path)
-        VAR       = VARin["Sample Measurement"]
-        VAR_POC   = VARin["POC"]
-        VAR_datep = VARin["Date GMT"]
-        VAR_timep = VARin["Time GMT"]
-        VAR_date  = VAR_datep.to_numpy()
-        VAR_time  = VAR_timep.to_numpy()
-        ID_1      = VARin["State Code"]
-        ID_2      = VARin["County Code"]
-        ID_3      = VARin["Site Num"]
-        ID_W      = VARin["Parameter Name"]
-        
-        #--initialize the inner loop numeric date and VAR list
-        innerDatelistWS = []
-        innerDatelistWD = []
-        innerWSlist     = []
-        innerWDlist     = []
-        
-        #--index the data for each station and instrument (POC)
-        for j in range(NoStats):
-            IndStatWS = np.where((ID_1 == ID_stat[j, 0]) & (ID_2 == ID_stat[j, 1]) & \
-                                 (ID_3 == ID_stat[j, 2]) & (VAR_POC == POC_WS[j]) & \
-                                 (ID_W == 'Wind Speed - Resultant'))[0]
-                
-            IndStatWD = np.where((ID_1 == ID_stat[j, 0]) & (ID_2 == ID_stat[j, 1]) & \
-                                 (ID_3 == ID_stat[j, 2]) & (VAR_POC == POC_WD[j]) & \
-                                 (ID_W == 'Wind Direction - Resultant'))[0]
-         
-            #--get WS and WD data at station, date and time, merge date and time
-            WS_statp    = VAR[IndStatWS]
-            WS_stat_tmp = WS_statp.to_numpy()
-            WD_statp    = VAR[IndStatWD] 
-            WD_stat_tmp = WD_statp.to_numpy()  
-            
-            #--get WS and WD data at station, date and time, merge date and time
-            date_strWSp = VAR_date[IndStatWS]+'T' + VAR_time[IndStatWS]+':00'
-            date_strWS  = np.array(date_strWSp, dtype='datetime64')
-            date_WStmpn = (date_strWS - np.datetime64('0000-01-01T00:00:00')).astype('timedelta64[h]').astype(float)/24+1
-            date_strWDp = VAR_date[IndStatWD]+'T' + VAR_time[IndStatWD]+':00'
-            date_strWD  = np.array(date_strWDp, dtype='datetime64')
-            date_WDtmpn = (date_strWD - np.datetime64('0000-01-01T00:00:00')).astype('timedelta64[h]').astype(float)/24+1
-            
-     
-            innerDatelistWS.append(date_WStmpn)
-            innerDatelistWD.append(date_WDtmpn)
-            innerWSlist.append(WS_stat_tmp)
-            innerWDlist.append(WD_stat_tmp)
-            
-        #--append the dates and VAR lists to outer lists
-        WSdate_outer.append(innerDatelistWS)
-        WDdate_outer.append(innerDatelistWD)
-        WS_outer.append(innerWSlist)
-        WD_outer.append(innerWDlist)
-            
+#--missing data code of the output arrays (default fill_value)
+EPA_MISSING = -999.9
+
+#--policies for the samples that fall in the same hour at the same station
+DUPLICATE_POLICIES = ('first', 'last', 'mean', 'error')
+
+
+def Align_EPA_Hourly(hours, values, out, duplicates='first'):
+    #--scatter the values to the preallocated hourly array 'out' (filled with
+    #  the missing data code) at the integer hour offsets; samples outside the
+    #  grid are ignored and the repeated hours are resolved with 'duplicates'
+    hours   = np.asarray(hours, dtype=np.int64)
+    values  = np.asarray(values, dtype=out.dtype)
+    inGrid  = (hours >= 0) & (hours < out.shape[-1])
+    hours   = hours[inGrid]
+    values  = values[inGrid]
+    
+    if duplicates == 'first':
+        hoursU, IndU = np.unique(hours, return_index=True)
+        out[hoursU]  = values[IndU]
+    elif duplicates == 'last':
+        hoursU, IndU = np.unique(hours[::-1], return_index=True)
+        out[hoursU]  = values[::-1][IndU]
+    elif duplicates == 'mean':
+        sums     = np.bincount(hours, weights=values, minlength=out.shape[-1])
+        counts   = np.bincount(hours, minlength=out.shape[-1])
+        IndH     = counts > 0
+        out[IndH] = sums[IndH] / counts[IndH]
+    elif duplicates == 'error':
+        if len(np.unique(hours)) != len(hours):
+            raise ValueError('Duplicate hours found in the station data')
+        out[hours] = values
+    else:
+        raise ValueError(f"Unknown duplicates policy '{duplicates}', "
+                         f"use one of {DUPLICATE_POLICIES}")
+    return out
+
+
+def Partition_EPA_Rows(VARin, keyCols):
+    #--single pass over the yearly file: row indices (in file order) of every
+    #  group of rows with the same values in keyCols, e.g. (state, county, 
+    #  site, POC[, parameter]); stations are then looked up with EPA_Station_Rows
+    return VARin.groupby(keyCols, sort=False, observed=True).indices
+
+
+def EPA_Station_Rows(groups, key):
+    #--rows of one station/instrument key, empty if it is not in the file
+    return groups.get(tuple(key), np.empty(0, dtype=np.intp))
+
+
+def EPA_Hourly_Dates(years):
     #--create the numeric date range with no gaps in hourly increments 
     #  and convert to numeric format
     start_date = datetime(years[0], 1, 1, 0, 0, 0)
     end_date   = datetime(years[-1], 12, 31, 23, 0, 0)
     date_range = np.arange(start_date, end_date + timedelta(hours=1),timedelta(hours=1))
     daten      = (date_range - np.datetime64('0000-01-01T00:00:00')).astype('timedelta64[h]').astype(float)/24+1
-    L          = len(daten)
-    
-
-    #--make the lists for Variables at stations
-    listsDateWSIn = [[] for _ in range(NoStats)]
-    listsDateWDIn = [[] for _ in range(NoStats)]
-    listsWSIn     = [[] for _ in range(NoStats)]
-    listsWDIn     = [[] for _ in range(NoStats)]
-    
-    for k in range(NoStats):
-        for j in range(NoYears):    
-            listsDateWSIn[k].extend(WSdate_outer[j][k])
-            listsDateWDIn[k].extend(WDdate_outer[j][k])
-            listsWSIn[k].extend(WS_outer[j][k])
-            listsWDIn[k].extend(WD_outer[j][k]) 
-    
-    
-    #--initialize the output list with full data_range at each station   
-    listsWSOut  = [[-999.9] * L for _ in range(NoStats)]
-    listsWDOut  = [[-999.9] * L for _ in range(NoStats)]
-    
-    #--and append the variable data, otherwise leave -999.9
-    for j in range(NoStats):
-          for i in range(L):
-             IndDateExistWS = np.where(listsDateWSIn[j]==daten[i])[0]
-             IndDateExistWD = np.where(listsDateWDIn[j]==daten[i])[0]
-             
-             
-             #--if the data exist for the current hour write, else replace with -999.9
-             if len(IndDateExistWS) != 0:
-                 listsWSOut[j][i] = listsWSIn[j][IndDateExistWS[0]]
-             else:
-                 listsWSOut[j][i] = -999.9
-                 
-             #--if the data exist for the current hour write, else replace with -999.9
-             if len(IndDateExistWD) != 0:
-                 listsWDOut[j][i] = listsWDIn[j][IndDateExistWD[0]]
-             else:
-                 listsWDOut[j][i] = -999.9
-             
-    # Create a dictionary to store the variables
-    data_dict = {
-        'dates': daten,  
-        'WS'   : listsWSOut,
-        'WD'   : listsWDOut
-    }
+    return start_date, daten
+
+
+def EPA_Daily_Dates(years):
+    #--numeric dates (as EPA_Hourly_Dates, at 00:00) of every day in the years
+    #  and the first day as integer days from 1970-01-01
+    start_day = np.datetime64(f'{years[0]}-01-01', 'D')
+    days      = np.arange(start_day, np.datetime64(f'{years[-1] + 1}-01-01', 'D'))
+    daten     = (days - np.datetime64('0000-01-01', 'D')).astype(float) + 1
+    return start_day.astype(np.int64), daten
+
+
+def EPA_Start_Hour(start_date):
+    #--integer hours from 1970-01-01 (as in 'Hour GMT') of the grid start
+    return np.datetime64(start_date, 'h').astype(np.int64)
+
+
+def EPA_Station_Keys(ID_stat, POC, parameter=None):
+    #--keys (State Code, County Code, Site Num, POC[, Parameter Name]) of the 
+    #  stations (rows of ID_stat) and their instruments
+    return [(*ID_stat[j, 0:3], POC[j]) + ((parameter,) if parameter else ())
+            for j in range(ID_stat.shape[0])]
+
+
+def Read_EPA_Year(file_path, keys, wind=False, cache_dir=None, chunksize=None,
+                  value_dtype=np.float64):
+    #--read part of the task (Extract_EPA_Year): the rows of the keys in the
+    #  yearly file and its timing (read time, decode time, rows read)
+    t0     = time.perf_counter()
+    timing = {}
+    VARin  = Read_EPA_Rows(file_path, [key[0:4] for key in keys], wind=wind, cache_dir=cache_dir,
+                           chunksize=chunksize, value_dtype=value_dtype, timing=timing)
+    timing['read'] = time.perf_counter() - t0
+    return VARin, timing
+
+
+def Split_EPA_Year(VARin, start_hour, keys, wind=False):
+    #--processing part of the task: the (hours from the grid start, values)
+    #  of every key in the rows of the yearly file
+    VAR       = VARin["Sample Measurement"].to_numpy()
+    VAR_hour  = VARin["Hour GMT"].to_numpy() - start_hour
+    
+    #--partition the rows by station, instrument (and parameter) in one pass,
+    #  the keys without parameter in a file with parameters need all its rows
+    groups    = Partition_EPA_Rows(VARin, EPA_KEY_COLUMNS + (["Parameter Name"] if wind else []))
+    if wind and any(len(key) == 4 for key in keys):
+        groups.update(Partition_EPA_Rows(VARin, EPA_KEY_COLUMNS))
+    
+    out = []
+    for key in keys:
+        IndStat = EPA_Station_Rows(groups, key)
+        out.append((VAR_hour[IndStat], VAR[IndStat]))
+    return out
+
+
+def Extract_EPA_Year(file_path, start_hour, keys, wind=False, cache_dir=None, chunksize=None,
+                     value_dtype=np.float64, stats=None, frame=None):
+    #--one task: read one yearly file and return the (hours from the grid start,
+    #  values) of every key (station/POC, or station/POC/Parameter Name if the
+    #  file is read with the Parameter Name column, wind=True); 'stats' (dict,
+    #  optional) gets the times of the read, decode and partition and the rows
+    #  read and kept. 'frame' is the output of Read_EPA_Year if the file has 
+    #  already been read (Prefetch_EPA_Reads)
+    if frame is None:
+        frame = Read_EPA_Year(file_path, keys, wind, cache_dir, chunksize, value_dtype)
+    VARin, timing = frame
+    t1  = time.perf_counter()
+    out = Split_EPA_Year(VARin, start_hour, keys, wind)
+    
+    if stats is not None:
+        t2 = time.perf_counter()
+        stats.update({'read'     : timing['read'] - timing.get('decode', 0),
+                      'decode'   : timing.get('decode', 0),
+                      'partition': t2 - t1,
+                      'time'     : timing['read'] + t2 - t1,
+                      'rows_read': timing.get('rows', len(VARin)),
+                      'rows_kept': sum(len(hours) for hours, _ in out)})
+    return out
+
+
+def Extract_EPA_Year_Stats(*task, frame=None):
+    #--Extract_EPA_Year with the stats of the task (and the peak RSS of the
+    #  process that ran it), returns (output, stats)
+    stats = {}
+    out   = Extract_EPA_Year(*task, stats=stats, frame=frame)
+    stats['rss_mb'] = Peak_EPA_RSS()
+    return out, stats
+
+
+def _EPA_Readahead(file_path):
+    #--ask the OS to load the file to the page cache in the background (only
+    #  where posix_fadvise exists, e.g. Linux; not for the cache folders)
+    if not hasattr(os, 'posix_fadvise') or not os.path.isfile(file_path):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def Prefetch_EPA_Reads(tasks, depth=1):
+    #--generator of (task name, Read_EPA_Year output) of the tasks (dict of 
+    #  Extract_EPA_Year arguments) in order: a background thread reads the next
+    #  files into a queue of 'depth' files while the caller processes the 
+    #  current one. The thread waits while the queue is full, so at most 
+    #  depth + 2 files are in memory; a read error is raised in the caller
+    queue = Queue(maxsize=depth)
+    stop  = threading.Event()
+    
+    def reader():
+        paths = [task[0] for task in tasks.values()]
+        for i, (name, task) in enumerate(tasks.items()):
+            #--the disk reads the file after this one while this one is parsed
+            if i + 1 < len(paths):
+                _EPA_Readahead(paths[i + 1])
+            try:
+                item = (name, Read_EPA_Year(task[0], *task[2:]), None)
+            except Exception as e:
+                item = (name, None, e)
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    break
+                except Full:
+                    pass
+            if stop.is_set() or item[2] is not None:
+                return
+    
+    threading.Thread(target=reader, name='EPA-prefetch', daemon=True).start()
+    try:
+        for _ in range(len(tasks)):
+            name, frame, error = queue.get()
+            if error is not None:
+                raise error
+            yield name, frame
+    finally:
+        #--the reader stops after its current file if the caller stops early
+        stop.set()
+
+
+def EPA_Jobs(ID_stat, specs):
+    #--group the specs by the file prefix: {prefix: [wind, {output name: station keys}]}
+    jobs = {}
+    for name, fname_prefix, parameter, POC in specs:
+        job = jobs.setdefault(fname_prefix, [False, {}])
+        job[0] = job[0] or parameter is not None
+        job[1][name] = EPA_Station_Keys(ID_stat, POC, parameter)
+    return jobs
+
+
+def EPA_File_Path(files_dir, fname_prefix, year):
+    #--yearly file made by get_EPA_files, e.g. EPA_FILES/WIND_2021.csv
+    return os.path.join(files_dir, f'{fname_prefix}_{year}.csv')
+
+
+def EPA_Task_Key(task, artifact_dir):
+    #--key of the artifact of a task (Extract_EPA_Year arguments): content of
+    #  the yearly file, station keys, wind and value type (not the grid start,
+    #  the artifact has the hours from 1970-01-01)
+    file_path, _, keys, wind, _, _, value_dtype = task
+    return EPA_Key('task', EPA_Content_Hash(file_path, artifact_dir), [list(key) for key in keys],
+                   bool(wind), np.dtype(value_dtype).name)
+
+
+def Run_EPA_Tasks(jobs, years, files_dir, start_hour, cache_dir=None, chunksize=None, workers=1,
+                  value_dtype=np.float64, stats=None, prefetch=1, artifact_dir=None):
+    #--run the (file prefix, year) tasks of the jobs, in this process or in the
+    #  pool of 'workers' processes; returns {(file prefix, year): task output}.
+    #  In this process the next 'prefetch' files are read in a background 
+    #  thread while the current one is partitioned (0: no prefetch). If 
+    #  'stats' (dict) is given, the stats of every task are appended to 
+    #  stats['tasks'] and the time spent waiting for the reads to stats['prefetch_wait'].
+    #  With artifact_dir the outputs of the tasks are stored under the key of
+    #  their inputs (EPA_Task_Key) and the tasks with an artifact are not run
+    tasks = {}
+    for fname_prefix, (wind, outputs) in jobs.items():
+        #--the keys of all outputs of a file in one list
+        keys = [key for keysOut in outputs.values() for key in keysOut]
+        for year in years:
+            tasks[fname_prefix, year] = (EPA_File_Path(files_dir, fname_prefix, year), start_hour,
+                                         keys, wind, cache_dir, chunksize, value_dtype)
+    
+    #--outputs of the tasks with an artifact
+    stored = {}
+    if artifact_dir is not None:
+        keys = {name: EPA_Task_Key(task, artifact_dir) for name, task in tasks.items()}
+        for name in list(tasks):
+            t0  = time.perf_counter()
+            out = Read_EPA_Artifact(artifact_dir, keys[name], start_hour)
+            if out is not None:
+                del tasks[name]
+                stored[name] = out if stats is None else (out, {
+                    'read': time.perf_counter() - t0, 'decode': 0, 'partition': 0,
+                    'time': time.perf_counter() - t0, 'rows_read': 0,
+                    'rows_kept': sum(len(hours) for hours, _ in out), 'rss_mb': Peak_EPA_RSS(),
+                    'artifact': True})
+    
+    extract = Extract_EPA_Year if stats is None else Extract_EPA_Year_Stats
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(extract, *task) for name, task in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+    elif prefetch and len(tasks) > 1:
+        results = {}
+        wait    = 0
+        t0      = time.perf_counter()
+        for name, frame in Prefetch_EPA_Reads(tasks, prefetch):
+            wait         += time.perf_counter() - t0
+            results[name] = extract(*tasks[name], frame=frame)
+            t0            = time.perf_counter()
+        if stats is not None:
+            stats['prefetch_wait'] = stats.get('prefetch_wait', 0) + wait
+    else:
+        results = {name: extract(*task) for name, task in tasks.items()}
+    
+    if artifact_dir is not None:
+        for name, result in results.items():
+            Write_EPA_Artifact(artifact_dir, keys[name], result if stats is None else result[0],
+                               start_hour)
+        results = {**stored, **results}
+    
+    if stats is not None:
+        for (fname_prefix, year), (out, task_stats) in results.items():
+            stats.setdefault('tasks', []).append({'file': fname_prefix, 'year': int(year),
+                                                  **task_stats})
+        results = {name: out for name, (out, _) in results.items()}
+    return results
+
+
+def Merge_EPA_Years(jobs, results, years, data_dict, duplicates='first', stats=None, rows=None):
+    #--merge the years (in order) of every station and align them to the arrays 
+    #  of data_dict (already filled with the missing data code); only the 
+    #  stations in 'rows' (positions, all if None) are aligned to the rows of
+    #  the arrays (in this order). The time of every output is added to 
+    #  stats['align'] (if given)
+    for fname_prefix, (wind, outputs) in jobs.items():
+        i0 = 0
+        for name, keysOut in outputs.items():
+            t0     = time.perf_counter()
+            VarOut = data_dict[name]
+            for r, j in enumerate(range(len(keysOut)) if rows is None else rows):
+                Align_EPA_Hourly(np.concatenate([results[fname_prefix, y][i0 + j][0] for y in years]),
+                                 np.concatenate([results[fname_prefix, y][i0 + j][1] for y in years]),
+                                 VarOut[r], duplicates)
+            i0 += len(keysOut)
+            if stats is not None:
+                align       = stats.setdefault('align', {})
+                align[name] = align.get(name, 0) + time.perf_counter() - t0
     return data_dict
+
+
+def EPA_Year_Hours(years):
+    #--number of hours of every year
+    return np.array([(np.datetime64(f'{y + 1}', 'h') - np.datetime64(f'{y}', 'h')).astype(int)
+                     for y in years])
+
+
+def EPA_Completeness(jobs, results, years, start_hour):
+    #--ratio of the hours with data of every station and output in every (GMT)
+    #  year, counted in the partitioned rows of the tasks (before the alignment,
+    #  the repeated hours are counted once); {output name: (stations x years)}.
+    #  The hours of year y are taken from the files of y-1, y and y+1 (local 
+    #  dates) as in the alignment, so the ratio is the one of the output arrays
+    completeness = {}
+    for fname_prefix, (wind, outputs) in jobs.items():
+        i0 = 0
+        for name, keysOut in outputs.items():
+            n     = len(keysOut)
+            ratio = np.zeros((n, len(years)))
+            for k, y in enumerate(years if n else []):
+                yh0   = EPA_Start_Hour(datetime(y, 1, 1)) - start_hour
+                yL    = EPA_Start_Hour(datetime(y + 1, 1, 1)) - start_hour - yh0
+                parts = [part for yy in years if abs(yy - y) <= 1
+                         for part in results[fname_prefix, yy][i0:i0 + n]]
+                hours = np.concatenate([part[0] for part in parts]) - yh0
+                valid = np.concatenate([~np.isnan(part[1]) for part in parts])
+                valid &= (hours >= 0) & (hours < yL)
+                #--one code per (station, hour) with data
+                station = np.repeat(np.tile(np.arange(n), len(parts)//n),
+                                    [len(part[0]) for part in parts])
+                codes   = np.unique(station[valid]*yL + hours[valid])
+                ratio[:, k] = np.bincount(codes // yL, minlength=n)/yL
+            completeness[name] = ratio
+            i0 += n
+    return completeness
+
+
+def EPA_Complete_Stations(completeness, years, min_completeness, by='range', names=None):
+    #--positions of the stations with at least min_completeness (ratio) of the
+    #  hours with data in every output of names (all outputs if None): in 
+    #  every year (by='year') or in the whole range of years (by='range')
+    if by not in ('year', 'range'):
+        raise ValueError(f"Unknown completeness_by '{by}', use 'year' or 'range'")
+    hours = EPA_Year_Hours(years)
+    keep  = np.ones(len(next(iter(completeness.values()))), dtype=bool)
+    for name in (completeness if names is None else names):
+        ratio = completeness[name]
+        keep &= (ratio.min(axis=1, initial=1) if by == 'year' else
+                 ratio @ hours/hours.sum()) >= min_completeness
+    return np.flatnonzero(keep)
+
+
+def Extract_EPA_Parameters(years,ID_stat,files_dir,specs,duplicates='first',cache_dir=None,
+                           chunksize=None,workers=1,out_dtype=np.float64,fill_value=EPA_MISSING,
+                           stats=None,prefetch=1,min_completeness=None,completeness_by='range',
+                           completeness_names=None,artifact_dir=None):
+    #--extract the parameters of all specs on one hourly grid; every spec is a 
+    #  tuple (output name, file prefix, Parameter Name filter or None, POC of 
+    #  the stations). The specs with the same file prefix share one read of 
+    #  each yearly file and the (file prefix, year) tasks run in 'workers' 
+    #  processes. Returns a dictionary with the common 'dates' and one 
+    #  (stations x hours) array of out_dtype per output name (missing data are
+    #  fill_value). The task and alignment times are added to 'stats' (if given).
+    #  With workers=1 the next 'prefetch' files are read in a background thread
+    #  during the partition of the current one (Prefetch_EPA_Reads).
+    #  The ratio of the hours with data of every station, output and year is
+    #  in 'completeness' ({name: stations x years}). With min_completeness 
+    #  only the stations with this completeness (EPA_Complete_Stations) are 
+    #  aligned: the arrays have only their rows and 'kept' has their positions.
+    #  With artifact_dir the task outputs are reused from the artifacts of
+    #  earlier runs (Run_EPA_Tasks)
     
+    #--the hourly grid (numeric dates) of the whole year range
+    start_date, daten = EPA_Hourly_Dates(years)
+    start_hour        = EPA_Start_Hour(start_date)
+    L                 = len(daten)
     
-def Extract_EPA_Variable(years,ID_stat,fname_dir,fname_prefix,POC):
-    
-    #--initialize the outer loop numeric date and VAR list 
-    date_outer = []
-    VAR_outer  = []
-
-    #--get the number of years and stations
-    NoYears = len(years)
-    NoStats = ID_stat.shape[0]
-
-    #--begin loop over years
-    for k in range(NoYears):
-        #--combine path and prefix to create the complete file path
-        file_path = os.path.join(fname_dir, f'{fname_prefix}_{years[k]}.csv')
-        #--read important columns
-        VARin     = pd.read_csv(file_path)
-        VAR       = VARin["Sample Measurement"]
-        VAR_POC   = VARin["POC"]
-        VAR_datep = VARin["Date GMT"]
-        VAR_timep = VARin["Time GMT"]
-        VAR_date  = VAR_datep.to_numpy()
-        VAR_time  = VAR_timep.to_numpy()
-        ID_1      = VARin["State Code"]
-        ID_2      = VARin["County Code"]
-        ID_3      = VARin["Site Num"]
-        
-        #--initialize the inner loop numeric date and VAR list
-        innerDatelist = []
-        innerVarlist  = []
-        #--index the data for each station and instrument (POC)
-        for j in range(NoStats):
-            IndStatVAR = np.where((ID_1 == ID_stat[j, 0]) & (ID_2 == ID_stat[j, 1]) & \
-                                  (ID_3 == ID_stat[j, 2]) & (VAR_POC == POC[j]))[0]
-            
-            #--get Variable data at station, date and time, merge date and time
-            VAR_statp    = VAR[IndStatVAR] 
-            VAR_stat_tmp = VAR_statp.to_numpy()   
-            date_strVARp = VAR_date[IndStatVAR]+'T' + VAR_time[IndStatVAR]+':00'
-            date_strVAR  = np.array(date_strVARp, dtype='datetime64')
-            date_tmpn    = (date_strVAR - np.datetime64('0000-01-01T00:00:00')).astype('timedelta64[h]').astype(float)/24+1
-            
-            innerDatelist.append(date_tmpn)
-            innerVarlist.append(VAR_stat_tmp)
-        
-            
-        #--append the dates and VAR lists to outer lists
-        date_outer.append(innerDatelist)
-        VAR_outer.append(innerVarlist)
+    #--read all (file prefix, year) files
+    jobs    = EPA_Jobs(ID_stat, specs)
+    results = Run_EPA_Tasks(jobs, years, files_dir, start_hour, cache_dir, chunksize, workers,
+                            out_dtype, stats, prefetch, artifact_dir)
     
-    #--create the numeric date range with no gaps in hourly increments 
-    #  and convert to numeric format
-    start_date = datetime(years[0], 1, 1, 0, 0, 0)
-    end_date   = datetime(years[-1], 12, 31, 23, 0, 0)
-    date_range = np.arange(start_date, end_date + timedelta(hours=1),timedelta(hours=1))
-    daten      = (date_range - np.datetime64('0000-01-01T00:00:00')).astype('timedelta64[h]').astype(float)/24+1
-    L          = len(daten)
+    #--completeness of the stations from the partitioned rows, the incomplete
+    #  stations are dropped before the alignment
+    data_dict = {'dates': daten, 'completeness': EPA_Completeness(jobs, results, years, start_hour)}
+    rows      = None
+    if min_completeness is not None:
+        rows = EPA_Complete_Stations(data_dict['completeness'], years, min_completeness,
+                                     completeness_by, completeness_names)
+        data_dict['kept'] = rows
+    
+    #--merge the years (in order) of every station and align to the hourly grid
+    for spec in specs:
+        data_dict[spec[0]] = np.full((ID_stat.shape[0] if rows is None else len(rows), L), fill_value,
+                                     dtype=out_dtype)
+    return Merge_EPA_Years(jobs, results, years, data_dict, duplicates, stats, rows)
+
+
+def EPA_Source_Signatures(files_dir, specs, years):
+    #--signatures (size, modification time) of all yearly files of the specs,
+    #  stored with the output to find the changed files in Update_EPA_Parameters
+    return {os.path.basename(EPA_File_Path(files_dir, fname_prefix, year)):
+            EPA_File_Signature(EPA_File_Path(files_dir, fname_prefix, year))
+            for fname_prefix in dict.fromkeys(spec[1] for spec in specs) for year in years}
+
+
+def EPA_Station_POCs(ID_stat, specs):
+    #--one row per station: State Code, County Code, Site Number and the POC of
+    #  every spec (the missing POC is -1), to match the stations of two runs
+    POCs = np.column_stack([np.asarray(spec[3], dtype=float) for spec in specs])
+    return np.nan_to_num(np.hstack((np.asarray(ID_stat, dtype=float), POCs)), nan=-1)
+
+
+def Update_EPA_Parameters(EPA_old,years,ID_stat,files_dir,specs,duplicates='first',
+                          cache_dir=None,chunksize=None,workers=1,out_dtype=np.float64,
+                          fill_value=EPA_MISSING,stats=None,prefetch=1,min_completeness=None,
+                          completeness_by='range',completeness_names=None,artifact_dir=None):
+    #--update the output of an earlier run (EPA_old: 'dates', the arrays of all 
+    #  specs, 'Stations' as EPA_Station_POCs and 'Sources' as 
+    #  EPA_Source_Signatures) to the years and stations of this run. Only 
+    #  the new or changed yearly files are read again: the hours of a year may
+    #  also get the data from the files of the previous and next year (GMT vs 
+    #  local date of the yearly files), so the years next to them are aligned 
+    #  again too (this needs their neighbours). The new stations are extracted
+    #  for all years, the stations that are not in ID_stat are dropped. With 
+    #  min_completeness the new stations without this completeness are dropped
+    #  too ('kept' has the positions of the output stations in ID_stat). The
+    #  missing hours of the old arrays ('FillValue' of EPA_old, -999.9 and nan
+    #  if it is None or not given) get fill_value and the values out_dtype; 
+    #  if out_dtype is more precise than the old arrays, all years are read again
+    names = [spec[0] for spec in specs]
+    lost  = [name for name in names + ['dates', 'Stations', 'Sources'] if name not in EPA_old]
+    if lost:
+        raise ValueError(f"The old output has no {lost}, run the full extraction")
     
+    #--the hourly grid of this run and the position of the old grid in it
+    start_date, daten = EPA_Hourly_Dates(years)
+    start_hour        = EPA_Start_Hour(start_date)
+    L                 = len(daten)
+    datesOld          = np.ravel(EPA_old['dates'])
+    shift             = int(round((datesOld[0] - daten[0])*24))
     
-    #--make the lists for Variables at stations
-    listsDateIn = [[] for _ in range(NoStats)]
-    listsVarIn  = [[] for _ in range(NoStats)]
+    #--stations of this run in the old output (-1 for the new stations)
+    StatOld = {tuple(row): i for i, row in enumerate(np.atleast_2d(EPA_old['Stations']))}
+    IndOld  = np.array([StatOld.get(tuple(row), -1) for row in EPA_Station_POCs(ID_stat, specs)],
+                       dtype=int)
+    IndKeep = np.flatnonzero(IndOld >= 0)
+    IndNew  = np.flatnonzero(IndOld < 0)
     
-    for k in range(NoStats):
-        for j in range(NoYears):    
-            listsDateIn[k].extend(date_outer[j][k])
-            listsVarIn[k].extend(VAR_outer[j][k]) 
+    #--copy the old data of the kept stations to the new grid (the old fill 
+    #  value is compared in the old dtype, then the values are cast)
+    data_dict = {'dates': daten}
+    h0, h1    = max(shift, 0), min(shift + len(datesOld), L)
+    fillOld   = EPA_old.get('FillValue')
+    fillOld   = EPA_MISSING if fillOld is None else fillOld
+    for name in names:
+        data_dict[name] = np.full((ID_stat.shape[0], L), fill_value, dtype=out_dtype)
+        if h1 > h0:
+            old  = np.atleast_2d(EPA_old[name])[IndOld[IndKeep], h0 - shift:h1 - shift]
+            miss = np.isnan(old)
+            if not np.isnan(fillOld):
+                miss |= old == np.asarray(fillOld, dtype=old.dtype)
+            old  = old.astype(out_dtype)
+            old[miss] = fill_value
+            data_dict[name][IndKeep, h0:h1] = old
     
+    #--years not (fully) in the old grid or with changed files, their 
+    #  neighbours are aligned again and need their neighbours' files
+    sources = EPA_Source_Signatures(files_dir, specs, years)
+    changed = set()
+    for y in years:
+        yh0 = EPA_Start_Hour(datetime(y, 1, 1)) - start_hour
+        yh1 = EPA_Start_Hour(datetime(y + 1, 1, 1)) - start_hour
+        if yh0 < h0 or yh1 > h1 or any(EPA_old['Sources'].get(f) != sources[f] for f in 
+                                       (os.path.basename(EPA_File_Path(files_dir, spec[1], y))
+                                        for spec in specs)):
+            changed.add(y)
+    #--the old values in a less precise type (e.g. float32 for float64) are not
+    #  the values of this run
+    if any(not np.can_cast(out_dtype, np.asarray(EPA_old[name]).dtype) for name in names):
+        changed |= set(years)
+    #--the years of the old grid that are not in this run change their neighbours
+    yearsOld = (np.datetime64('0000-01-01T00', 'h') + 
+                np.round((datesOld[[0, -1]] - 1)*24).astype('timedelta64[h]')).astype('datetime64[Y]')
+    changed |= set(range(yearsOld[0].astype(int) + 1970, yearsOld[1].astype(int) + 1971)) - set(years)
+    realign = sorted({y + d for y in changed for d in (-1, 0, 1)} & set(years))
+    reread  = sorted({y + d for y in realign for d in (-1, 0, 1)} & set(years))
     
-    #--initialize the output list with full data_range at each station   
-    listsVarOut  = [[-999.9] * L for _ in range(NoStats)]
+    #--read again the needed files for the kept stations and align the years
+    if len(IndKeep) and realign:
+        specsKeep = [(name, prefix, parameter, np.asarray(POC)[IndKeep])
+                     for name, prefix, parameter, POC in specs]
+        jobs    = EPA_Jobs(np.asarray(ID_stat)[IndKeep], specsKeep)
+        results = Run_EPA_Tasks(jobs, reread, files_dir, start_hour, cache_dir, chunksize, workers,
+                                out_dtype, stats, prefetch, artifact_dir)
+        for y in realign:
+            yh0 = EPA_Start_Hour(datetime(y, 1, 1)) - start_hour
+            yh1 = EPA_Start_Hour(datetime(y + 1, 1, 1)) - start_hour
+            part = {name: np.full((len(IndKeep), yh1 - yh0), fill_value, dtype=out_dtype)
+                    for name in names}
+            shifted = {k: [(hours - yh0, values) for hours, values in v] for k, v in results.items()}
+            Merge_EPA_Years(jobs, shifted, [yy for yy in reread if abs(yy - y) <= 1], part,
+                            duplicates, stats)
+            for name in names:
+                data_dict[name][IndKeep, yh0:yh1] = part[name]
     
-    #--and append the variable data, otherwise leave -999.9
-    for j in range(NoStats):
-          for i in range(L):
-             IndDateExist = np.where(listsDateIn[j]==daten[i])[0]
-             
-             #--if the data exist for the current hour write, else replace with -999.9
-             if len(IndDateExist) != 0:
-                 listsVarOut[j][i] = listsVarIn[j][IndDateExist[0]]
-             else:
-                 listsVarOut[j][i] = -999.9
- 
+    #--extract the new stations for all years
+    if len(IndNew):
+        specsNew = [(name, prefix, parameter, np.asarray(POC)[IndNew])
+                    for name, prefix, parameter, POC in specs]
+        new = Extract_EPA_Parameters(years,np.asarray(ID_stat)[IndNew],files_dir,specsNew,
+                                     duplicates,cache_dir,chunksize,workers,out_dtype,fill_value,
+                                     stats,prefetch,min_completeness,completeness_by,
+                                     completeness_names,artifact_dir)
+        if min_completeness is not None:
+            IndNew = IndNew[new['kept']]
+        for name in names:
+            data_dict[name][IndNew] = new[name]
+    if min_completeness is not None:
+        data_dict['kept'] = np.sort(np.concatenate((IndKeep, IndNew)))
+        for name in names:
+            data_dict[name] = data_dict[name][data_dict['kept']]
+    return data_dict
+
+
+def Extract_EPA_Daily(years,ID_stat,files_dir,specs,duplicates='first',out_dtype=np.float64,
+                      fill_value=EPA_MISSING,value_column='Arithmetic Mean'):
+    #--extract the daily values from the EPA daily files (e.g. daily_PM10_2021.csv)
+    #  to one daily grid ('dates', local dates); specs as in Extract_EPA_Parameters,
+    #  the filter is the 'Sample Duration' (e.g. '24 HOUR') or None. The days
+    #  with more rows (e.g. other Pollutant Standard) use the 'duplicates' policy
+    start_day, daten = EPA_Daily_Dates(years)
+    data_dict        = {'dates': daten}
+    for name, fname_prefix, duration, POC in specs:
+        keys  = EPA_Station_Keys(ID_stat, POC)
+        parts = [[] for _ in keys]
+        for year in years:
+            VARin = Read_EPA_Daily(EPA_File_Path(files_dir, fname_prefix, year), value_column, out_dtype)
+            if duration is not None:
+                VARin = VARin[VARin["Sample Duration"] == duration]
+            groups = Partition_EPA_Rows(VARin, EPA_KEY_COLUMNS)
+            VAR    = VARin["Sample Measurement"].to_numpy()
+            VAR_day = VARin["Day Local"].to_numpy() - start_day
+            for j, key in enumerate(keys):
+                IndStat = EPA_Station_Rows(groups, key)
+                parts[j].append((VAR_day[IndStat], VAR[IndStat]))
+        
+        data_dict[name] = np.full((ID_stat.shape[0], len(daten)), fill_value, dtype=out_dtype)
+        for j, part in enumerate(parts):
+            Align_EPA_Hourly(np.concatenate([p[0] for p in part]), np.concatenate([p[1] for p in part]),
+                             data_dict[name][j], duplicates)
+    return data_dict
 
-    # Create a dictionary to store the variables
-    data_dict = {
-        'dates'      : daten,  
-        fname_prefix : listsVarOut
-    }
+
+def Extract_EPA_Wind(years,ID_stat,files_dir,fname_prefix,POC_WS,POC_WD,duplicates='first',
+                     cache_dir=None,chunksize=None,workers=1,out_dtype=np.float64,
+                     fill_value=EPA_MISSING,components=False,prefetch=1):
+    
+    #--Wind Speed and Wind Direction are in the same file (one read per year)
+    specs = [('WS', fname_prefix, 'Wind Speed - Resultant', POC_WS),
+             ('WD', fname_prefix, 'Wind Direction - Resultant', POC_WD)]
+    data_dict = Extract_EPA_Parameters(years,ID_stat,files_dir,specs,duplicates,cache_dir,
+                                       chunksize,workers,out_dtype,fill_value,prefetch=prefetch)
     
+    #--u and v components of the wind for the vector averages (Aggregate_EPA_Wind)
+    if components:
+        from Aggregate_EPA_Functions import Wind_EPA_Components
+        data_dict['U'], data_dict['V'] = Wind_EPA_Components(data_dict['WS'], data_dict['WD'],
+                                                             fill_value)
     return data_dict
     
-
+    
+def Extract_EPA_Variable(years,ID_stat,fname_dir,fname_prefix,POC,duplicates='first',
+                         cache_dir=None,chunksize=None,workers=1,out_dtype=np.float64,
+                         fill_value=EPA_MISSING,prefetch=1):
+    
+    specs = [(fname_prefix, fname_prefix, None, POC)]
+    return Extract_EPA_Parameters(years,ID_stat,fname_dir,specs,duplicates,cache_dir,chunksize,
+                                  workers,out_dtype,fill_value,prefetch=prefetch)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Functions for the memory-mapped output store of Sort_EPA_Files.py:
+    Write_EPA_Store, Open_EPA_Store & Read_EPA_Series
+
+The store is a folder written next to the .mat file with the same data:
+    dates.npy      the common hourly time axis (numeric dates, as EPA_DATA.dates)
+    <name>.npy     one (stations x hours) array per variable (WS, WD, TEMP, ...)
+    manifest.json  variables (file, dtype, shape, unit, fill value), the time
+                   axis (first date, step) and the station metadata (codes and
+                   POCs, lat, lon, CBSA Name)
+The arrays are in row order, so the series of one station is one contiguous
+block of the file. Open_EPA_Store reads only the manifest and maps the arrays
+(np.load with mmap_mode='r', only the .npy header is read); Read_EPA_Series
+reads one station and/or one time window: the position of the station and of
+the dates is computed (no search in the time axis) and only these bytes are
+read from the disk, so the time and memory do not depend on the store size.
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+
+
+#--version of the store layout
+EPA_STORE_VERSION = 1
+
+
+def Write_EPA_Store(store_dir, data_dict, names, stations, lat, lon, site_names, units,
+                    fill_value):
+    #--write the variables 'names' of data_dict (output of Extract_EPA_Parameters)
+    #  and its 'dates' to store_dir; stations are the rows of EPA_Station_POCs,
+    #  units is {name: unit}
+    tmp_dir = os.path.normpath(store_dir) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    dates = np.ravel(data_dict['dates'])
+    np.save(os.path.join(tmp_dir, 'dates.npy'), dates)
+    manifest = {'version'   : EPA_STORE_VERSION,
+                'dates'     : {'file': 'dates.npy', 'first': float(dates[0]) if len(dates) else None,
+                               'step': 1/24, 'length': len(dates)},
+                'fill_value': None if np.isnan(fill_value) else float(fill_value),
+                'variables' : {},
+                'stations'  : [{'code'     : np.asarray(row).tolist(),
+                                'lat'      : float(la), 'lon': float(lo), 'name': str(nm)}
+                               for row, la, lo, nm in zip(stations, lat, lon, site_names)]}
+    for name in names:
+        arr = np.ascontiguousarray(data_dict[name])
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), arr)
+        manifest['variables'][name] = {'file': f'{name}.npy', 'dtype': arr.dtype.name,
+                                       'shape': list(arr.shape), 'unit': str(units.get(name, ''))}
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    #--replace the old store at the end
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    return manifest
+
+
+def Open_EPA_Store(store_dir):
+    #--manifest of the store with the arrays of the variables and dates mapped
+    #  (not read) in store['arrays']
+    with open(os.path.join(store_dir, 'manifest.json')) as f:
+        store = json.load(f)
+    if store.get('version') != EPA_STORE_VERSION:
+        raise ValueError(f"Store {store_dir} has version {store.get('version')}, "
+                         f"expected {EPA_STORE_VERSION}")
+    store['arrays'] = {name: np.load(os.path.join(store_dir, var['file']), mmap_mode='r')
+                       for name, var in store['variables'].items()}
+    store['arrays']['dates'] = np.load(os.path.join(store_dir, store['dates']['file']), mmap_mode='r')
+    
+    #--position of the first station with the codes (State, County, Site)
+    store['index'] = {}
+    for i, st in enumerate(store['stations']):
+        store['index'].setdefault(tuple(int(c) for c in st['code'][0:3]), i)
+    return store
+
+
+def EPA_Store_Station(store, station):
+    #--position of the station: index, or (State Code, County Code, Site Number)
+    #  of the first station with these codes
+    if np.ndim(station) == 0:
+        return int(station)
+    try:
+        return store['index'][tuple(int(c) for c in station)]
+    except KeyError:
+        raise KeyError(f'Station {tuple(station)} is not in the store') from None
+
+
+def EPA_Store_Hour(store, date):
+    #--position of the numeric date (as in 'dates') or datetime in the time axis
+    #  (it may be outside the axis)
+    if not isinstance(date, (int, float, np.number)):
+        date = (np.datetime64(date, 'h') - np.datetime64('0000-01-01T00', 'h')).astype(float)/24 + 1
+    return int(round((date - store['dates']['first'])*24))
+
+
+def Read_EPA_Series(store, name, station=None, start=None, end=None):
+    #--dates and values of the variable 'name' of one station (index or codes,
+    #  None for all stations) between start and end (numeric dates or datetime,
+    #  end included, None for the first or last hour); only this part of the
+    #  file is read. Returns (dates, values) as numpy arrays
+    L   = store['dates']['length']
+    h0  = 0 if start is None else min(max(EPA_Store_Hour(store, start), 0), L)
+    h1  = L if end is None else min(max(EPA_Store_Hour(store, end) + 1, h0), L)
+    arr = store['arrays'][name]
+    values = arr[:, h0:h1] if station is None else arr[EPA_Store_Station(store, station), h0:h1]
+    return np.array(store['arrays']['dates'][h0:h1]), np.array(values)
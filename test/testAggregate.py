@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Regression check of Aggregate_EPA_Functions.py: the missing hours (fill value
+-999.9 or nan) must not be counted as data (or averaged as wind components)
+also in the float32 arrays (float32(-999.9) is not -999.9 in float64).
+
+Run from the folder of the program files:
+    python test/testAggregate.py
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Aggregate_EPA_Functions import Aggregate_EPA_Periods, Rolling_EPA_Mean, Aggregate_EPA_Wind
+
+#--two days of one station: day 1 with 20 hours of data (value 10), day 2
+#  with 2 hours of data (below the 0.75 coverage)
+dates = np.arange(48)/24 + 738157.0
+for dtype in (np.float32, np.float64):
+    for fill in (-999.9, np.nan):
+        data = np.full((1, 48), fill, dtype=dtype)
+        data[0, 0:20]  = 10
+        data[0, 24:26] = 10
+        fillOut = np.asarray(fill, dtype=dtype)
+
+        _, count = Aggregate_EPA_Periods(data, dates, 'day', 'count', 0.75, fill)
+        assert count.tolist() == [[20, 2]], (dtype, fill, count)
+
+        _, mean = Aggregate_EPA_Periods(data, dates, 'day', 'mean', 0.75, fill)
+        assert mean[0, 0] == 10, (dtype, fill, mean)
+        assert np.array_equal(mean[0, 1], fillOut, equal_nan=True), (dtype, fill, mean)
+
+        #--8-hour means: 10 or missing, never a mean with the fill value
+        roll = Rolling_EPA_Mean(data, 8, 6, fill)
+        ok   = (roll == 10) | (roll == fillOut) | np.isnan(roll)
+        assert ok.all(), (dtype, fill, roll)
+        #--15 of the 8-hour means of day 1 have data (6 of 8 hours)
+        _, mda8 = Aggregate_EPA_Periods(data, dates, 'day', 'max8h', 0.5, fill)
+        assert mda8[0, 0] == 10, (dtype, fill, mda8)
+
+        #--wind of 5 knots from the east (90 degrees) in the hours with data:
+        #  the vector mean is the same wind, the fill values are not components
+        WS = np.where(np.isnan(data) | (data == fillOut), data, 5).astype(dtype)
+        WD = np.where(np.isnan(data) | (data == fillOut), data, 90).astype(dtype)
+        agg = Aggregate_EPA_Wind(WS, WD, dates, 'day', 0.75, fill)
+        assert agg['U_mean'].dtype == dtype, (dtype, agg['U_mean'].dtype)
+        assert np.isclose(agg['U_mean'][0, 0], -5) and np.isclose(agg['V_mean'][0, 0], 0, atol=1e-5)
+        assert np.isclose(agg['WS_resultant'][0, 0], 5) and np.isclose(agg['WD_resultant'][0, 0], 90)
+        for name in ('U_mean', 'V_mean', 'WS_resultant', 'WD_resultant'):
+            assert np.array_equal(agg[name][0, 1], fillOut, equal_nan=True), (dtype, fill, name, agg)
+
+print('Aggregate check OK')
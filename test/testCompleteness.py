@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""----------------------------------------------------------------------------
+Regression check of EPA_Completeness (Sort_EPA_Functions.py): the hours of a
+GMT year that are in the yearly file of the previous year (the files are by
+local date) must be counted in the completeness of the year, as they are in
+the output arrays; an hour in both files is counted once.
+
+Run from the folder of the program files:
+    python test/testCompleteness.py
+-------------------------------------------------------------------------------
+@author: boris mifka (boris.mifka@phy.uniri.hr)
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Sort_EPA_Functions import Extract_EPA_Parameters
+
+#--one station: 10 hours in 2021 and 100 hours in 2022, 2 of them
+#  (2022-01-01 00:00 and 01:00) in the file of 2021, 01:00 also in 2022
+def rows(start, n):
+    times = pd.date_range(start, periods=n, freq='h')
+    return pd.DataFrame({'State Code': 1, 'County Code': 2, 'Site Num': 3, 'POC': 1,
+                         'Parameter Name': 'PM10', 'Date GMT': times.strftime('%Y-%m-%d'),
+                         'Time GMT': times.strftime('%H:%M'), 'Sample Measurement': 20.0})
+
+with tempfile.TemporaryDirectory() as files_dir:
+    pd.concat([rows('2021-06-01', 10), rows('2022-01-01', 2)]).to_csv(
+        os.path.join(files_dir, 'PM10_2021.csv'), index=False)
+    rows('2022-01-01 01:00', 99).to_csv(os.path.join(files_dir, 'PM10_2022.csv'), index=False)
+
+    out = Extract_EPA_Parameters(np.array([2021, 2022]), np.array([[1, 2, 3]]), files_dir,
+                                 [('PM10', 'PM10', None, np.array([1]))], fill_value=np.nan)
+    ratio = out['completeness']['PM10'][0]
+    assert np.allclose(ratio, [10/8760, 100/8760]), ratio
+    #--the same ratio as the hours with data of the output in every year
+    valid = ~np.isnan(out['PM10'][0])
+    assert np.allclose(ratio, [valid[:8760].mean(), valid[8760:].mean()]), (ratio, valid.sum())
+
+print('Completeness check OK')
@@ -66,11 +66,11 @@ PM10t           = PM_10.SampleMeasurement;
 PM10t(ind23) = [];
 datePM10n(ind23)= [];
 
-%--get dates from Python
-dateWSPy   = EPA_DATA.WIND.dates';
-dateWDPy   = EPA_DATA.WIND.dates';
-dateTPy    = EPA_DATA.VAR_0.dates';
-datePMPy   = EPA_DATA.VAR_1.dates';
+%--get dates from Python (common for all variables)
+dateWSPy   = EPA_DATA.dates';
+dateWDPy   = EPA_DATA.dates';
+dateTPy    = EPA_DATA.dates';
+datePMPy   = EPA_DATA.dates';
 
 %--get data from Python
 WSPy      = EPA_DATA.WIND.WS(stat,:)';